@@ -2,15 +2,20 @@ from logging.config import fileConfig
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 from alembic import context
-from models.database.base import Base
 import os
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
+from models.database.base import Base
+from utils.config import config as app_config
+
 # This is the Alembic Config object
 config = context.config
 
+# Migrate the database the application uses; '%' is escaped for configparser
+config.set_main_option('sqlalchemy.url', app_config.DATABASE_URL.replace('%', '%%'))
+
 # Interpret the config file for Python logging
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
@@ -0,0 +1,39 @@
+"""Add job queue columns to processing_jobs
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    with op.batch_alter_table('processing_jobs') as batch_op:
+        batch_op.add_column(sa.Column('payload', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'))
+        batch_op.add_column(sa.Column('available_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('locked_by', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+
+    # Existing jobs are due now; a NULL available_at would never match a claim
+    jobs = sa.table('processing_jobs', sa.column('available_at', sa.DateTime), sa.column('created_at', sa.DateTime))
+    op.execute(
+        jobs.update()
+        .where(jobs.c.available_at.is_(None))
+        .values(available_at=sa.func.coalesce(jobs.c.created_at, sa.func.current_timestamp()))
+    )
+
+def downgrade() -> None:
+    with op.batch_alter_table('processing_jobs') as batch_op:
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('locked_by')
+        batch_op.drop_column('available_at')
+        batch_op.drop_column('max_attempts')
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('payload')
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""Add indexes for job and document queries
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index('ix_processing_jobs_status_created_at', 'processing_jobs', ['status', 'created_at'])
+    op.create_index('ix_processing_jobs_status_available_at', 'processing_jobs', ['status', 'available_at'])
+    op.create_index('ix_processing_jobs_status_lease_expires_at', 'processing_jobs', ['status', 'lease_expires_at'])
+    op.create_index('ix_processed_documents_job_id', 'processed_documents', ['job_id'])
+    op.create_index('ix_processed_documents_xero_reference', 'processed_documents', ['xero_reference'])
+    op.create_index('ix_processed_documents_type_created_at', 'processed_documents', ['document_type', 'created_at'])
+
+def downgrade() -> None:
+    op.drop_index('ix_processed_documents_type_created_at', table_name='processed_documents')
+    op.drop_index('ix_processed_documents_xero_reference', table_name='processed_documents')
+    op.drop_index('ix_processed_documents_job_id', table_name='processed_documents')
+    op.drop_index('ix_processing_jobs_status_lease_expires_at', table_name='processing_jobs')
+    op.drop_index('ix_processing_jobs_status_available_at', table_name='processing_jobs')
+    op.drop_index('ix_processing_jobs_status_created_at', table_name='processing_jobs')
@@ -0,0 +1,176 @@
+"""Add typed extracted-field columns to processed_documents and backfill them
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19
+"""
+import os
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+_BACKFILL_BATCH = 500
+
+EXTRACTED_COLUMNS = ('vendor', 'invoice_number', 'total_amount', 'currency',
+                     'invoice_date', 'due_date', 'confidence')
+
+_TYPES = {
+    'vendor': sa.String(255),
+    'invoice_number': sa.String(100),
+    'total_amount': sa.Numeric(14, 2),
+    'currency': sa.String(3),
+    'invoice_date': sa.Date(),
+    'due_date': sa.Date(),
+    'confidence': sa.Float(),
+}
+
+_INDEXES = (
+    ('ix_processed_documents_vendor_invoice_number', ['vendor', 'invoice_number']),
+    ('ix_processed_documents_vendor_invoice_date', ['vendor', 'invoice_date']),
+    ('ix_processed_documents_invoice_date', ['invoice_date']),
+    ('ix_processed_documents_total_amount', ['total_amount']),
+)
+
+# Frozen copy of models.database.extracted_fields as of this revision, so
+# the backfill does not change when the application code does
+
+_DATE_FORMATS = ('%Y-%m-%d', '%b %d, %Y', '%B %d, %Y', '%b %d %Y', '%B %d %Y', '%d/%m/%Y', '%d.%m.%Y')
+
+_CURRENCY_MARKERS = (('€', 'EUR'), ('£', 'GBP'), ('SAR', 'SAR'), ('AUD', 'AUD'), ('NZD', 'NZD'),
+                     ('USD', 'USD'), ('EUR', 'EUR'), ('GBP', 'GBP'))
+
+_MAX_AMOUNT = Decimal(10) ** 12
+
+def _normalize_number(text):
+    cleaned = ''.join(ch for ch in text if ch.isdigit() or ch in '.,-')
+    point = max(cleaned.rfind('.'), cleaned.rfind(','))
+    if point == -1 or len(cleaned) - point - 1 == 3:
+        return cleaned.replace('.', '').replace(',', '')
+    whole = cleaned[:point].replace('.', '').replace(',', '')
+    return f"{whole}.{cleaned[point + 1:]}"
+
+def _parse_amount(value):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        if isinstance(value, (int, float, Decimal)):
+            amount = Decimal(str(value))
+        else:
+            amount = Decimal(_normalize_number(str(value)))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or abs(amount) >= _MAX_AMOUNT:
+        return None
+    return amount.quantize(Decimal('0.01'))
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    text = str(value).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _currency(explicit, amount_text):
+    if explicit:
+        return str(explicit).upper()[:3]
+    text = str(amount_text or '')
+    for marker, code in _CURRENCY_MARKERS:
+        if marker in text:
+            return code
+    return os.getenv('DEFAULT_CURRENCY') if '$' in text else None
+
+def extract_fields(processed_content):
+    fields = dict.fromkeys(EXTRACTED_COLUMNS)
+    if not isinstance(processed_content, dict):
+        return fields
+
+    analysis = processed_content.get('analysis_results') or processed_content
+    invoice = analysis.get('invoice_data') or {}
+    patterns = analysis.get('patterns') or {}
+
+    vendor = invoice.get('vendor_name') or (analysis.get('vendor_info') or {}).get('name') or analysis.get('vendor')
+    fields['vendor'] = str(vendor).strip()[:255] if vendor else None
+
+    number = invoice.get('invoice_number') or (patterns.get('invoice_number') or [None])[0]
+    fields['invoice_number'] = str(number).strip()[:100] if number else None
+
+    total = invoice.get('total_amount')
+    if total is None:
+        total = (analysis.get('financial_data') or {}).get('highest_amount')
+    if total is None:
+        total = (analysis.get('amounts') or {}).get('total')
+    fields['total_amount'] = _parse_amount(total)
+    amount_text = total if isinstance(total, str) else (patterns.get('amount') or [None])[0]
+    fields['currency'] = _currency(invoice.get('currency') or analysis.get('currency'), amount_text)
+
+    fields['invoice_date'] = _parse_date(invoice.get('date'))
+    fields['due_date'] = _parse_date(invoice.get('due_date'))
+
+    confidence = (processed_content.get('ocr_results') or {}).get('confidence', analysis.get('confidence'))
+    fields['confidence'] = float(confidence) if isinstance(confidence, (int, float)) else None
+    return fields
+
+def upgrade() -> None:
+    with op.batch_alter_table('processed_documents') as batch_op:
+        for name in EXTRACTED_COLUMNS:
+            batch_op.add_column(sa.Column(name, _TYPES[name], nullable=True))
+
+    _backfill()
+
+    # Built after the backfill so the index is written once, not row by row
+    for name, columns in _INDEXES:
+        op.create_index(name, 'processed_documents', columns)
+
+def _backfill() -> None:
+    """Populate the new columns from processed_content in keyset-paged batches"""
+    documents = sa.table(
+        'processed_documents',
+        sa.column('id', sa.String),
+        sa.column('processed_content', sa.JSON),
+        *(sa.column(name, _TYPES[name]) for name in EXTRACTED_COLUMNS)
+    )
+    statement = (
+        documents.update()
+        .where(documents.c.id == sa.bindparam('document_id'))
+        .values({name: sa.bindparam(name) for name in EXTRACTED_COLUMNS})
+    )
+
+    bind = op.get_bind()
+    last_id = ''
+    while True:
+        rows = bind.execute(
+            sa.select(documents.c.id, documents.c.processed_content)
+            .where(documents.c.id > last_id)
+            .order_by(documents.c.id)
+            .limit(_BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        updates = [
+            {'document_id': document_id, **extract_fields(content)}
+            for document_id, content in rows if content
+        ]
+        if updates:
+            bind.execute(statement, updates)
+        last_id = rows[-1][0]
+
+def downgrade() -> None:
+    for name, _ in reversed(_INDEXES):
+        op.drop_index(name, table_name='processed_documents')
+    with op.batch_alter_table('processed_documents') as batch_op:
+        for name in reversed(EXTRACTED_COLUMNS):
+            batch_op.drop_column(name)
@@ -0,0 +1,109 @@
+from utils.compression import available_codecs, make_codec, train_dictionary
+from utils.config import config
+from datetime import datetime
+import argparse
+import json
+import os
+import random
+import time
+
+def synthetic_results(count):
+    """Processed-result JSON shaped like TextAnalyzer/OCR output"""
+    vendors = ['Acme Supplies Ltd', 'Northwind Traders', 'Globex Corporation', 'Initech Pty']
+    samples = []
+    for n in range(count):
+        words = [random.choice(['Invoice', 'Total', 'Amount', 'Due', 'GST', 'Qty', 'Item', 'Date'])
+                 for _ in range(200)]
+        samples.append(json.dumps({
+            'filename': f'invoice_{n}.pdf',
+            'ocr_results': {
+                'text': ' '.join(words),
+                'confidence': random.uniform(60, 95),
+                'details': {
+                    'conf': [random.randint(0, 96) for _ in range(200)],
+                    'text': words,
+                    'left': [random.randint(0, 2400) for _ in range(200)],
+                    'top': [random.randint(0, 3300) for _ in range(200)]
+                }
+            },
+            'analysis_results': {
+                'patterns': {'invoice_number': [f'INV-{n:05d}'], 'amount': [f'${random.uniform(10, 9999):.2f}']},
+                'vendor_info': {'name': random.choice(vendors), 'address': [], 'contact': []},
+                'metadata': {'processed_at': datetime.now().isoformat()}
+            }
+        }).encode())
+    return samples
+
+def stored_results(limit):
+    """Decoded processed results from the local store, if any"""
+    from utils.storage import Storage
+    storage = Storage()
+    samples = []
+    for entry in list(storage.index.entries('processed'))[-limit:]:
+        with open(os.path.join(storage.base_path, entry.path), 'rb') as f:
+            samples.append(storage.compressor.decode(f.read()))
+    return samples
+
+def measure(codec, samples, dictionary=None, rounds=3):
+    original = sum(len(sample) for sample in samples)
+    compressed = [codec.compress(sample, dictionary) for sample in samples]
+    stored = sum(len(data) for data in compressed)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for sample in samples:
+            codec.compress(sample, dictionary)
+    compress_seconds = (time.perf_counter() - started) / rounds
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for data in compressed:
+            codec.decompress(data, dictionary)
+    decompress_seconds = (time.perf_counter() - started) / rounds
+
+    megabytes = original / (1024 * 1024)
+    return {
+        'ratio': original / stored if stored else 0,
+        'stored_kb': stored / 1024,
+        'compress_mb_s': megabytes / compress_seconds if compress_seconds else 0,
+        'decompress_mb_s': megabytes / decompress_seconds if decompress_seconds else 0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare storage codecs on processed-result JSON')
+    parser.add_argument('--samples', type=int, default=300, help='Number of documents to compress')
+    parser.add_argument('--synthetic', action='store_true', help='Use generated results instead of the store')
+    parser.add_argument('--dictionary-size', type=int, default=config.STORAGE_DICTIONARY_SIZE)
+    args = parser.parse_args()
+
+    samples = [] if args.synthetic else stored_results(args.samples)
+    if len(samples) < 20:
+        if not args.synthetic:
+            print("Not enough stored results; using synthetic samples")
+        samples = synthetic_results(args.samples)
+
+    # Train on one half, measure on the other so dictionaries are not flattered
+    random.shuffle(samples)
+    training, testing = samples[:len(samples) // 2], samples[len(samples) // 2:]
+    total_kb = sum(len(sample) for sample in testing) / 1024
+
+    print(f"\nStorage codec benchmark: {len(testing)} documents, {total_kb:.0f} KB")
+    print("=" * 72)
+    print(f"{'codec':<20}{'ratio':>8}{'stored KB':>12}{'compress MB/s':>16}{'decompress MB/s':>16}")
+
+    for name in available_codecs():
+        levels = {'raw': [None], 'zlib': [1, 6, 9], 'zstd': [1, 3, 9, 19]}[name]
+        for level in levels:
+            codec = make_codec(name, level)
+            label = name if level is None else f"{name}-{level}"
+            variants = [(label, None)]
+            if name != 'raw':
+                dictionary = train_dictionary(name, training, args.dictionary_size)
+                variants.append((f"{label}+dict", dictionary))
+            for variant, dictionary in variants:
+                result = measure(codec, testing, dictionary)
+                print(f"{variant:<20}{result['ratio']:>8.2f}{result['stored_kb']:>12.0f}"
+                      f"{result['compress_mb_s']:>16.1f}{result['decompress_mb_s']:>16.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
 import imaplib
-import email
-from email.message import EmailMessage
-from typing import List, Dict, Any, Optional
-import os
-from datetime import datetime
+import tempfile
+from typing import List, Dict, Any
 from utils.config import config
+from .imap_engine import IMAPEngine, fetch_partial
+from .mime_stream import parse_message
 
 class EmailHandler:
     def __init__(self):
@@ -12,6 +11,7 @@ class EmailHandler:
         self.user = config.EMAIL_USER
         self.password = config.EMAIL_PASSWORD
         self.conn = None
+        self.engine = None
 
     def connect(self):
         """Establish connection to email server"""
@@ -22,6 +22,11 @@ class EmailHandler:
         except Exception as e:
             raise ConnectionError(f"Failed to connect to email server: {str(e)}")
 
+    def _get_engine(self) -> IMAPEngine:
+        if self.engine is None or self.engine.conn is not self.conn:
+            self.engine = IMAPEngine(self.conn)
+        return self.engine
+
     def disconnect(self):
         """Close connection to email server"""
         if self.conn:
@@ -30,54 +35,30 @@ class EmailHandler:
             except:
                 pass
 
-    def _extract_attachments(self, msg: EmailMessage) -> List[Dict[str, Any]]:
-        """Extract attachments from email message"""
-        attachments = []
-        
-        for part in msg.walk():
-            if part.get_content_maintype() == 'multipart':
-                continue
-            if part.get('Content-Disposition') is None:
-                continue
-
-            filename = part.get_filename()
-            if filename:
-                # Get file content
-                content = part.get_payload(decode=True)
-                attachments.append({
-                    'filename': filename,
-                    'content': content,
-                    'content_type': part.get_content_type()
-                })
-
-        return attachments
-
     def process_email(self, email_id: str) -> Dict[str, Any]:
-        """Process a single email and return standardized format"""
-        try:
-            _, msg_data = self.conn.fetch(email_id, '(RFC822)')
-            email_body = msg_data[0][1]
-            msg = email.message_from_bytes(email_body)
+        """Process a single email and return standardized format.
 
-            # Extract text content
-            text_content = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    if part.get_content_type() == "text/plain":
-                        text_content += part.get_payload(decode=True).decode()
-            else:
-                text_content = msg.get_payload(decode=True).decode()
-
-            # Extract attachments
-            attachments = self._extract_attachments(msg)
+        Attachments are returned as ``AttachmentHandle`` objects backed by
+        spooled temp files; callers should close them when done.
+        """
+        try:
+            # Fetched in IMAP_FETCH_BUFFER_SIZE pieces into a spooled file, so a
+            # large message is never held in memory whole
+            with tempfile.SpooledTemporaryFile(max_size=config.MIME_SPOOL_MAX_SIZE) as raw:
+                for chunk in fetch_partial(lambda items: self._fetch(email_id, items), '',
+                                           config.IMAP_FETCH_BUFFER_SIZE, peek=False):
+                    raw.write(chunk)
+                raw.seek(0)
+                parsed = parse_message(raw)
+            msg = parsed.headers
 
             return {
                 'source': 'email',
                 'subject': msg['subject'],
-                'text': text_content,
+                'text': parsed.text,
                 'sender': msg['from'],
                 'timestamp': msg['date'],
-                'attachments': attachments,
+                'attachments': parsed.attachments,
                 'metadata': {
                     'to': msg['to'],
                     'cc': msg.get('cc', ''),
@@ -88,6 +69,12 @@ class EmailHandler:
         except Exception as e:
             raise RuntimeError(f"Failed to process email {email_id}: {str(e)}")
 
+    def _fetch(self, email_id: str, items: str):
+        typ, data = self.conn.fetch(email_id, items)
+        if typ != 'OK':
+            raise RuntimeError(f"FETCH failed: {data}")
+        return data
+
     def get_unread_messages(self) -> List[Dict[str, Any]]:
         """Retrieve and process all unread messages"""
         messages = []
@@ -104,6 +91,21 @@ class EmailHandler:
         
         except Exception as e:
             raise RuntimeError(f"Failed to retrieve unread messages: {str(e)}")
+
+    def get_new_messages(self) -> List[Dict[str, Any]]:
+        """Retrieve messages received since the last call, fetching only needed parts"""
+        try:
+            engine = self._get_engine()
+            messages = engine.fetch_new()
+            engine.commit(messages)
+            return messages
+
+        except Exception as e:
+            raise RuntimeError(f"Failed to retrieve new messages: {str(e)}")
+
+    def watch(self, handler, should_stop=lambda: False):
+        """Process new messages as they arrive, using IMAP IDLE between syncs"""
+        self._get_engine().run(handler, should_stop)
         
     def __enter__(self):
         self.connect()
@@ -0,0 +1,470 @@
+import base64
+import email
+import email.policy
+import itertools
+import json
+import os
+import quopri
+import re
+import select
+import time
+from dataclasses import dataclass, field
+from email.header import decode_header, make_header
+from email.utils import collapse_rfc2231_value, decode_rfc2231
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from utils.config import config
+from .mime_stream import spool_chunks, spool_part
+
+HEADER_FIELDS = 'SUBJECT FROM TO CC DATE MESSAGE-ID'
+
+_TOKEN = re.compile(
+    rb'\s*(?:'
+    rb'(\()|(\))'                                   # list delimiters
+    rb'|"((?:[^"\\]|\\.)*)"'                        # quoted string
+    rb'|\{(\d+)\}'                                  # literal marker
+    rb'|([^\s()"{\[]+(?:\[[^\]]*\](?:<\d+>)?)?)'    # atom, incl. BODY[...]<n>
+    rb')'
+)
+
+def parse_response(text: bytes, literals: Optional[List[bytes]] = None) -> List[Any]:
+    """Parse an IMAP response into nested lists.
+
+    Atoms and quoted strings become ``str``, ``NIL`` becomes ``None`` and
+    literals (passed separately, in order, as imaplib returns them) stay
+    ``bytes``.
+    """
+    literals = list(literals or [])
+    stack = [[]]
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            break
+        pos = match.end()
+        open_list, close_list, quoted, literal, atom = match.groups()
+
+        if open_list:
+            stack.append([])
+        elif close_list:
+            if len(stack) > 1:
+                item = stack.pop()
+                stack[-1].append(item)
+        elif quoted is not None:
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', quoted).decode('utf-8', 'replace'))
+        elif literal is not None:
+            stack[-1].append(literals.pop(0) if literals else b'')
+        elif atom is not None:
+            value = atom.decode('utf-8', 'replace')
+            stack[-1].append(None if value.upper() == 'NIL' else value)
+
+    while len(stack) > 1:
+        item = stack.pop()
+        stack[-1].append(item)
+    return stack[0]
+
+def _flatten_fetch(data: List[Any]) -> Tuple[bytes, List[bytes]]:
+    """Join imaplib FETCH data (bytes and (prefix, literal) tuples) into text + literals"""
+    text = b''
+    literals = []
+    for item in data:
+        if isinstance(item, tuple):
+            text += item[0] + b' '
+            literals.append(item[1])
+        elif item:
+            text += item + b' '
+    return text, literals
+
+def fetch_partial(fetch: Callable[[str], List[Any]], section: str, chunk_size: int,
+                  peek: bool = True) -> Iterator[bytes]:
+    """Yield a body section in pieces of at most ``chunk_size`` bytes.
+
+    Uses partial FETCHes (``BODY[section]<offset.length>``), so a large part
+    never arrives as one literal. ``fetch(items)`` sends a FETCH for the one
+    message and returns imaplib's data; ``section`` '' is the whole message.
+    """
+    item = 'BODY.PEEK' if peek else 'BODY'
+    offset = 0
+    while True:
+        text, literals = _flatten_fetch(fetch(f"({item}[{section}]<{offset}.{chunk_size}>)"))
+        key = f"BODY[{section}]<{offset}>"
+        chunk = b''
+        for value in parse_response(text, literals):
+            if isinstance(value, list):
+                chunk = dict(zip(value[::2], value[1::2])).get(key) or chunk
+        if chunk:
+            yield chunk
+        # A short (or NIL) reply means the end of the section
+        if len(chunk) < chunk_size:
+            return
+        offset += len(chunk)
+
+def _pairs(values) -> Dict[str, str]:
+    """Turn an IMAP parameter list ("NAME" "value" ...) into a dict"""
+    if not isinstance(values, list):
+        return {}
+    return {
+        str(key).lower(): value
+        for key, value in zip(values[::2], values[1::2])
+        if isinstance(key, str) and isinstance(value, str)
+    }
+
+def _decode_filename(params: Dict[str, str]) -> Optional[str]:
+    if 'filename*' in params:
+        return collapse_rfc2231_value(decode_rfc2231(params['filename*']))
+    if 'name*' in params:
+        return collapse_rfc2231_value(decode_rfc2231(params['name*']))
+
+    value = params.get('filename') or params.get('name')
+    if value:
+        try:
+            return str(make_header(decode_header(value)))
+        except Exception:
+            return value
+    return None
+
+@dataclass
+class BodyPart:
+    """A leaf MIME part described by BODYSTRUCTURE"""
+    section: str
+    content_type: str
+    encoding: str
+    size: int
+    filename: Optional[str] = None
+    disposition: Optional[str] = None
+    params: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_attachment(self) -> bool:
+        return bool(self.filename) or self.disposition == 'attachment'
+
+def parse_bodystructure(structure: List[Any], prefix: str = '') -> List[BodyPart]:
+    """Flatten a parsed BODYSTRUCTURE into its leaf parts with section numbers"""
+    if structure and isinstance(structure[0], list):
+        # Multipart: child bodies first, then the subtype and extension data
+        parts = []
+        for index, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            section = f"{prefix}.{index + 1}" if prefix else str(index + 1)
+            parts.extend(parse_bodystructure(child, section))
+        return parts
+
+    main_type = (structure[0] or '').lower()
+    sub_type = (structure[1] or '').lower()
+    params = _pairs(structure[2])
+    encoding = (structure[5] or '7bit').lower()
+    size = int(structure[6] or 0)
+
+    # Extension data follows type-specific fields: lines for text,
+    # envelope/body/lines for message/rfc822
+    extension = 7
+    if main_type == 'text':
+        extension = 8
+    elif (main_type, sub_type) == ('message', 'rfc822'):
+        extension = 10
+
+    disposition, disposition_params = None, {}
+    if len(structure) > extension + 1 and isinstance(structure[extension + 1], list):
+        disposition = (structure[extension + 1][0] or '').lower()
+        disposition_params = _pairs(structure[extension + 1][1] if len(structure[extension + 1]) > 1 else None)
+
+    return [BodyPart(
+        section=prefix or '1',
+        content_type=f"{main_type}/{sub_type}",
+        encoding=encoding,
+        size=size,
+        filename=_decode_filename({**params, **disposition_params}),
+        disposition=disposition,
+        params=params
+    )]
+
+def decode_part(content: bytes, encoding: str) -> bytes:
+    """Undo a part's Content-Transfer-Encoding"""
+    if encoding == 'base64':
+        return base64.b64decode(content)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(content)
+    return content
+
+def _decode_text(raw: bytes, charset: str) -> str:
+    try:
+        return raw.decode(charset, 'replace')
+    except LookupError:
+        # Unknown or misspelt charset label
+        return raw.decode('utf-8', 'replace')
+
+def wants_document(part: BodyPart) -> bool:
+    """Default attachment filter: named parts that could be an invoice"""
+    return part.is_attachment and (
+        part.content_type in ('application/pdf', 'application/octet-stream')
+        or part.content_type.startswith('image/')
+    )
+
+class IMAPEngine:
+    """Incremental IMAP sync on an authenticated ``imaplib`` connection.
+
+    Tracks UIDVALIDITY and the last seen UID per mailbox so each sync only
+    asks for new messages; fetches BODYSTRUCTURE first and then downloads
+    just the parts it needs, several messages per FETCH up to
+    ``fetch_buffer`` bytes (a larger attachment is fetched in
+    ``fetch_buffer`` pieces instead); and waits for new mail with IDLE
+    where supported. Attachments are returned as ``AttachmentHandle``
+    objects.
+    """
+
+    def __init__(self, conn, mailbox: str = 'INBOX', state_file: Optional[str] = None,
+                 part_filter: Callable[[BodyPart], bool] = wants_document,
+                 batch_size: int = 50, fetch_buffer: Optional[int] = None):
+        self.conn = conn
+        self.mailbox = mailbox
+        self.part_filter = part_filter
+        self.batch_size = batch_size
+        self.fetch_buffer = fetch_buffer or config.IMAP_FETCH_BUFFER_SIZE
+        if not state_file:
+            account = re.sub(r'[^\w.-]', '_', f"{config.EMAIL_USER}_{mailbox}")
+            state_file = os.path.join(config.STATE_PATH, f"imap_{account}.json")
+        self.state_file = state_file
+        self.uidvalidity = None
+        self.last_uid = 0
+        # IDLE goes out through send() with a tag of our own; imaplib's tags
+        # only use the letters A-P, so a Z prefix never collides with them
+        self._idle_tags = itertools.count(1)
+
+    # -- sync state ---------------------------------------------------------
+
+    def _load_state(self) -> Dict[str, Any]:
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({'uidvalidity': self.uidvalidity, 'last_uid': self.last_uid}, f)
+        os.replace(temp_file, self.state_file)
+
+    def select(self):
+        """Select the mailbox and restore the sync cursor if UIDVALIDITY still matches"""
+        typ, _ = self.conn.select(self.mailbox)
+        if typ != 'OK':
+            raise RuntimeError(f"Failed to select {self.mailbox}")
+
+        _, data = self.conn.response('UIDVALIDITY')
+        uidvalidity = int(data[0]) if data and data[0] else None
+
+        state = self._load_state()
+        if uidvalidity is not None and state.get('uidvalidity') == uidvalidity:
+            self.last_uid = state.get('last_uid', 0)
+        else:
+            # New mailbox or UIDs were renumbered: start again from unseen mail
+            self.last_uid = 0
+        self.uidvalidity = uidvalidity
+
+    # -- fetching -----------------------------------------------------------
+
+    def _search_new(self) -> List[int]:
+        if self.last_uid:
+            typ, data = self.conn.uid('SEARCH', None, f"UID {self.last_uid + 1}:*")
+        else:
+            typ, data = self.conn.uid('SEARCH', None, 'UNSEEN')
+        if typ != 'OK':
+            raise RuntimeError("UID SEARCH failed")
+        # "n:*" always matches the highest UID, even when it is not new
+        return sorted(uid for uid in map(int, (data[0] or b'').split()) if uid > self.last_uid)
+
+    def _fetch(self, uid_set: str, items: str) -> List[Any]:
+        typ, data = self.conn.uid('FETCH', uid_set, items)
+        if typ != 'OK':
+            raise RuntimeError(f"UID FETCH failed: {data}")
+        return data
+
+    def _parse_fetch(self, data: List[Any]) -> Dict[int, Dict[str, Any]]:
+        """Group FETCH response items by UID"""
+        text, literals = _flatten_fetch(data)
+        values = parse_response(text, literals)
+
+        results = {}
+        for value in values:
+            if not isinstance(value, list):
+                continue
+            items = dict(zip(value[::2], value[1::2]))
+            if 'UID' not in items:
+                continue
+            uid = int(items.pop('UID'))
+            results.setdefault(uid, {}).update(items)
+        return results
+
+    def fetch_new(self) -> List[Dict[str, Any]]:
+        """Fetch messages that arrived since the last sync"""
+        if self.uidvalidity is None:
+            self.select()
+
+        messages = []
+        uids = self._search_new()
+        for start in range(0, len(uids), self.batch_size):
+            messages.extend(self._fetch_batch(uids[start:start + self.batch_size]))
+        return messages
+
+    def _body_commands(self, plans: Dict[int, Tuple[Optional[BodyPart], List[BodyPart]]]):
+        """Yield (uids, FETCH items) for the needed sections.
+
+        Messages with the same section layout share a command, split so a
+        reply carries at most ``fetch_buffer`` bytes of parts (or one
+        message, if that alone is larger).
+        """
+        groups = {}
+        for uid, (text_part, wanted) in plans.items():
+            parts = ([text_part] if text_part else []) + wanted
+            if parts:
+                sections = tuple(part.section for part in parts)
+                groups.setdefault(sections, []).append((uid, sum(part.size for part in parts)))
+
+        for sections, members in groups.items():
+            items = '(UID ' + ' '.join(f"BODY.PEEK[{section}]" for section in sections) + ')'
+            chunk, size = [], 0
+            for uid, message_size in members:
+                if chunk and size + message_size > self.fetch_buffer:
+                    yield chunk, items
+                    chunk, size = [], 0
+                chunk.append(uid)
+                size += message_size
+            if chunk:
+                yield chunk, items
+
+    def _fetch_batch(self, uids: List[int]) -> List[Dict[str, Any]]:
+        uid_set = ','.join(map(str, uids))
+
+        # Round trip 1: structure and headers only, no bodies
+        overview = self._parse_fetch(self._fetch(
+            uid_set, f"(UID BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])"
+        ))
+
+        plans, large, order = {}, {}, {}
+        for uid in uids:
+            info = overview.get(uid, {})
+            parts = parse_bodystructure(info.get('BODYSTRUCTURE') or [])
+            text_part = next(
+                (part for part in parts if part.content_type == 'text/plain' and not part.is_attachment),
+                None
+            )
+            wanted = [part for part in parts if self.part_filter(part)]
+            order[uid] = [part.section for part in wanted]
+            # Parts above the buffer are streamed in partial fetches of their own
+            large[uid] = [part for part in wanted if part.size > self.fetch_buffer]
+            plans[uid] = (text_part, [part for part in wanted if part.size <= self.fetch_buffer])
+
+        # Then only the needed sections; each reply is spooled and dropped
+        # before the next FETCH, so at most one reply is held in memory
+        texts, spooled = {}, {uid: {} for uid in uids}
+        for group, items in self._body_commands(plans):
+            bodies = self._parse_fetch(self._fetch(','.join(map(str, group)), items))
+            for uid in group:
+                content = bodies.pop(uid, {})
+                text_part, wanted = plans[uid]
+                if text_part:
+                    raw = content.get(f"BODY[{text_part.section}]") or b''
+                    texts[uid] = _decode_text(decode_part(raw, text_part.encoding),
+                                              text_part.params.get('charset', 'utf-8'))
+                for part in wanted:
+                    raw = content.pop(f"BODY[{part.section}]", None)
+                    if raw is not None:
+                        spooled[uid][part.section] = spool_part(raw, part.encoding, part.filename, part.content_type)
+
+        for uid, parts in large.items():
+            for part in parts:
+                chunks = fetch_partial(lambda items, uid=uid: self._fetch(str(uid), items),
+                                       part.section, self.fetch_buffer)
+                spooled[uid][part.section] = spool_chunks(chunks, part.encoding, part.filename, part.content_type)
+
+        attachments = {
+            uid: [spooled[uid][section] for section in order[uid] if section in spooled[uid]]
+            for uid in uids
+        }
+
+        messages = []
+        for uid in uids:
+            info = overview.get(uid, {})
+            header_bytes = next(
+                (value for key, value in info.items() if key.startswith('BODY[HEADER')), b''
+            ) or b''
+            headers = email.message_from_bytes(header_bytes, policy=email.policy.default)
+
+            messages.append({
+                'source': 'email',
+                'subject': headers['subject'],
+                'text': texts.get(uid, ''),
+                'sender': headers['from'],
+                'timestamp': headers['date'],
+                'attachments': attachments[uid],
+                'metadata': {
+                    'to': headers['to'],
+                    'cc': headers.get('cc', ''),
+                    'message_id': headers['message-id'],
+                    'uid': uid
+                }
+            })
+
+        return messages
+
+    def commit(self, messages: List[Dict[str, Any]], mark_seen: bool = True):
+        """Advance the sync cursor past ``messages`` once they are handled"""
+        uids = [message['metadata']['uid'] for message in messages]
+        if not uids:
+            return
+        if mark_seen:
+            self.conn.uid('STORE', ','.join(map(str, uids)), '+FLAGS.SILENT', r'(\Seen)')
+        self.last_uid = max(self.last_uid, max(uids))
+        self._save_state()
+
+    # -- push ---------------------------------------------------------------
+
+    def idle(self, timeout: float = 29 * 60) -> bool:
+        """Wait for the server to announce new mail.
+
+        Returns True when new messages arrived, False on timeout. Servers
+        without IDLE fall back to sleeping for ``timeout``.
+        """
+        if 'IDLE' not in self.conn.capabilities:
+            time.sleep(timeout)
+            return False
+
+        tag = b'Z%d' % next(self._idle_tags)
+        self.conn.send(tag + b' IDLE\r\n')
+        if not self.conn.readline().startswith(b'+'):
+            raise RuntimeError("Server rejected IDLE")
+
+        sock = self.conn.socket()
+        deadline = time.monotonic() + timeout
+        changed = False
+        try:
+            while not changed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pending = getattr(sock, 'pending', lambda: 0)()
+                if pending or select.select([sock], [], [], remaining)[0]:
+                    line = self.conn.readline()
+                    if not line:
+                        raise ConnectionError("IMAP connection closed during IDLE")
+                    changed = line.rstrip().upper().endswith((b'EXISTS', b'RECENT'))
+        finally:
+            self.conn.send(b'DONE\r\n')
+            while True:
+                line = self.conn.readline()
+                if not line or line.startswith(tag):
+                    break
+        return changed
+
+    def run(self, handler: Callable[[List[Dict[str, Any]]], None],
+            should_stop: Callable[[], bool] = lambda: False, idle_timeout: float = 29 * 60):
+        """Sync, hand new messages to ``handler``, then IDLE until more arrive"""
+        self.select()
+        while not should_stop():
+            messages = self.fetch_new()
+            if messages:
+                handler(messages)
+                self.commit(messages)
+            self.idle(idle_timeout)
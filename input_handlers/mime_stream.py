@@ -0,0 +1,273 @@
+import base64
+import io
+import quopri
+import re
+import shutil
+import tempfile
+from email.message import EmailMessage
+from email.parser import BytesHeaderParser
+from email.policy import default as default_policy
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+from utils.config import config
+from utils.logger import app_logger
+
+# Upper bound on a single read, so a part without line breaks cannot
+# pull an arbitrarily long "line" into memory
+_MAX_LINE = 64 * 1024
+
+class AttachmentHandle:
+    """Decoded attachment held in a spooled temp file instead of in memory.
+
+    Small parts stay in memory; anything above ``MIME_SPOOL_MAX_SIZE`` rolls
+    over to disk. The repr is short so logging or stringifying a message
+    never dumps attachment bytes.
+    """
+
+    def __init__(self, filename: Optional[str], content_type: str,
+                 spool_size: Optional[int] = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_size or config.MIME_SPOOL_MAX_SIZE)
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+
+    def open(self) -> BinaryIO:
+        """Return the underlying file positioned at the start"""
+        self.file.seek(0)
+        return self.file
+
+    def read(self) -> bytes:
+        return self.open().read()
+
+    def save(self, path: str):
+        """Copy the content to ``path`` without loading it into memory"""
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(self.open(), f)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return f"<AttachmentHandle {self.filename!r} {self.content_type} {self.size} bytes>"
+
+_NOT_BASE64 = re.compile(rb'[^A-Za-z0-9+/]')
+_INVALID_BASE64 = re.compile(rb'[^A-Za-z0-9+/=\s]')
+
+class _Base64Decoder:
+    """Incremental, lenient base64 decoding over arbitrary line breaks.
+
+    Like the stdlib email parser, characters outside the alphabet (and
+    misplaced padding) are skipped rather than failing the whole part.
+    """
+
+    def __init__(self):
+        self.buffer = b''
+        self.skipped = 0
+
+    def feed(self, data: bytes) -> bytes:
+        self.skipped += len(_INVALID_BASE64.findall(data))
+        self.buffer += _NOT_BASE64.sub(b'', data)
+        usable = len(self.buffer) - len(self.buffer) % 4
+        chunk, self.buffer = self.buffer[:usable], self.buffer[usable:]
+        return base64.b64decode(chunk)
+
+    def flush(self) -> bytes:
+        if self.skipped:
+            app_logger.warning(f"Skipped {self.skipped} invalid characters in a base64 part")
+        if len(self.buffer) == 1:
+            # A lone trailing character carries under a byte; nothing to recover
+            app_logger.warning("Dropped a truncated base64 tail")
+            return b''
+        return base64.b64decode(self.buffer + b'=' * (-len(self.buffer) % 4))
+
+class _QuotedPrintableDecoder:
+    """Incremental quoted-printable decoding.
+
+    Reads are capped at ``_MAX_LINE``, so an ``=XX`` escape can be split
+    between two feeds; the partial escape is held back for the next one.
+    """
+
+    def __init__(self):
+        self.pending = b''
+
+    def feed(self, data: bytes) -> bytes:
+        data = self.pending + data
+        self.pending = b''
+        if not data.endswith(b'\n'):
+            cut = data.find(b'=', max(len(data) - 2, 0))
+            if cut != -1:
+                data, self.pending = data[:cut], data[cut:]
+        return quopri.decodestring(data)
+
+    def flush(self) -> bytes:
+        pending, self.pending = self.pending, b''
+        return quopri.decodestring(pending)
+
+class _IdentityDecoder:
+    def feed(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b''
+
+def _decoder(encoding: str):
+    encoding = (encoding or '7bit').strip().lower()
+    if encoding == 'base64':
+        return _Base64Decoder()
+    if encoding == 'quoted-printable':
+        return _QuotedPrintableDecoder()
+    return _IdentityDecoder()
+
+def spool_chunks(chunks: Iterable[bytes], encoding: str, filename: Optional[str],
+                 content_type: str, chunk_size: int = _MAX_LINE) -> AttachmentHandle:
+    """Decode a part body arriving in pieces (e.g. partial FETCHes) into an AttachmentHandle"""
+    handle = AttachmentHandle(filename, content_type)
+    decoder = _decoder(encoding)
+    try:
+        for content in chunks:
+            stream = io.BytesIO(content)
+            for line in iter(lambda: stream.readline(chunk_size), b''):
+                handle.write(decoder.feed(line))
+        handle.write(decoder.flush())
+    except BaseException:
+        handle.close()
+        raise
+    return handle
+
+def spool_part(content: bytes, encoding: str, filename: Optional[str],
+               content_type: str, chunk_size: int = _MAX_LINE) -> AttachmentHandle:
+    """Decode an already-fetched part body into an AttachmentHandle chunk by chunk"""
+    return spool_chunks([content], encoding, filename, content_type, chunk_size)
+
+class MimeStreamParser:
+    """Single-pass MIME parser that streams decoded attachments to handles.
+
+    Reads the message line by line from a binary file, so memory use is
+    bounded by the spool size rather than the size of the message. Only
+    text/plain bodies are kept in memory; other non-attachment parts are
+    skipped.
+    """
+
+    def __init__(self, fp: BinaryIO, spool_size: Optional[int] = None):
+        self.fp = fp
+        self.spool_size = spool_size
+        self.headers: Optional[EmailMessage] = None
+        self.text_parts: List[str] = []
+        self.attachments: List[AttachmentHandle] = []
+
+    def parse(self) -> 'MimeStreamParser':
+        self.headers = self._read_headers()
+        self._entity(self.headers, [])
+        return self
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.text_parts)
+
+    def _read_headers(self) -> EmailMessage:
+        lines = []
+        while True:
+            line = self.fp.readline(_MAX_LINE)
+            if not line or line in (b'\r\n', b'\n'):
+                break
+            lines.append(line)
+        return BytesHeaderParser(policy=default_policy).parsebytes(b''.join(lines))
+
+    @staticmethod
+    def _match_boundary(line: bytes, boundaries: List[bytes]) -> Optional[Tuple[bytes, bool]]:
+        """Return (boundary, is_closing) if ``line`` is a delimiter for an open multipart"""
+        if not line.startswith(b'--'):
+            return None
+        stripped = line.rstrip()
+        for boundary in reversed(boundaries):
+            if stripped == b'--' + boundary:
+                return boundary, False
+            if stripped == b'--' + boundary + b'--':
+                return boundary, True
+        return None
+
+    def _skip(self, boundaries: List[bytes]) -> Optional[Tuple[bytes, bool]]:
+        """Discard lines up to the next delimiter"""
+        while True:
+            line = self.fp.readline(_MAX_LINE)
+            if not line:
+                return None
+            match = self._match_boundary(line, boundaries)
+            if match:
+                return match
+
+    def _entity(self, headers: EmailMessage, boundaries: List[bytes]) -> Optional[Tuple[bytes, bool]]:
+        """Consume one entity and return the delimiter that ended it (None at EOF)"""
+        boundary = headers.get_param('boundary') if headers.get_content_maintype() == 'multipart' else None
+        if not boundary:
+            return self._leaf(headers, boundaries)
+
+        boundary = str(boundary).encode()
+        inner = boundaries + [boundary]
+        end = self._skip(inner)  # preamble
+        while end == (boundary, False):
+            end = self._entity(self._read_headers(), inner)
+        if end == (boundary, True):
+            end = self._skip(boundaries)  # epilogue
+        return end
+
+    def _leaf(self, headers: EmailMessage, boundaries: List[bytes]) -> Optional[Tuple[bytes, bool]]:
+        filename = headers.get_filename()
+        content_type = headers.get_content_type()
+
+        text = None
+        if filename or headers.get_content_disposition() == 'attachment':
+            handle = AttachmentHandle(filename, content_type, self.spool_size)
+            self.attachments.append(handle)
+            write = handle.write
+        elif content_type == 'text/plain':
+            text = io.BytesIO()
+            write = text.write
+        else:
+            write = None
+
+        decoder = _decoder(headers.get('Content-Transfer-Encoding'))
+        # The line break before a delimiter belongs to the delimiter, so
+        # each line's ending is only written once the next line arrives
+        pending_eol = b''
+        end = None
+        while True:
+            line = self.fp.readline(_MAX_LINE)
+            if not line:
+                break
+            end = self._match_boundary(line, boundaries)
+            if end:
+                break
+            if write is None:
+                continue
+
+            if line.endswith(b'\r\n'):
+                body, eol = line[:-2], b'\r\n'
+            elif line.endswith(b'\n'):
+                body, eol = line[:-1], b'\n'
+            else:
+                body, eol = line, b''
+            if isinstance(decoder, _QuotedPrintableDecoder) and body.endswith(b'='):
+                body, eol = body[:-1], b''  # soft line break
+            write(decoder.feed(pending_eol + body))
+            pending_eol = eol
+
+        if write is not None:
+            write(decoder.flush())
+        if text is not None:
+            charset = headers.get_content_charset() or 'utf-8'
+            self.text_parts.append(text.getvalue().decode(charset, 'replace'))
+        return end
+
+def parse_message(fp: BinaryIO, spool_size: Optional[int] = None) -> MimeStreamParser:
+    """Parse a message from a binary file, streaming attachments to handles"""
+    return MimeStreamParser(fp, spool_size).parse()
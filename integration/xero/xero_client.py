@@ -31,6 +31,8 @@ class XeroClient:
                 self.access_token = tokens.get("access_token")
                 self.refresh_token = tokens.get("refresh_token")
                 self.headers["Authorization"] = f"Bearer {self.access_token}"
+                if tokens.get("tenant_id"):
+                    self.headers["xero-tenant-id"] = tokens["tenant_id"]
 
     def is_token_expired(self):
         # Implement token expiry logic if needed
@@ -62,6 +64,17 @@ class XeroClient:
             print(f"Failed to refresh token: {response.text}")
             return False
 
+    def find_invoice(self, reference):
+        """Return the first invoice whose Reference matches, or None"""
+        response = requests.get(
+            f"{self.base_url}/api.xro/2.0/Invoices",
+            headers={**self.headers, "Accept": "application/json"},
+            params={"where": f'Reference=="{reference}"'}
+        )
+        response.raise_for_status()
+        invoices = response.json().get("Invoices", [])
+        return invoices[0] if invoices else None
+
     def start_auth_flow(self):
         auth_url = (
             f"https://login.xero.com/identity/connect/authorize?"
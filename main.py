@@ -1,50 +1,91 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from input_handlers.email_handler import EmailHandler
 from input_handlers.message_handler import get_message_handler
-from processors.ocr import OCRProcessor
-from processors.text_analyzer import TextAnalyzer
+from input_handlers.mime_stream import AttachmentHandle
+from processors.ocr_pool import OCRPool, QueueFullError
 from integration.xero.xero_client import XeroClient
 from models.document import Document
-from typing import Dict, Any
+from services.job_queue import JobQueue
+from utils.storage import Storage
+from utils.metrics import create_metrics_router, documents_total, span
+from concurrent.futures import Future
+from typing import Dict, Any, Optional
+import asyncio
 import uvicorn
 import uuid
 from datetime import datetime
 
 app = FastAPI(title="Xero Automation Service")
+app.include_router(create_metrics_router())
 
-# Initialize processors
-ocr_processor = OCRProcessor()
-text_analyzer = TextAnalyzer()
+# OCR and text analysis run in worker processes so they never block the event loop
+ocr_pool = OCRPool()
 xero_client = XeroClient()
 
+def _queue_full_error() -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Document processing queue is full, please retry later",
+        headers={"Retry-After": "30"}
+    )
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
+    ocr_pool.start()
     try:
         xero_client.authenticate()
     except Exception as e:
         print(f"Failed to initialize Xero client: {str(e)}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop worker processes on shutdown"""
+    ocr_pool.shutdown(wait=False)
+
 @app.post("/process/email")
 async def process_email(background_tasks: BackgroundTasks):
     """Process unread emails"""
+    if ocr_pool.is_full:
+        raise _queue_full_error()
+
     try:
-        with EmailHandler() as email_handler:
-            messages = email_handler.get_unread_messages()
+        messages = await run_in_threadpool(_fetch_unread_messages)
             
+        document_count = 0
         for message in messages:
-            doc_id = str(uuid.uuid4())
+            metadata = {key: message[key] for key in ('subject', 'sender', 'timestamp')}
             document = Document(
-                id=doc_id,
+                id=str(uuid.uuid4()),
                 source='email',
                 content_type='email',
-                raw_content=str(message).encode(),
+                raw_content=f"{message['subject'] or ''}\n\n{message['text']}".encode(),
                 processed_content={},
+                metadata=metadata,
                 created_at=datetime.now()
             )
             background_tasks.add_task(process_document, document)
+            document_count += 1
+
+            for attachment in message['attachments']:
+                content_type = _attachment_content_type(attachment)
+                if content_type is None:
+                    attachment.close()
+                    continue
+                document = Document(
+                    id=str(uuid.uuid4()),
+                    source='email',
+                    content_type=content_type,
+                    raw_content=b'',
+                    processed_content={},
+                    metadata={**metadata, 'filename': attachment.filename},
+                    created_at=datetime.now()
+                )
+                background_tasks.add_task(process_attachment, document, attachment)
+                document_count += 1
             
-        return {"status": "processing", "message_count": len(messages)}
+        return {"status": "processing", "message_count": len(messages), "document_count": document_count}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -66,24 +107,67 @@ async def process_message(message: Dict[str, Any], background_tasks: BackgroundT
             created_at=datetime.now()
         )
         
-        background_tasks.add_task(process_document, document)
+        future = ocr_pool.submit(document.content_type, document.raw_content)
+        background_tasks.add_task(process_document, document, future)
         return {"status": "processing", "document_id": doc_id}
         
+    except QueueFullError:
+        raise _queue_full_error()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def process_document(document: Document):
+def _defer_document(document: Document):
+    """Store a document and queue it for the job workers (run_service.py --workers).
+
+    Used when the OCR pool stays full: the message is already marked seen,
+    so the document must not be dropped.
+    """
+    metadata = {**(document.metadata or {}), 'source': document.source}
+    Storage().save_document(document.id, document.raw_content, metadata)
+    JobQueue().enqueue('email', {
+        'document_id': document.id,
+        'filename': metadata.get('filename') or f"{document.id}.txt",
+        'content_type': document.content_type,
+        'email': {'id': None, 'subject': metadata.get('subject'), 'sender': metadata.get('sender')}
+    }, job_id=document.id)
+
+def _fetch_unread_messages():
+    with EmailHandler() as email_handler:
+        return email_handler.get_new_messages()
+
+@app.get("/queue")
+async def queue_status():
+    """Get OCR worker pool status"""
+    return ocr_pool.get_status()
+
+def _attachment_content_type(attachment: AttachmentHandle) -> Optional[str]:
+    """Map an attachment to the OCR pool's content types, None if unsupported"""
+    filename = (attachment.filename or '').lower()
+    if attachment.content_type == 'application/pdf' or filename.endswith('.pdf'):
+        return 'pdf'
+    if attachment.content_type.startswith('image/') or filename.endswith(('.png', '.jpg', '.jpeg', '.tiff')):
+        return 'image'
+    return None
+
+async def process_attachment(document: Document, attachment: AttachmentHandle):
+    """Read a spooled attachment only once it is its turn to be processed"""
+    try:
+        with attachment:
+            document.raw_content = await run_in_threadpool(attachment.read)
+        await process_document(document)
+    finally:
+        document.raw_content = b''
+
+async def process_document(document: Document, future: Future = None):
     """Process document and update Xero"""
     try:
-        # Extract text using OCR if needed
-        if document.content_type in ['pdf', 'image']:
-            ocr_results = ocr_processor.process_image(document.raw_content)
-            text = ocr_results['text']
-        else:
-            text = document.raw_content.decode()
+        # OCR and analysis run in the worker pool
+        if future is None:
+            # Messages are already marked as seen, so wait (on the event loop) for a slot
+            future = await ocr_pool.submit_async(document.content_type, document.raw_content)
+        results = await asyncio.wrap_future(future)
         
-        # Analyze text
-        analysis_results = text_analyzer.process_text(text)
+        analysis_results = results['analysis_results']
         document.processed_content = analysis_results
         document.processed_at = datetime.now()
         
@@ -97,9 +181,20 @@ async def process_document(document: Document):
                 }],
                 'reference': analysis_results['patterns'].get('invoice_number', [''])[0]
             }
-            xero_client.create_invoice(invoice_data)
+            with span('xero'):
+                await run_in_threadpool(xero_client.create_invoice, invoice_data)
+        documents_total.inc(source=document.source, outcome='processed')
             
+    except QueueFullError:
+        try:
+            await run_in_threadpool(_defer_document, document)
+            documents_total.inc(source=document.source, outcome='deferred')
+            print(f"OCR queue stayed full, queued document {document.id} for the job workers")
+        except Exception as e:
+            documents_total.inc(source=document.source, outcome='failed')
+            print(f"OCR queue stayed full and document {document.id} could not be queued: {str(e)}")
     except Exception as e:
+        documents_total.inc(source=document.source, outcome='failed')
         print(f"Error processing document {document.id}: {str(e)}")
 
 if __name__ == "__main__":
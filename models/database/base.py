@@ -1,13 +1,46 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+import os
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import declarative_base, sessionmaker
 from utils.config import config
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./xero_automation.db"
+SQLALCHEMY_DATABASE_URL = config.DATABASE_URL
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    """WAL lets readers run alongside the single writer; NORMAL skips per-commit fsyncs"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+def create_db_engine(url: Optional[str] = None):
+    """Engine for ``url`` (default ``DATABASE_URL``) with pooling tuned from config"""
+    url = make_url(url or config.DATABASE_URL)
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(
+            url,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING
+        )
+
+    engine = create_engine(
+        url,
+        # Wait for the write lock instead of failing with "database is locked"
+        connect_args={'check_same_thread': False, 'timeout': config.DB_SQLITE_BUSY_TIMEOUT}
+    )
+    if url.database and url.database != ':memory:':
+        event.listen(engine, 'connect', _configure_sqlite)
+    return engine
+
+engine = create_db_engine()
+if hasattr(os, 'register_at_fork'):
+    # Forked worker processes must open their own connections
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
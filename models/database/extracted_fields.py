@@ -0,0 +1,105 @@
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Optional
+from utils.config import config
+
+# Typed columns on processed_documents that mirror fields inside processed_content
+EXTRACTED_COLUMNS = ('vendor', 'invoice_number', 'total_amount', 'currency',
+                     'invoice_date', 'due_date', 'confidence')
+
+_DATE_FORMATS = ('%Y-%m-%d', '%b %d, %Y', '%B %d, %Y', '%b %d %Y', '%B %d %Y', '%d/%m/%Y', '%d.%m.%Y')
+
+_CURRENCY_MARKERS = (('€', 'EUR'), ('£', 'GBP'), ('SAR', 'SAR'), ('AUD', 'AUD'), ('NZD', 'NZD'),
+                     ('USD', 'USD'), ('EUR', 'EUR'), ('GBP', 'GBP'))
+
+# total_amount is Numeric(14, 2): twelve digits before the point
+_MAX_AMOUNT = Decimal(10) ** 12
+
+def _normalize_number(text: str) -> str:
+    """'€1.250,00' / '1 250,00 EUR' / '$1,250.00' -> '1250.00'.
+
+    The last '.' or ',' is the decimal point unless exactly three digits
+    follow it, in which case every separator groups thousands.
+    """
+    cleaned = ''.join(ch for ch in text if ch.isdigit() or ch in '.,-')
+    point = max(cleaned.rfind('.'), cleaned.rfind(','))
+    if point == -1 or len(cleaned) - point - 1 == 3:
+        return cleaned.replace('.', '').replace(',', '')
+    whole = cleaned[:point].replace('.', '').replace(',', '')
+    return f"{whole}.{cleaned[point + 1:]}"
+
+def _parse_amount(value: Any) -> Optional[Decimal]:
+    """A finite amount that fits the column, or None"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        if isinstance(value, (int, float, Decimal)):
+            amount = Decimal(str(value))
+        else:
+            amount = Decimal(_normalize_number(str(value)))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or abs(amount) >= _MAX_AMOUNT:
+        return None
+    return amount.quantize(Decimal('0.01'))
+
+def _parse_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    text = str(value).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def _currency(explicit: Any, amount_text: Any) -> Optional[str]:
+    if explicit:
+        return str(explicit).upper()[:3]
+    text = str(amount_text or '')
+    for marker, code in _CURRENCY_MARKERS:
+        if marker in text:
+            return code
+    # A bare '$' is ambiguous; record it in the configured home currency, if any
+    return config.DEFAULT_CURRENCY if '$' in text else None
+
+def extract_fields(processed_content: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Typed values for EXTRACTED_COLUMNS from a processed_content document.
+
+    Accepts a full pipeline result (ocr_results + analysis_results) or the
+    analysis results alone. Every column is present; missing ones are None.
+    """
+    fields = dict.fromkeys(EXTRACTED_COLUMNS)
+    if not isinstance(processed_content, dict):
+        return fields
+
+    analysis = processed_content.get('analysis_results') or processed_content
+    invoice = analysis.get('invoice_data') or {}
+    patterns = analysis.get('patterns') or {}
+
+    vendor = invoice.get('vendor_name') or (analysis.get('vendor_info') or {}).get('name') or analysis.get('vendor')
+    fields['vendor'] = str(vendor).strip()[:255] if vendor else None
+
+    number = invoice.get('invoice_number') or (patterns.get('invoice_number') or [None])[0]
+    fields['invoice_number'] = str(number).strip()[:100] if number else None
+
+    total = invoice.get('total_amount')
+    if total is None:
+        total = (analysis.get('financial_data') or {}).get('highest_amount')
+    if total is None:
+        total = (analysis.get('amounts') or {}).get('total')
+    fields['total_amount'] = _parse_amount(total)
+    amount_text = total if isinstance(total, str) else (patterns.get('amount') or [None])[0]
+    fields['currency'] = _currency(invoice.get('currency') or analysis.get('currency'), amount_text)
+
+    fields['invoice_date'] = _parse_date(invoice.get('date'))
+    fields['due_date'] = _parse_date(invoice.get('due_date'))
+
+    confidence = (processed_content.get('ocr_results') or {}).get('confidence', analysis.get('confidence'))
+    fields['confidence'] = float(confidence) if isinstance(confidence, (int, float)) else None
+    return fields
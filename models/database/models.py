@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, JSON, Numeric, ForeignKey, Index, event, inspect
 from sqlalchemy.orm import relationship
 from .base import Base
+from .extracted_fields import extract_fields
 from datetime import datetime
 
 class ProcessingJob(Base):
@@ -12,7 +13,22 @@ class ProcessingJob(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     error_message = Column(String, nullable=True)
-    metadata = Column(JSON, nullable=True)
+    # 'metadata' is reserved on declarative classes, so map the column under another name
+    job_metadata = Column('metadata', JSON, nullable=True)
+
+    # Queue bookkeeping
+    payload = Column(JSON, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    available_at = Column(DateTime, default=datetime.utcnow)  # not claimable before this time
+    locked_by = Column(String, nullable=True)  # worker holding the lease
+    lease_expires_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_processing_jobs_status_created_at', 'status', 'created_at'),  # dashboard listings
+        Index('ix_processing_jobs_status_available_at', 'status', 'available_at'),  # claims
+        Index('ix_processing_jobs_status_lease_expires_at', 'status', 'lease_expires_at'),  # expired leases
+    )
 
 class ProcessedDocument(Base):
     __tablename__ = "processed_documents"
@@ -25,5 +41,34 @@ class ProcessedDocument(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     xero_reference = Column(String, nullable=True)
 
+    # Typed copies of key fields in processed_content, kept in sync on write,
+    # so reporting and duplicate checks run in SQL
+    vendor = Column(String(255), nullable=True)
+    invoice_number = Column(String(100), nullable=True)
+    total_amount = Column(Numeric(14, 2), nullable=True)
+    currency = Column(String(3), nullable=True)
+    invoice_date = Column(Date, nullable=True)
+    due_date = Column(Date, nullable=True)
+    confidence = Column(Float, nullable=True)
+
     # Relationship
-    job = relationship("ProcessingJob", backref="documents")
\ No newline at end of file
+    job = relationship("ProcessingJob", backref="documents")
+
+    __table_args__ = (
+        Index('ix_processed_documents_job_id', 'job_id'),
+        Index('ix_processed_documents_xero_reference', 'xero_reference'),
+        Index('ix_processed_documents_type_created_at', 'document_type', 'created_at'),
+        Index('ix_processed_documents_vendor_invoice_number', 'vendor', 'invoice_number'),  # duplicates
+        Index('ix_processed_documents_vendor_invoice_date', 'vendor', 'invoice_date'),
+        Index('ix_processed_documents_invoice_date', 'invoice_date'),
+        Index('ix_processed_documents_total_amount', 'total_amount'),
+    )
+
+@event.listens_for(ProcessedDocument, 'before_insert')
+@event.listens_for(ProcessedDocument, 'before_update')
+def _sync_extracted_fields(mapper, connection, target):
+    """Refresh the typed columns whenever processed_content is written"""
+    if not inspect(target).attrs.processed_content.history.has_changes():
+        return
+    for column, value in extract_fields(target.processed_content).items():
+        setattr(target, column, value)
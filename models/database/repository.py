@@ -0,0 +1,295 @@
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import and_, func, insert, inspect, or_, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from .base import SessionLocal
+from .extracted_fields import EXTRACTED_COLUMNS, extract_fields
+from .models import ProcessingJob, ProcessedDocument
+
+# Keep IN lists well below SQLite's bound-parameter limit
+_CHUNK = 500
+
+def _chunks(values: Sequence, size: int = _CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _upsert(session, model, update_columns: Sequence[str] = ()):
+    """INSERT that updates ``update_columns`` on a primary-key conflict (ignores it if empty).
+
+    Executed with a list of rows, SQLAlchemy batches it into multi-row
+    INSERTs, so thousands of rows take a handful of round trips. Returns
+    None on dialects without an upsert clause.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        statement = (sqlite if dialect == 'sqlite' else postgresql).insert(model.__table__)
+        if not update_columns:
+            return statement.on_conflict_do_nothing(index_elements=['id'])
+        return statement.on_conflict_do_update(
+            index_elements=['id'],
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+    if dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(model.__table__)
+        # MySQL has no DO NOTHING; re-assigning the key is a no-op update
+        columns = update_columns or ['id']
+        return statement.on_duplicate_key_update(**{column: statement.inserted[column] for column in columns})
+    return None
+
+def _write_checked(connection, model, rows: List[Dict[str, Any]], update_columns: Sequence[str]) -> int:
+    """Upsert fallback: look up which ids exist, then INSERT the rest and UPDATE those"""
+    table = model.__table__
+    existing = set(connection.execute(
+        select(table.c.id).where(table.c.id.in_([row['id'] for row in rows]))
+    ).scalars())
+    new_rows = [row for row in rows if row['id'] not in existing]
+    written = connection.execute(insert(table), new_rows).rowcount if new_rows else 0
+    if update_columns:
+        for row in rows:
+            if row['id'] in existing:
+                values = {column: row[column] for column in update_columns if column in row}
+                written += connection.execute(
+                    update(table).where(table.c.id == row['id']).values(**values)
+                ).rowcount
+    return written
+
+def _keyset_before(model, before: Tuple[datetime, str]):
+    """Rows after the (created_at, id) cursor in newest-first order"""
+    created_at, row_id = before
+    return or_(model.created_at < created_at, and_(model.created_at == created_at, model.id < row_id))
+
+def _column_names(model) -> Dict[str, str]:
+    """Attribute name -> table column name (e.g. job_metadata -> metadata)"""
+    return {attr.key: attr.columns[0].name for attr in inspect(model).column_attrs}
+
+def _bulk_write(session_factory, model, rows: List[Dict[str, Any]], update_columns: Sequence[str] = ()) -> int:
+    if not rows:
+        return 0
+    names = _column_names(model)
+    rows = [{names.get(key, key): value for key, value in row.items()} for row in rows]
+    update_columns = [names.get(column, column) for column in update_columns]
+
+    written = 0
+    with session_factory() as session:
+        statement = _upsert(session, model, update_columns)
+        connection = session.connection()
+        for chunk in _chunks(rows):
+            if statement is None:
+                written += _write_checked(connection, model, chunk, update_columns)
+                continue
+            # Core execution: no ORM identity bookkeeping, and rowcount is reported
+            written += connection.execute(statement, chunk).rowcount
+        session.commit()
+    return written
+
+class JobRepository:
+    """Dashboard and retry queries on processing_jobs.
+
+    Every query filters on ``status`` first, so it is answered from one of
+    the (status, ...) composite indexes rather than a table scan.
+    """
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or SessionLocal
+
+    def count_by_status(self, since: Optional[datetime] = None) -> Dict[str, int]:
+        """Job counts per status, optionally only for jobs created since ``since``"""
+        query = select(ProcessingJob.status, func.count()).group_by(ProcessingJob.status)
+        if since is not None:
+            query = query.where(ProcessingJob.created_at >= since)
+        with self.session_factory() as session:
+            return dict(session.execute(query).all())
+
+    def list_by_status(self, statuses: Iterable[str], limit: int = 50,
+                       before: Optional[Tuple[datetime, str]] = None) -> List[ProcessingJob]:
+        """Newest jobs in the given statuses.
+
+        Pages with ``before`` (the ``(created_at, id)`` of the last job seen)
+        instead of an OFFSET, so later pages cost the same as the first. The
+        id breaks ties between jobs queued in the same bulk insert.
+        """
+        jobs = []
+        with self.session_factory() as session:
+            # One index range per status, merged here, keeps each scan ordered
+            for status in statuses:
+                query = select(ProcessingJob).where(ProcessingJob.status == status)
+                if before is not None:
+                    query = query.where(_keyset_before(ProcessingJob, before))
+                jobs.extend(session.execute(
+                    query.order_by(ProcessingJob.created_at.desc(), ProcessingJob.id.desc()).limit(limit)
+                ).scalars().all())
+        jobs.sort(key=lambda job: (job.created_at or datetime.min, job.id), reverse=True)
+        return jobs[:limit]
+
+    def get_many(self, job_ids: Sequence[str]) -> Dict[str, ProcessingJob]:
+        """Jobs by id, in chunked IN queries"""
+        jobs = {}
+        with self.session_factory() as session:
+            for chunk in _chunks(list(job_ids)):
+                for job in session.execute(select(ProcessingJob).where(ProcessingJob.id.in_(chunk))).scalars():
+                    jobs[job.id] = job
+        return jobs
+
+    def insert_many(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert job rows (dicts of column values, all with the same keys) in bulk.
+
+        Rows whose id already exists are skipped, so a replayed batch is
+        harmless. Returns the number of rows inserted.
+        """
+        return _bulk_write(self.session_factory, ProcessingJob, rows)
+
+    def upsert_many(self, rows: List[Dict[str, Any]],
+                    update_columns: Sequence[str] = ('status', 'error_message', 'updated_at')) -> int:
+        """Insert jobs, or apply ``update_columns`` from the row to jobs that already exist"""
+        now = datetime.utcnow()
+        rows = [{'updated_at': now, **row} for row in rows]
+        return _bulk_write(self.session_factory, ProcessingJob, rows, update_columns)
+
+    def update_status_many(self, updates: List[Dict[str, Any]]) -> None:
+        """Apply status transitions to existing jobs in one executemany UPDATE.
+
+        Each dict holds ``id`` and the columns to change, e.g.
+        ``{'id': job_id, 'status': 'failed', 'error_message': '...'}``.
+        """
+        if not updates:
+            return
+        now = datetime.utcnow()
+        with self.session_factory() as session:
+            for chunk in _chunks([{'updated_at': now, **values} for values in updates]):
+                session.execute(update(ProcessingJob), chunk)
+            session.commit()
+
+    def retryable(self, limit: int = 100) -> List[ProcessingJob]:
+        """Failed jobs, oldest first, for the retry view"""
+        with self.session_factory() as session:
+            return session.execute(
+                select(ProcessingJob)
+                .where(ProcessingJob.status == 'failed')
+                .order_by(ProcessingJob.created_at)
+                .limit(limit)
+            ).scalars().all()
+
+    def requeue(self, job_ids: Sequence[str]) -> int:
+        """Send failed jobs back to the queue with fresh attempts; returns how many moved"""
+        now = datetime.utcnow()
+        requeued = 0
+        with self.session_factory() as session:
+            for chunk in _chunks(list(job_ids)):
+                result = session.execute(
+                    update(ProcessingJob)
+                    .where(ProcessingJob.id.in_(chunk), ProcessingJob.status == 'failed')
+                    .values(status='pending', attempts=0, available_at=now, error_message=None, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+                requeued += result.rowcount
+            session.commit()
+        return requeued
+
+class DocumentRepository:
+    """Lookups on processed_documents by job, Xero reference and extracted fields"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or SessionLocal
+
+    @staticmethod
+    def _with_extracted(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Core inserts skip the ORM hook that fills the typed columns
+        return [{**extract_fields(row.get('processed_content')), **row} for row in rows]
+
+    def insert_many(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert document rows in bulk, skipping ids that already exist"""
+        return _bulk_write(self.session_factory, ProcessedDocument, self._with_extracted(rows))
+
+    def upsert_many(self, rows: List[Dict[str, Any]],
+                    update_columns: Sequence[str] = ('processed_content', 'xero_reference')) -> int:
+        """Insert documents, or refresh ``update_columns`` on documents that already exist"""
+        if 'processed_content' in update_columns:
+            update_columns = list(update_columns) + list(EXTRACTED_COLUMNS)
+        return _bulk_write(self.session_factory, ProcessedDocument, self._with_extracted(rows), update_columns)
+
+    def for_jobs(self, job_ids: Sequence[str]) -> Dict[str, List[ProcessedDocument]]:
+        """Documents grouped by job id, for a page of jobs at once"""
+        documents = defaultdict(list)
+        with self.session_factory() as session:
+            for chunk in _chunks(list(job_ids)):
+                rows = session.execute(
+                    select(ProcessedDocument)
+                    .where(ProcessedDocument.job_id.in_(chunk))
+                    .order_by(ProcessedDocument.created_at)
+                ).scalars()
+                for document in rows:
+                    documents[document.job_id].append(document)
+        return dict(documents)
+
+    def by_xero_references(self, references: Sequence[str]) -> Dict[str, ProcessedDocument]:
+        """Documents already linked to the given Xero invoice ids or numbers"""
+        documents = {}
+        with self.session_factory() as session:
+            for chunk in _chunks(list(references)):
+                rows = session.execute(
+                    select(ProcessedDocument).where(ProcessedDocument.xero_reference.in_(chunk))
+                ).scalars()
+                for document in rows:
+                    documents[document.xero_reference] = document
+        return documents
+
+    def recent(self, document_type: str, limit: int = 50,
+               before: Optional[Tuple[datetime, str]] = None) -> List[ProcessedDocument]:
+        """Newest documents of one type, paged by ``(created_at, id)``"""
+        query = select(ProcessedDocument).where(ProcessedDocument.document_type == document_type)
+        if before is not None:
+            query = query.where(_keyset_before(ProcessedDocument, before))
+        with self.session_factory() as session:
+            return session.execute(
+                query.order_by(ProcessedDocument.created_at.desc(), ProcessedDocument.id.desc()).limit(limit)
+            ).scalars().all()
+
+    def search(self, vendor: Optional[str] = None, date_from: Optional[date] = None,
+               date_to: Optional[date] = None, min_total: Optional[Decimal] = None,
+               max_total: Optional[Decimal] = None, limit: int = 100) -> List[ProcessedDocument]:
+        """Documents matching extracted vendor, invoice date and total filters"""
+        query = select(ProcessedDocument)
+        if vendor is not None:
+            query = query.where(ProcessedDocument.vendor == vendor)
+        if date_from is not None:
+            query = query.where(ProcessedDocument.invoice_date >= date_from)
+        if date_to is not None:
+            query = query.where(ProcessedDocument.invoice_date <= date_to)
+        if min_total is not None:
+            query = query.where(ProcessedDocument.total_amount >= min_total)
+        if max_total is not None:
+            query = query.where(ProcessedDocument.total_amount <= max_total)
+        with self.session_factory() as session:
+            return session.execute(
+                query.order_by(ProcessedDocument.invoice_date.desc()).limit(limit)
+            ).scalars().all()
+
+    def find_duplicates(self, vendor: str, invoice_number: str,
+                        exclude_id: Optional[str] = None) -> List[ProcessedDocument]:
+        """Documents already recorded for the same vendor and invoice number"""
+        query = select(ProcessedDocument).where(
+            ProcessedDocument.vendor == vendor,
+            ProcessedDocument.invoice_number == invoice_number
+        )
+        if exclude_id is not None:
+            query = query.where(ProcessedDocument.id != exclude_id)
+        with self.session_factory() as session:
+            return session.execute(query).scalars().all()
+
+    def totals_by_vendor(self, date_from: Optional[date] = None,
+                         date_to: Optional[date] = None) -> Dict[str, Dict[str, Any]]:
+        """Invoice count and summed total per vendor over an invoice-date range"""
+        query = (
+            select(ProcessedDocument.vendor, func.count(), func.sum(ProcessedDocument.total_amount))
+            .where(ProcessedDocument.vendor.is_not(None))
+            .group_by(ProcessedDocument.vendor)
+        )
+        if date_from is not None:
+            query = query.where(ProcessedDocument.invoice_date >= date_from)
+        if date_to is not None:
+            query = query.where(ProcessedDocument.invoice_date <= date_to)
+        with self.session_factory() as session:
+            rows = session.execute(query).all()
+        return {vendor: {'count': count, 'total': total} for vendor, count, total in rows}
@@ -0,0 +1,152 @@
+import mmap
+import os
+import re
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+from utils.config import config
+
+# Extensions and MIME types that are never invoices, rejected before download
+SKIPPED_EXTENSIONS = ('.ics', '.vcf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+                      '.zip', '.eml', '.msg', '.htm', '.html', '.txt', '.p7s', '.asc')
+SKIPPED_CONTENT_TYPES = ('text/calendar', 'text/vcard', 'text/html', 'message/rfc822',
+                         'application/pkcs7-signature', 'application/pgp-signature')
+
+IMAGE_KINDS = ('png', 'jpeg', 'tiff', 'gif', 'bmp', 'webp')
+
+_PDF_PAGE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+_SNIFF_BYTES = 64 * 1024
+
+Buffer = Union[bytes, memoryview, mmap.mmap]
+
+@dataclass
+class Classification:
+    """Outcome of sniffing one attachment"""
+    admitted: bool
+    kind: Optional[str]  # pdf, image, or the detected non-document type
+    reason: str = ''
+    pages: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    blocklist: bool = False  # rejected content worth remembering by hash
+
+def sniff_type(head: Buffer) -> Optional[str]:
+    """Detect the file type from magic bytes"""
+    head = bytes(head[:16])
+    if head.startswith(b'%PDF-'):
+        return 'pdf'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith((b'II*\x00', b'MM\x00*')):
+        return 'tiff'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if head.startswith(b'BM'):
+        return 'bmp'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'PK\x03\x04'):
+        return 'zip'  # docx/xlsx and other office formats
+    if head.startswith(b'\xd0\xcf\x11\xe0'):
+        return 'ole'  # legacy office formats
+    if head.lstrip().upper().startswith(b'BEGIN:VCALENDAR'):
+        return 'calendar'
+    return None
+
+def _jpeg_dimensions(data: Buffer) -> Optional[Tuple[int, int]]:
+    """Walk JPEG segments up to the first start-of-frame marker"""
+    pos = 2
+    limit = min(len(data), _SNIFF_BYTES)
+    while pos + 9 < limit:
+        if data[pos] != 0xFF:
+            pos += 1
+            continue
+        marker = data[pos + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+def image_dimensions(data: Buffer, kind: str) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from an image header without decoding it"""
+    try:
+        if kind == 'png':
+            return struct.unpack('>II', data[16:24])
+        if kind == 'gif':
+            return struct.unpack('<HH', data[6:10])
+        if kind == 'bmp':
+            width, height = struct.unpack('<ii', data[18:26])
+            return width, abs(height)
+        if kind == 'webp' and data[12:16] == b'VP8X':
+            width = int.from_bytes(data[24:27], 'little') + 1
+            height = int.from_bytes(data[27:30], 'little') + 1
+            return width, height
+        if kind == 'jpeg':
+            return _jpeg_dimensions(data)
+    except struct.error:
+        pass
+    return None
+
+def pdf_page_count(data: Buffer) -> Optional[int]:
+    """Count page objects; None when pages live in compressed object streams"""
+    count = sum(1 for _ in _PDF_PAGE.finditer(data))
+    return count or None
+
+def prefilter(name: Optional[str], content_type: Optional[str] = None,
+              size: Optional[int] = None) -> Optional[str]:
+    """Reject attachments from metadata alone; returns the reason or None"""
+    extension = os.path.splitext(name or '')[1].lower()
+    if extension in SKIPPED_EXTENSIONS:
+        return f"skipped extension {extension}"
+    if content_type and content_type.lower() in SKIPPED_CONTENT_TYPES:
+        return f"skipped content type {content_type}"
+    if size is not None and size < config.ATTACHMENT_MIN_BYTES:
+        return f"too small ({size} bytes)"
+    return None
+
+def classify(data: Buffer) -> Classification:
+    """Decide whether content looks like an invoice document worth OCR"""
+    size = len(data)
+    kind = sniff_type(data)
+
+    if kind is None:
+        return Classification(False, None, 'unrecognized file type')
+    if size < config.ATTACHMENT_MIN_BYTES:
+        # Tiny images are recurring signature art; a tiny PDF may still be a
+        # real (vector) invoice, so it is only skipped, never blocklisted
+        return Classification(False, kind, f"too small ({size} bytes)", blocklist=kind in IMAGE_KINDS)
+    if size > config.ATTACHMENT_MAX_BYTES:
+        return Classification(False, kind, f"too large ({size} bytes)")
+
+    if kind == 'pdf':
+        pages = pdf_page_count(data)
+        if pages and pages > config.ATTACHMENT_MAX_PDF_PAGES:
+            return Classification(False, kind, f"too many pages ({pages})", pages=pages)
+        return Classification(True, 'pdf', pages=pages)
+
+    if kind in IMAGE_KINDS:
+        dimensions = image_dimensions(data, kind)
+        if dimensions is None:
+            return Classification(True, 'image')
+        width, height = dimensions
+        if min(width, height) < config.ATTACHMENT_MIN_IMAGE_SIDE:
+            # Logos, icons and tracking pixels; they recur in every signature
+            return Classification(False, kind, f"image too small ({width}x{height})",
+                                  width=width, height=height, blocklist=True)
+        return Classification(True, 'image', width=width, height=height)
+
+    return Classification(False, kind, f"not a document ({kind})")
+
+def classify_file(path: str) -> Classification:
+    """Classify a file on disk, memory-mapping it instead of reading it in"""
+    if os.path.getsize(path) == 0:
+        return Classification(False, None, 'empty file')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return classify(data)
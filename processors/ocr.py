@@ -5,6 +5,7 @@ from typing import Dict, Any, Optional, List
 from pathlib import Path
 import io
 from utils.config import config
+from utils.metrics import pages_total, span
 from pdf2image import convert_from_bytes
 import tempfile
 import os
@@ -103,8 +104,9 @@ class OCRProcessor:
                 for config in self.ocr_configs:
                     try:
                         # Perform OCR
-                        text = pytesseract.image_to_string(deskewed, config=config)
-                        data = pytesseract.image_to_data(deskewed, output_type=pytesseract.Output.DICT)
+                        with span('ocr', psm=config.split()[-1]):
+                            text = pytesseract.image_to_string(deskewed, config=config)
+                            data = pytesseract.image_to_data(deskewed, output_type=pytesseract.Output.DICT)
                         
                         # Calculate confidence
                         confidences = [int(conf) for conf in data['conf'] if conf != '-1']
@@ -168,11 +170,13 @@ class OCRProcessor:
             with tempfile.TemporaryDirectory() as temp_dir:
                 print("Converting PDF to images...")
                 # Convert PDF to images with higher DPI
-                images = convert_from_bytes(
-                    pdf_data,
-                    dpi=400,  # Increased DPI for better quality
-                    poppler_path=self.poppler_path
-                )
+                with span('rasterize'):
+                    images = convert_from_bytes(
+                        pdf_data,
+                        dpi=400,  # Increased DPI for better quality
+                        poppler_path=self.poppler_path
+                    )
+                pages_total.inc(len(images))
                 print(f"Converted PDF to {len(images)} images")
                 
                 # Process each page
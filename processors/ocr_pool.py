@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional
+from utils.config import config
+from utils.logger import forward_logging, log_queue
+from utils.metrics import metrics
+
+# Per-process processor instances, created once by the pool initializer so
+# the Tesseract setup and spaCy model load are paid once per worker.
+_ocr_processor = None
+_text_analyzer = None
+
+class QueueFullError(RuntimeError):
+    """Raised when the OCR pool has no free slots for new work"""
+    pass
+
+def _init_worker(parent_log_queue=None):
+    """Initialize processors inside a worker process"""
+    global _ocr_processor, _text_analyzer
+    if parent_log_queue is not None:
+        # Under spawn/forkserver the worker re-imported the logger
+        forward_logging(parent_log_queue)
+    from processors.ocr import OCRProcessor
+    from processors.text_analyzer import TextAnalyzer
+
+    _ocr_processor = OCRProcessor()
+    _text_analyzer = TextAnalyzer()
+
+def _process_content(content_type: str, content: bytes) -> Dict[str, Any]:
+    """Run OCR (when needed) and text analysis for one document"""
+    if content_type == 'pdf':
+        ocr_results = _ocr_processor.process_pdf(content)
+        text = ocr_results['text']
+    elif content_type == 'image':
+        ocr_results = _ocr_processor.process_image(content)
+        text = ocr_results['text']
+    else:
+        ocr_results = None
+        text = content.decode()
+
+    return {
+        'ocr_results': ocr_results,
+        'analysis_results': _text_analyzer.process_text(text),
+        # Spans recorded in this worker, merged into the parent's registry
+        'metrics': metrics.drain()
+    }
+
+class OCRPool:
+    """Process pool for the CPU-bound OCR and analysis stages.
+
+    At most ``max_pending`` documents may be queued or running at once;
+    ``submit`` raises ``QueueFullError`` beyond that so callers can apply
+    backpressure instead of building an unbounded backlog.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = max_workers or config.OCR_WORKERS
+        self.max_pending = max(max_pending or config.OCR_MAX_PENDING, self.max_workers)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        # Caller holds self._lock
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(log_queue(),)
+            )
+        return self._executor
+
+    def start(self):
+        """Start the worker processes if not already running"""
+        with self._lock:
+            self._ensure_executor()
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    @property
+    def pending(self) -> int:
+        """Number of documents queued or being processed"""
+        return self._pending
+
+    @property
+    def is_full(self) -> bool:
+        return self._pending >= self.max_pending
+
+    def _release(self, _future: Future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, content_type: str, content: bytes, block: bool = False,
+               timeout: Optional[float] = None) -> Future:
+        """Queue a document for OCR and analysis.
+
+        With ``block=False`` a full pool raises ``QueueFullError`` immediately.
+        """
+        if not self._slots.acquire(blocking=block, timeout=timeout if block else None):
+            raise QueueFullError(f"OCR queue is full ({self.max_pending} pending)")
+
+        try:
+            # Held throughout, so a concurrent shutdown() cannot clear the executor mid-submit
+            with self._lock:
+                self._pending += 1
+                try:
+                    future = self._ensure_executor().submit(_process_content, content_type, content)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM on a huge scan); replace the pool once
+                    broken, self._executor = self._executor, None
+                    broken.shutdown(wait=False, cancel_futures=True)
+                    future = self._ensure_executor().submit(_process_content, content_type, content)
+        except Exception:
+            self._release(None)
+            raise
+
+        future.add_done_callback(self._release)
+        future.add_done_callback(self._merge_metrics)
+        return future
+
+    @staticmethod
+    def _merge_metrics(future: Future):
+        if not future.cancelled() and future.exception() is None:
+            metrics.merge(future.result().pop('metrics', None))
+
+    async def submit_async(self, content_type: str, content: bytes,
+                           timeout: Optional[float] = None) -> Future:
+        """Wait up to ``timeout`` seconds for a free slot, then queue the document.
+
+        Waits on the event loop rather than in a threadpool thread, so
+        documents queued behind a full pool do not starve other requests.
+        Raises ``QueueFullError`` if no slot frees up in time.
+        """
+        deadline = time.monotonic() + (config.OCR_SUBMIT_TIMEOUT if timeout is None else timeout)
+        while True:
+            try:
+                return self.submit(content_type, content)
+            except QueueFullError:
+                if time.monotonic() >= deadline:
+                    raise
+            await asyncio.sleep(0.05)
+
+    async def process(self, content_type: str, content: bytes) -> Dict[str, Any]:
+        """Submit a document and await its results without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(content_type, content))
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'workers': self.max_workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending
+        }
@@ -2,6 +2,7 @@ import spacy
 import re
 from typing import Dict, Any, List
 from datetime import datetime
+from utils.metrics import span
 
 class TextAnalyzer:
     def __init__(self):
@@ -113,7 +114,8 @@ class TextAnalyzer:
             return vendor_info
         
         # Method 2: Use NLP for organization detection
-        doc = self.nlp(text)
+        with span('ner'):
+            doc = self.nlp(text)
         org_candidates = []
         
         for ent in doc.ents:
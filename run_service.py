@@ -1,14 +1,43 @@
 from services.monitor_service import MonitorService
-from utils.logger import app_logger
+from services.job_queue import JobQueue
+from services.job_worker import JobWorker
+from utils.logger import app_logger, forward_logging, log_queue
+from utils.retention import RetentionManager
+from utils.scheduler import AdaptivePollScheduler
+import multiprocessing
 import signal
 import sys
 import time
 
+def run_worker(worker_index, parent_log_queue=None):
+    """Entry point for a worker process: consume jobs until signalled"""
+    if parent_log_queue is not None:
+        forward_logging(parent_log_queue)
+    service = MonitorService()
+    worker = JobWorker(JobQueue(), service.process_job, on_complete=service.finish_job)
+
+    def handle_shutdown(signum, frame):
+        worker.stop()
+
+    signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGTERM, handle_shutdown)
+
+    worker.run()
+
 class ServiceRunner:
-    def __init__(self):
-        self.service = MonitorService()
+    """Polls on a timer; Graph push notifications are only received by web_app.py"""
+
+    def __init__(self, workers=0, role='all'):
+        self.workers = workers
+        self.role = role
+        self.service = MonitorService() if role != 'worker' else None
+        self.job_queue = JobQueue() if workers or role != 'all' else None
+        # Only the poller tends the storage tree, so processes never archive concurrently
+        self.retention = RetentionManager(self.service.storage) if self.service else None
+        self.processes = []
+        self.scheduler = None
         self.running = False
-        
+
         # Register signal handlers
         signal.signal(signal.SIGINT, self.handle_shutdown)
         signal.signal(signal.SIGTERM, self.handle_shutdown)
@@ -18,51 +47,122 @@ class ServiceRunner:
         print("\nShutdown signal received. Stopping service...")
         self.running = False
 
-    def run(self, check_interval=300):  # 5 minutes default
+    def _wait(self, delay):
+        """Sleep between polls, showing a simple activity indicator"""
+        for _ in range(min(int(delay), 5)):  # Show max 5 dots
+            if not self.running:
+                return
+            sys.stdout.write(".")
+            sys.stdout.flush()
+            time.sleep(1)
+
+        remaining = delay - min(int(delay), 5)
+        while remaining > 0 and self.running:
+            time.sleep(min(remaining, 1))
+            remaining -= 1
+
+        sys.stdout.write("\r" + " " * 10 + "\r")  # Clear the dots
+
+    def start_workers(self):
+        """Start worker processes and replace any that have exited"""
+        for index in range(self.workers):
+            if index < len(self.processes) and self.processes[index].is_alive():
+                continue
+            if index < len(self.processes):
+                app_logger.warning(f"Worker {index} exited, restarting")
+
+            process = multiprocessing.Process(target=run_worker, args=(index, log_queue()), daemon=False)
+            process.start()
+            if index < len(self.processes):
+                self.processes[index] = process
+            else:
+                self.processes.append(process)
+
+    def stop_workers(self):
+        """Ask worker processes to finish their current job and exit"""
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM, handled by run_worker
+        for process in self.processes:
+            process.join()
+
+    def run(self, check_interval=300, adaptive=None):  # 5 minutes default
         """Run the service continuously"""
         self.running = True
-        
+        polling = self.role in ('all', 'poller')
+        self.scheduler = AdaptivePollScheduler(base_interval=check_interval, adaptive=adaptive)
+
         print("\nXero Automation Service")
         print("=" * 50)
-        print(f"Check interval: {check_interval} seconds")
+        if polling:
+            mode = " (adaptive)" if self.scheduler.adaptive else ""
+            print(f"Check interval: {check_interval} seconds{mode}")
+        if self.workers:
+            print(f"Worker processes: {self.workers}")
         print("\nService is running...")
         print("Press Ctrl+C to stop")
-        
+
         while self.running:
             try:
-                self.service.process_emails()
-                
-                # Show a simple activity indicator
-                for _ in range(min(check_interval, 5)):  # Show max 5 dots
-                    if not self.running:
-                        break
-                    sys.stdout.write(".")
-                    sys.stdout.flush()
+                if self.workers:
+                    self.start_workers()
+
+                if not polling:
                     time.sleep(1)
-                    
-                if check_interval > 5:
-                    time.sleep(check_interval - 5)
-                
-                sys.stdout.write("\r" + " " * 10 + "\r")  # Clear the dots
-                
+                    continue
+
+                if self.job_queue:
+                    found = self.service.enqueue_emails(self.job_queue)
+                else:
+                    found = self.service.process_emails()
+
+                self.scheduler.record(found)
+                self.retention.run_if_due()
+                self._wait(self.scheduler.next_delay())
+
             except Exception as e:
                 app_logger.error(f"Error in service: {str(e)}")
                 time.sleep(check_interval)
 
+        if self.processes:
+            print("\nWaiting for workers to finish...")
+            self.stop_workers()
+
         print("\nService stopped.")
 
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description='Run Xero Automation Service')
     parser.add_argument(
-        '--interval', 
-        type=int, 
+        '--interval',
+        type=int,
         default=300,
         help='Check interval in seconds (default: 300)'
     )
-    
+    parser.add_argument(
+        '--fixed-interval',
+        action='store_true',
+        help='Always wait --interval seconds instead of adapting to mailbox activity'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help='Number of worker processes; 0 processes emails in the polling loop (default: 0)'
+    )
+    parser.add_argument(
+        '--role',
+        choices=['all', 'poller', 'worker'],
+        default='all',
+        help='Run the poller, workers or both. Roles share the local storage index and '
+             'ledger, so run them on the same host (default: all)'
+    )
+
     args = parser.parse_args()
-    
-    runner = ServiceRunner()
-    runner.run(args.interval)
\ No newline at end of file
+
+    if args.role == 'worker' and not args.workers:
+        parser.error('--role worker requires --workers N')
+
+    runner = ServiceRunner(workers=args.workers, role=args.role)
+    runner.run(args.interval, adaptive=False if args.fixed_interval else None)
@@ -1,87 +1,245 @@
 from datetime import datetime
 from utils.config import config
 from utils.logger import app_logger
-import tempfile
-import os
 from .ms365_auth import MS365Auth
+from .graph_client import BATCH_LIMIT
+from .ledger import ProcessedLedger, hash_file
+from processors.attachment_classifier import classify_file, prefilter
+from utils.metrics import timed
+import os
+import threading
 
 class EmailMonitor:
-    def __init__(self):
+    def __init__(self, ledger=None):
         self.ms365 = MS365Auth()
-        self.mailbox = None
-        self.processed_emails = set()
+        self.connected = False
+        # Persistent, so deduplication survives restarts and new EmailMonitor instances
+        self.ledger = ledger or ProcessedLedger()
+        self._pending_lock = threading.Lock()
+        self._listed = []  # message ids returned by the last get_new_messages
 
     def connect(self):
         """Establish connection to Microsoft 365"""
         try:
-            self.ms365.authenticate()
-            self.mailbox = self.ms365.get_mailbox()
+            if not self.ms365.ensure_token():
+                raise ConnectionError("Token acquisition failed")
+            self.connected = True
             app_logger.info("Successfully connected to Microsoft 365")
             return True
         except Exception as e:
             app_logger.error(f"Failed to connect to Microsoft 365: {str(e)}")
             raise
 
+    def ensure_connected(self):
+        """Connect on first use or after a failure; otherwise reuse the session"""
+        if not self.connected:
+            self.connect()
+
+    def reset(self):
+        """Drop the connection so the next cycle reconnects with a fresh token"""
+        self.connected = False
+        self.ms365.token_expires_at = 0
+
+    def _is_file_attachment(self, attachment):
+        """Item and reference attachments carry no file content"""
+        odata_type = attachment.get('@odata.type', '#microsoft.graph.fileAttachment')
+        return bool(attachment.get('name')) and odata_type == '#microsoft.graph.fileAttachment'
+
     def save_attachment(self, attachment, email_id):
         """Save email attachment to temporary file"""
         try:
-            if attachment.name:
-                # Create temp directory if it doesn't exist
-                temp_dir = os.path.join(tempfile.gettempdir(), 'xero_automation')
-                os.makedirs(temp_dir, exist_ok=True)
-                
-                filepath = os.path.join(temp_dir, f"{email_id}_{attachment.name}")
-                
-                # Download and save attachment
-                attachment.save(filepath)
-                app_logger.info(f"Saved attachment: {attachment.name}")
+            if self._is_file_attachment(attachment):
+                filepath = self.ms365.download_attachment(email_id, attachment)
+                if filepath:
+                    app_logger.info(f"Saved attachment: {attachment['name']}")
                 return filepath
                 
         except Exception as e:
             app_logger.error(f"Error saving attachment: {str(e)}")
         return None
 
-    def check_new_emails(self):
-        """Check for new unread emails"""
-        try:
-            if not self.mailbox:
-                self.connect()
+    def get_new_messages(self):
+        """List unread messages with attachments that changed since the last poll"""
+        self.ensure_connected()
 
-            # Get unread messages
-            query = self.mailbox.new_query().on_attribute('isRead').equals(False)
-            messages = self.mailbox.get_messages(query=query, limit=10)
-            
+        self._listed = []
+        messages = self.ms365.get_new_messages()
+        new_ids = set(self.ledger.filter_new(message['id'] for message in messages))
+        messages = [message for message in messages if message['id'] in new_ids]
+        self._listed = [message['id'] for message in messages]
+        return messages
+
+    def commit_sync_state(self):
+        """Advance the mailbox sync cursor once fetched messages are handled.
+
+        Only call this when every message was handled: the old cursor is the
+        only thing that makes a failed message show up in the next poll.
+        """
+        self.ms365.commit_delta()
+
+    def finish_sync(self) -> bool:
+        """Advance the sync cursor at the end of a poll cycle, unless a message should be retried.
+
+        The ledger decides: a listed message that was not completed (a
+        failed download, batch or later stage) keeps the old cursor, so the
+        next poll lists it again; it stays unread until processed. After
+        MESSAGE_MAX_ATTEMPTS such polls the cursor moves on regardless, so
+        one bad message cannot pin it forever. Returns whether it advanced.
+        """
+        unfinished = self.ledger.filter_new(self._listed)
+        if unfinished:
+            attempts = self.ledger.record_attempts(unfinished)
+            if any(count < config.MESSAGE_MAX_ATTEMPTS for count in attempts.values()):
+                app_logger.warning(f"Keeping the previous sync state so {len(unfinished)} unfinished messages are fetched again")
+                return False
+            app_logger.error(f"Giving up on {len(unfinished)} messages after "
+                             f"{config.MESSAGE_MAX_ATTEMPTS} attempts: {', '.join(unfinished)}", exc_info=False)
+        self.commit_sync_state()
+        return True
+
+    def complete_messages(self, message_ids):
+        """Record messages as handled and only then mark them read.
+
+        Until then a message stays unread, so a replayed delta query still
+        lists it after a failure in any later stage.
+        """
+        message_ids = list(message_ids)
+        if not message_ids:
+            return
+        self.ledger.add_messages(message_ids)
+        for message_id, marked in self.ms365.graph.mark_as_read(message_ids).items():
+            if not marked:
+                app_logger.warning(f"Could not mark message {message_id} as read")
+
+    def _admit(self, filepath, name, sha256, size):
+        """Sniff a downloaded attachment; only plausible invoice documents go on to OCR"""
+        if self.ledger.is_blocked(sha256):
+            app_logger.info(f"Skipping blocklisted attachment: {name}")
+            return False
+
+        classification = classify_file(filepath)
+        if not classification.admitted:
+            app_logger.info(f"Skipping attachment {name}: {classification.reason}")
+            if classification.blocklist:
+                self.ledger.block_attachment(sha256, size, classification.reason)
+            return False
+        return True
+
+    @timed('fetch')
+    def fetch_emails(self, messages):
+        """Download attachments using batched Graph calls.
+
+        Attachment listings and read flags go through $batch (20 messages per
+        round trip) and attachment bodies download concurrently. Messages
+        with nothing to process are completed here; the rest once
+        ``record_processed`` has seen their last attachment.
+        """
+        graph = self.ms365.graph
+        message_ids = [message['id'] for message in messages]
+
+        attachments = graph.get_attachments(message_ids)
+        downloads = []
+        for message_id in message_ids:
+            for attachment in attachments[message_id]:
+                if not self._is_file_attachment(attachment):
+                    continue
+                # Calendar invites, office files and tiny inline images are never downloaded
+                reason = prefilter(attachment['name'], attachment.get('contentType'), attachment.get('size'))
+                if reason:
+                    app_logger.info(f"Skipping attachment {attachment['name']}: {reason}")
+                    continue
+                downloads.append((message_id, attachment))
+        paths = graph.download_attachments(downloads)
+
+        saved = {message_id: [] for message_id in message_ids}
+        failed = set()  # messages with a download that failed; retried on the next poll
+        hashes = {}
+        batch_hashes = set()
+        for (message_id, attachment), filepath in zip(downloads, paths):
+            if not filepath:
+                app_logger.warning(f"Could not download attachment {attachment['name']} of message {message_id}")
+                failed.add(message_id)
+                continue
+
+            sha256 = hash_file(filepath)
+            size = os.path.getsize(filepath)
+            if not self._admit(filepath, attachment['name'], sha256, size):
+                os.remove(filepath)
+                continue
+
+            # Skip content already processed, e.g. the same invoice sent twice
+            if sha256 in batch_hashes or self.ledger.has_attachment(sha256):
+                app_logger.info(f"Skipping duplicate attachment: {attachment['name']}")
+                os.remove(filepath)
+                continue
+            batch_hashes.add(sha256)
+
+            app_logger.info(f"Saved attachment: {attachment['name']}")
+            saved[message_id].append(filepath)
+            hashes[filepath] = (sha256, size, attachment['name'])
+
+        emails = []
+        for message in messages:
+            received = datetime.strptime(message['receivedDateTime'][:19], '%Y-%m-%dT%H:%M:%S')
+            email_data = {
+                'id': message['id'],
+                'subject': message.get('subject', ''),
+                'sender': message.get('from', {}).get('emailAddress', {}).get('address', ''),
+                'date': received.strftime('%Y-%m-%d %H:%M:%S'),
+                'body': message.get('bodyPreview', ''),
+                'attachments': saved[message['id']],
+                # Recorded in the ledger by record_processed once handled
+                'hashes': {path: hashes[path] for path in saved[message['id']]},
+                'pending': set(saved[message['id']]),
+                # A message missing a download is never completed this cycle
+                'incomplete': message['id'] in failed
+            }
+            emails.append(email_data)
+            app_logger.info(f"Found new email: {email_data['subject']}")
+
+        # Messages with nothing left to process are done; the rest wait for record_processed
+        self.complete_messages([
+            message_id for message_id in message_ids if not saved[message_id] and message_id not in failed
+        ])
+
+        return emails
+
+    def record_processed(self, email_data, filepath):
+        """Record an attachment as successfully processed.
+
+        Its hash then marks later copies as duplicates, and the message
+        itself is recorded once its last attachment is done.
+        """
+        sha256, size, name = email_data['hashes'][filepath]
+        self.ledger.record_attachment(sha256, email_data['id'], name, size)
+        with self._pending_lock:
+            email_data['pending'].discard(filepath)
+            done = not email_data['pending'] and not email_data.get('incomplete')
+        if done:
+            self.complete_messages([email_data['id']])
+
+    def fetch_email(self, message):
+        """Download a message's attachments and return its email data"""
+        return self.fetch_emails([message])[0]
+
+    def check_new_emails(self, finish=True):
+        """Check for new unread emails.
+
+        With ``finish=False`` the caller completes the returned messages and
+        then calls ``finish_sync`` itself.
+        """
+        try:
             new_emails = []
-            for message in messages:
-                if message.object_id not in self.processed_emails:
-                    try:
-                        attachments = []
-                        
-                        # Process attachments
-                        for attachment in message.attachments:
-                            filepath = self.save_attachment(attachment, message.object_id)
-                            if filepath:
-                                attachments.append(filepath)
-                        
-                        email_data = {
-                            'id': message.object_id,
-                            'subject': message.subject,
-                            'sender': message.sender.address,
-                            'date': message.received.strftime('%Y-%m-%d %H:%M:%S'),
-                            'body': message.body,
-                            'attachments': attachments
-                        }
-                        
-                        new_emails.append(email_data)
-                        self.processed_emails.add(message.object_id)
-                        app_logger.info(f"Found new email: {email_data['subject']}")
-                        
-                        # Mark as read
-                        message.mark_as_read()
-                        
-                    except Exception as e:
-                        app_logger.error(f"Error processing message {message.object_id}: {str(e)}")
+            messages = self.get_new_messages()
+            for start in range(0, len(messages), BATCH_LIMIT):
+                try:
+                    new_emails.extend(self.fetch_emails(messages[start:start + BATCH_LIMIT]))
+                except Exception as e:
+                    # Its messages stay unfinished, so finish_sync keeps the old cursor
+                    app_logger.error(f"Error processing messages: {str(e)}")
             
+            if finish:
+                self.finish_sync()
             if not new_emails:
                 app_logger.info("No new emails found")
             
@@ -92,7 +250,7 @@ class EmailMonitor:
             return []
 
     def __enter__(self):
-        self.connect()
+        self.ensure_connected()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -0,0 +1,201 @@
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from utils.config import config
+from utils.metrics import timed
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+BATCH_LIMIT = 20  # Graph accepts at most 20 requests per $batch
+ATTACHMENT_FIELDS = 'id,name,contentType,size,isInline'
+
+def retry_after(value: Optional[str], default: float = 5) -> float:
+    """Seconds to wait from a Retry-After header, which is delay-seconds or an HTTP-date"""
+    if value is None:
+        return default
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0)
+
+def attachment_path(target_dir: str, attachment: Dict[str, Any]) -> str:
+    """A unique local path for an attachment, whatever its name contains.
+
+    Only the final component of the sender-supplied name is kept, so it
+    cannot point outside ``target_dir``, and a random prefix keeps
+    same-named attachments from overwriting each other.
+    """
+    name = os.path.basename(str(attachment.get('name') or '').replace('\\', '/')).replace('\0', '')
+    if name in ('', '.', '..'):
+        name = 'attachment'
+    return os.path.join(target_dir, f"{uuid.uuid4().hex}_{name}")
+
+class GraphClient:
+    """Pooled Microsoft Graph client built on an authenticated MS365Auth.
+
+    Per-message calls are coalesced into $batch requests and attachment
+    bodies are streamed from the /$value endpoint straight to disk.
+    """
+
+    def __init__(self, auth, max_connections: Optional[int] = None):
+        self.auth = auth
+        self.user_id = config.MS365_USER
+        self.max_connections = max_connections or config.GRAPH_MAX_CONNECTIONS
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+        self.session.mount('https://', adapter)
+
+    def _headers(self) -> Dict[str, str]:
+        if not self.auth.ensure_token():
+            raise Exception("Failed to authenticate")
+        return {'Authorization': f'Bearer {self.auth.access_token}'}
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request, re-authenticating once on 401 and honouring 429 Retry-After"""
+        for attempt in range(3):
+            response = self.session.request(method, url, headers=self._headers(), **kwargs)
+            if response.status_code == 401 and attempt == 0:
+                # The cached token would just be rejected again
+                self.auth.authenticate(force_refresh=True)
+                continue
+            if response.status_code == 429:
+                time.sleep(retry_after(response.headers.get('Retry-After')))
+                continue
+            return response
+        return response
+
+    def batch(self, requests_list: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Run requests through /$batch in chunks of 20.
+
+        Each request is a dict with ``id``, ``method``, ``url`` (relative to
+        the Graph root) and optionally ``body``. Returns sub-responses by id.
+        """
+        responses = {}
+        for start in range(0, len(requests_list), BATCH_LIMIT):
+            chunk = requests_list[start:start + BATCH_LIMIT]
+            pending = {request['id']: request for request in chunk}
+
+            for attempt in range(3):
+                payload = []
+                for request in pending.values():
+                    entry = {'id': request['id'], 'method': request['method'], 'url': request['url']}
+                    if 'body' in request:
+                        entry['body'] = request['body']
+                        entry['headers'] = {'Content-Type': 'application/json'}
+                    payload.append(entry)
+
+                response = self.request('POST', f"{GRAPH_URL}/$batch", json={'requests': payload})
+                if response.status_code != 200:
+                    raise Exception(f"Batch request failed: {response.status_code} {response.text}")
+
+                delay = 0
+                for sub in response.json().get('responses', []):
+                    if sub.get('status') == 429 and attempt < 2:
+                        # Throttled sub-requests are retried in the next round
+                        delay = max(delay, retry_after(sub.get('headers', {}).get('Retry-After')))
+                        continue
+                    responses[sub['id']] = sub
+                    pending.pop(sub['id'], None)
+
+                if not pending:
+                    break
+                time.sleep(delay)
+
+        return responses
+
+    def get_attachments(self, message_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """List attachment metadata (without content) for many messages at once"""
+        requests_list = [
+            {
+                'id': str(index),
+                'method': 'GET',
+                'url': f"/users/{self.user_id}/messages/{message_id}/attachments?$select={ATTACHMENT_FIELDS}"
+            }
+            for index, message_id in enumerate(message_ids)
+        ]
+        responses = self.batch(requests_list)
+
+        attachments = {}
+        for index, message_id in enumerate(message_ids):
+            sub = responses.get(str(index), {})
+            if sub.get('status') == 200:
+                attachments[message_id] = sub.get('body', {}).get('value', [])
+            else:
+                print(f"Error getting attachments for {message_id}: {sub.get('status')}")
+                attachments[message_id] = []
+        return attachments
+
+    def mark_as_read(self, message_ids: List[str]) -> Dict[str, bool]:
+        """Mark many messages as read in as few round trips as possible"""
+        requests_list = [
+            {
+                'id': str(index),
+                'method': 'PATCH',
+                'url': f"/users/{self.user_id}/messages/{message_id}",
+                'body': {'isRead': True}
+            }
+            for index, message_id in enumerate(message_ids)
+        ]
+        responses = self.batch(requests_list)
+        return {
+            message_id: responses.get(str(index), {}).get('status') == 200
+            for index, message_id in enumerate(message_ids)
+        }
+
+    @timed('download')
+    def download_attachment(self, message_id: str, attachment: Dict[str, Any],
+                            target_dir: Optional[str] = None) -> Optional[str]:
+        """Stream an attachment's raw bytes to disk and return the file path"""
+        target_dir = target_dir or os.path.join(tempfile.gettempdir(), 'xero_automation')
+        os.makedirs(target_dir, exist_ok=True)
+
+        filepath = attachment_path(target_dir, attachment)
+        url = f"{GRAPH_URL}/users/{self.user_id}/messages/{message_id}/attachments/{attachment['id']}/$value"
+
+        response = self.request('GET', url, stream=True)
+        if response.status_code != 200:
+            print(f"Error downloading attachment {attachment['name']}: {response.status_code}")
+            response.close()
+            return None
+
+        temp_path = f"{filepath}.part"
+        try:
+            with response, open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=config.GRAPH_DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(temp_path, filepath)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return filepath
+
+    def download_attachments(self, items: List[Tuple[str, Dict[str, Any]]],
+                             target_dir: Optional[str] = None) -> List[Optional[str]]:
+        """Download (message_id, attachment) pairs concurrently; returns paths in order"""
+        def download(item):
+            message_id, attachment = item
+            try:
+                return self.download_attachment(message_id, attachment, target_dir)
+            except Exception as e:
+                print(f"Error downloading attachment {attachment.get('name')}: {str(e)}")
+                return None
+
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_connections, len(items))) as executor:
+            return list(executor.map(download, items))
@@ -0,0 +1,123 @@
+import json
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from utils.config import config
+from utils.logger import app_logger
+from .graph_client import GRAPH_URL
+
+class SubscriptionManager:
+    """Creates and renews the Graph change-notification subscription for the inbox.
+
+    The subscription id, expiry and client state are persisted under
+    STATE_PATH so a restart reuses (and renews) the existing subscription.
+    Without GRAPH_CLIENT_STATE, the generated secret is reused from there.
+    """
+
+    def __init__(self, auth, notification_url: Optional[str] = None,
+                 client_state: Optional[str] = None):
+        self.auth = auth
+        self.notification_url = notification_url or config.GRAPH_NOTIFICATION_URL
+        self.client_state = client_state or config.GRAPH_CLIENT_STATE
+        self.lifetime = timedelta(minutes=config.GRAPH_SUBSCRIPTION_MINUTES)
+        self.renew_margin = timedelta(minutes=config.GRAPH_SUBSCRIPTION_RENEW_MARGIN)
+        self.state_file = os.path.join(config.STATE_PATH, 'ms365_subscription.json')
+        self.subscription = self._load()
+        if not self.client_state:
+            # A fresh secret on every start would orphan the stored subscription
+            self.client_state = (self.subscription or {}).get('clientState') or secrets.token_urlsafe(24)
+
+    @property
+    def enabled(self) -> bool:
+        """Subscriptions need a public HTTPS endpoint Graph can reach"""
+        return bool(self.notification_url)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.subscription) and self._expires_at() > datetime.utcnow()
+
+    def _expires_at(self) -> datetime:
+        return datetime.strptime(self.subscription['expirationDateTime'][:19], '%Y-%m-%dT%H:%M:%S')
+
+    def _load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.state_file, 'r') as f:
+                subscription = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # A stored subscription is only valid with the secret it was created with
+        if self.client_state and subscription.get('clientState') != self.client_state:
+            return None
+        return subscription
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(self.subscription, f)
+        os.replace(temp_file, self.state_file)
+
+    def _expiration(self) -> str:
+        return (datetime.utcnow() + self.lifetime).strftime('%Y-%m-%dT%H:%M:%S.0000000Z')
+
+    def create(self) -> Dict[str, Any]:
+        """Subscribe to new messages in the monitored inbox"""
+        response = self.auth.graph.request('POST', f"{GRAPH_URL}/subscriptions", json={
+            'changeType': 'created',
+            'notificationUrl': self.notification_url,
+            'lifecycleNotificationUrl': self.notification_url,
+            'resource': f"users/{config.MS365_USER}/mailFolders('inbox')/messages",
+            'expirationDateTime': self._expiration(),
+            'clientState': self.client_state
+        })
+        if response.status_code != 201:
+            raise Exception(f"Failed to create subscription: {response.status_code} {response.text}")
+
+        self.subscription = response.json()
+        self.subscription['clientState'] = self.client_state
+        self._save()
+        app_logger.info(f"Created Graph subscription {self.subscription['id']}")
+        return self.subscription
+
+    def renew(self) -> Dict[str, Any]:
+        """Extend the current subscription, recreating it if Graph no longer knows it"""
+        response = self.auth.graph.request(
+            'PATCH',
+            f"{GRAPH_URL}/subscriptions/{self.subscription['id']}",
+            json={'expirationDateTime': self._expiration()}
+        )
+        if response.status_code == 404:
+            return self.create()
+        if response.status_code != 200:
+            raise Exception(f"Failed to renew subscription: {response.status_code} {response.text}")
+
+        self.subscription['expirationDateTime'] = response.json()['expirationDateTime']
+        self._save()
+        app_logger.info(f"Renewed Graph subscription {self.subscription['id']}")
+        return self.subscription
+
+    def ensure(self):
+        """Create the subscription if missing, renew it if it is about to expire"""
+        if not self.enabled:
+            return None
+        if not self.active:
+            return self.create()
+        if self._expires_at() - datetime.utcnow() < self.renew_margin:
+            return self.renew()
+        return self.subscription
+
+    def delete(self):
+        """Remove the subscription from Graph"""
+        if not self.subscription:
+            return
+        self.auth.graph.request('DELETE', f"{GRAPH_URL}/subscriptions/{self.subscription['id']}")
+        self.subscription = None
+        try:
+            os.remove(self.state_file)
+        except OSError:
+            pass
+
+    def verify(self, notification: Dict[str, Any]) -> bool:
+        """Check a notification carries our client state"""
+        return secrets.compare_digest(notification.get('clientState') or '', self.client_state)
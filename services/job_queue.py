@@ -0,0 +1,233 @@
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import and_, or_, select, update, func
+from models.database.base import SessionLocal
+from models.database.models import ProcessingJob
+from models.database.repository import JobRepository
+from utils.config import config
+
+PENDING = 'pending'
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+@dataclass
+class Job:
+    """A job leased to a worker"""
+    id: str
+    source: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    worker_id: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+class JobQueue:
+    """Persistent work queue on the processing_jobs table.
+
+    Workers claim jobs with a lease (visibility timeout). A job whose lease
+    expires without being completed becomes claimable again, so a crashed
+    worker never loses work. Claims are compare-and-set UPDATEs, so any
+    number of worker processes can share one database.
+    """
+
+    def __init__(self, session_factory=None, visibility_timeout: Optional[int] = None,
+                 max_attempts: Optional[int] = None, backoff: Optional[int] = None,
+                 backoff_max: Optional[int] = None):
+        self.session_factory = session_factory or SessionLocal
+        self.visibility_timeout = visibility_timeout or config.JOB_VISIBILITY_TIMEOUT
+        self.max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+        self.backoff = backoff if backoff is not None else config.JOB_RETRY_BACKOFF
+        self.backoff_max = backoff_max or config.JOB_RETRY_BACKOFF_MAX
+        self._next_sweep = 0.0  # monotonic time of the next _fail_abandoned pass
+
+    def enqueue(self, source: str, payload: Dict[str, Any], job_id: Optional[str] = None,
+                delay: int = 0, metadata: Optional[Dict[str, Any]] = None) -> str:
+        """Add a job to the queue and return its id"""
+        now = datetime.utcnow()
+        job_id = job_id or str(uuid.uuid4())
+        job = ProcessingJob(
+            id=job_id,
+            source=source,
+            status=PENDING,
+            payload=payload,
+            job_metadata=metadata,
+            attempts=0,
+            max_attempts=self.max_attempts,
+            available_at=now + timedelta(seconds=delay),
+            created_at=now,
+            updated_at=now
+        )
+        with self.session_factory() as session:
+            session.add(job)
+            session.commit()
+        return job_id
+
+    def enqueue_many(self, source: str, jobs: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """Queue many (job_id, payload) pairs in a few bulk INSERTs.
+
+        Ids that are already queued are skipped; returns the number added.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                'id': job_id,
+                'source': source,
+                'status': PENDING,
+                'payload': payload,
+                'attempts': 0,
+                'max_attempts': self.max_attempts,
+                'available_at': now,
+                'created_at': now,
+                'updated_at': now
+            }
+            for job_id, payload in jobs
+        ]
+        return JobRepository(self.session_factory).insert_many(rows)
+
+    def _claimable(self, now: datetime):
+        """Condition for jobs a worker may take: due pending jobs or expired leases"""
+        return and_(
+            ProcessingJob.attempts < ProcessingJob.max_attempts,
+            or_(
+                # NULL: rows written before available_at existed are due straight away
+                and_(ProcessingJob.status == PENDING,
+                     or_(ProcessingJob.available_at <= now, ProcessingJob.available_at.is_(None))),
+                and_(ProcessingJob.status == PROCESSING, ProcessingJob.lease_expires_at < now)
+            )
+        )
+
+    def _fail_abandoned(self, session, now: datetime):
+        """Mark expired leases that have used up their attempts as failed.
+
+        Such jobs are never claimable, so this only tidies their status; it
+        runs at most once per visibility timeout rather than on every poll.
+        """
+        if time.monotonic() < self._next_sweep:
+            return
+        self._next_sweep = time.monotonic() + self.visibility_timeout
+        session.execute(
+            update(ProcessingJob)
+            .where(
+                ProcessingJob.status == PROCESSING,
+                ProcessingJob.lease_expires_at < now,
+                ProcessingJob.attempts >= ProcessingJob.max_attempts
+            )
+            .values(
+                status=FAILED,
+                locked_by=None,
+                lease_expires_at=None,
+                error_message='Lease expired after final attempt',
+                updated_at=now
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def claim(self, worker_id: str, sources: Optional[List[str]] = None,
+              batch: int = 5) -> Optional[Job]:
+        """Lease the oldest claimable job, or return None if there is none"""
+        with self.session_factory() as session:
+            now = datetime.utcnow()
+            self._fail_abandoned(session, now)
+            session.commit()
+
+            query = select(ProcessingJob.id).where(self._claimable(now))
+            if sources:
+                query = query.where(ProcessingJob.source.in_(sources))
+            candidates = session.execute(
+                query.order_by(ProcessingJob.available_at).limit(batch)
+            ).scalars().all()
+
+            for job_id in candidates:
+                # Re-check the claim condition in the UPDATE so only one worker wins
+                result = session.execute(
+                    update(ProcessingJob)
+                    .where(ProcessingJob.id == job_id, self._claimable(now))
+                    .values(
+                        status=PROCESSING,
+                        locked_by=worker_id,
+                        lease_expires_at=now + timedelta(seconds=self.visibility_timeout),
+                        attempts=ProcessingJob.attempts + 1,
+                        updated_at=now
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                session.commit()
+                if result.rowcount == 1:
+                    job = session.get(ProcessingJob, job_id, populate_existing=True)
+                    return Job(
+                        id=job.id,
+                        source=job.source,
+                        payload=job.payload or {},
+                        attempts=job.attempts,
+                        max_attempts=job.max_attempts,
+                        worker_id=worker_id,
+                        metadata=job.job_metadata or {}
+                    )
+
+        return None
+
+    def _update_leased(self, job: Job, **values) -> bool:
+        """Update a job only while ``job.worker_id`` still holds its lease"""
+        values['updated_at'] = datetime.utcnow()
+        with self.session_factory() as session:
+            result = session.execute(
+                update(ProcessingJob)
+                .where(
+                    ProcessingJob.id == job.id,
+                    ProcessingJob.status == PROCESSING,
+                    ProcessingJob.locked_by == job.worker_id
+                )
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def heartbeat(self, job: Job) -> bool:
+        """Extend the lease on a long-running job"""
+        return self._update_leased(
+            job,
+            lease_expires_at=datetime.utcnow() + timedelta(seconds=self.visibility_timeout)
+        )
+
+    def complete(self, job: Job) -> bool:
+        """Mark a leased job as completed"""
+        return self._update_leased(
+            job, status=COMPLETED, locked_by=None, lease_expires_at=None, error_message=None
+        )
+
+    def retry_delay(self, attempts: int) -> float:
+        """Exponential backoff with jitter for the given attempt number"""
+        delay = min(self.backoff * (2 ** max(attempts - 1, 0)), self.backoff_max)
+        return delay + random.uniform(0, delay * 0.1)
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Record a failed attempt; the job is retried later until attempts run out"""
+        if job.attempts >= job.max_attempts:
+            return self._update_leased(
+                job, status=FAILED, locked_by=None, lease_expires_at=None, error_message=error
+            )
+
+        return self._update_leased(
+            job,
+            status=PENDING,
+            locked_by=None,
+            lease_expires_at=None,
+            error_message=error,
+            available_at=datetime.utcnow() + timedelta(seconds=self.retry_delay(job.attempts))
+        )
+
+    def get_stats(self) -> Dict[str, int]:
+        """Count jobs by status"""
+        with self.session_factory() as session:
+            rows = session.execute(
+                select(ProcessingJob.status, func.count()).group_by(ProcessingJob.status)
+            ).all()
+        stats = {PENDING: 0, PROCESSING: 0, COMPLETED: 0, FAILED: 0}
+        stats.update({status: count for status, count in rows})
+        return stats
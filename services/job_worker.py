@@ -0,0 +1,76 @@
+import os
+import socket
+import threading
+from typing import Any, Callable, List, Optional
+from services.job_queue import Job, JobQueue
+from utils.logger import app_logger
+
+class JobWorker:
+    """Pulls jobs from the JobQueue and runs them through a handler.
+
+    The lease is renewed in the background while the handler runs, so long
+    OCR jobs are not reclaimed by other workers mid-flight. ``on_complete``
+    gets the handler's result only once the job is marked completed, i.e.
+    while this worker still held the lease.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Job], Any],
+                 sources: Optional[List[str]] = None, worker_id: Optional[str] = None,
+                 poll_interval: float = 5, on_complete: Optional[Callable[[Job, Any], None]] = None):
+        self.queue = queue
+        self.handler = handler
+        self.on_complete = on_complete
+        self.sources = sources
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _keep_lease(self, job: Job, done: threading.Event):
+        """Heartbeat the lease at a third of the visibility timeout"""
+        interval = max(self.queue.visibility_timeout / 3, 1)
+        while not done.wait(interval):
+            if not self.queue.heartbeat(job):
+                app_logger.warning(f"Lost lease on job {job.id}")
+                return
+
+    def run_once(self) -> bool:
+        """Claim and process a single job. Returns False if the queue was empty."""
+        job = self.queue.claim(self.worker_id, sources=self.sources)
+        if not job:
+            return False
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._keep_lease, args=(job, done), daemon=True)
+        heartbeat.start()
+        completed = False
+        try:
+            result = self.handler(job)
+            completed = self.queue.complete(job)
+            if not completed:
+                # Reclaimed by another worker, whose run records the outcome instead
+                app_logger.warning(f"Lost lease on job {job.id} before completing it; discarding its result")
+        except Exception as e:
+            app_logger.error(f"Job {job.id} failed (attempt {job.attempts}/{job.max_attempts}): {str(e)}")
+            self.queue.fail(job, str(e))
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if completed and self.on_complete:
+            self.on_complete(job, result)
+        return True
+
+    def run(self):
+        """Process jobs until stopped"""
+        app_logger.info(f"Worker {self.worker_id} started")
+        while not self.stop_event.is_set():
+            try:
+                if not self.run_once():
+                    self.stop_event.wait(self.poll_interval)
+            except Exception as e:
+                app_logger.error(f"Worker {self.worker_id} error: {str(e)}")
+                self.stop_event.wait(self.poll_interval)
+        app_logger.info(f"Worker {self.worker_id} stopped")
@@ -0,0 +1,180 @@
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from utils.config import config
+
+# SQLite caps bound parameters per statement; stay well below it
+_CHUNK = 500
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file, hashed straight from a memory map"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return hashlib.sha256(data).hexdigest()
+
+class ProcessedLedger:
+    """On-disk record of processed message ids and attachment hashes.
+
+    Backed by a small SQLite database with primary-key lookups, so
+    deduplication survives restarts and stays fast with hundreds of
+    thousands of entries.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or config.LEDGER_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS processed_messages ('
+            ' message_id TEXT PRIMARY KEY,'
+            ' processed_at REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS attachment_hashes ('
+            ' sha256 TEXT PRIMARY KEY,'
+            ' message_id TEXT,'
+            ' filename TEXT,'
+            ' size INTEGER,'
+            ' first_seen REAL NOT NULL,'
+            ' seen_count INTEGER NOT NULL DEFAULT 1'
+            ') WITHOUT ROWID'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS attachment_blocklist ('
+            ' sha256 TEXT PRIMARY KEY,'
+            ' size INTEGER,'
+            ' reason TEXT,'
+            ' blocked_at REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS message_attempts ('
+            ' message_id TEXT PRIMARY KEY,'
+            ' attempts INTEGER NOT NULL'
+            ') WITHOUT ROWID'
+        )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def has_message(self, message_id: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM processed_messages WHERE message_id = ?', (message_id,)
+            ).fetchone()
+        return row is not None
+
+    def filter_new(self, message_ids: Iterable[str]) -> List[str]:
+        """Return the ids that have not been processed, preserving order"""
+        message_ids = list(message_ids)
+        seen = set()
+        with self._lock:
+            for start in range(0, len(message_ids), _CHUNK):
+                chunk = message_ids[start:start + _CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                seen.update(row[0] for row in self.conn.execute(
+                    f'SELECT message_id FROM processed_messages WHERE message_id IN ({placeholders})',
+                    chunk
+                ))
+        return [message_id for message_id in message_ids if message_id not in seen]
+
+    def add_messages(self, message_ids: Iterable[str]):
+        """Record messages as processed"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO processed_messages (message_id, processed_at) VALUES (?, ?)',
+                    [(message_id, now) for message_id in message_ids]
+                )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def add_message(self, message_id: str):
+        self.add_messages([message_id])
+
+    def record_attempts(self, message_ids: Iterable[str]) -> Dict[str, int]:
+        """Count one more failed attempt for each message and return the totals"""
+        message_ids = list(message_ids)
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.executemany(
+                    'INSERT INTO message_attempts (message_id, attempts) VALUES (?, 1)'
+                    ' ON CONFLICT(message_id) DO UPDATE SET attempts = attempts + 1',
+                    [(message_id,) for message_id in message_ids]
+                )
+                attempts = {
+                    message_id: self.conn.execute(
+                        'SELECT attempts FROM message_attempts WHERE message_id = ?', (message_id,)
+                    ).fetchone()[0]
+                    for message_id in message_ids
+                }
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return attempts
+
+    def has_attachment(self, sha256: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM attachment_hashes WHERE sha256 = ?', (sha256,)
+            ).fetchone()
+        return row is not None
+
+    def record_attachment(self, sha256: str, message_id: Optional[str] = None,
+                          filename: Optional[str] = None, size: Optional[int] = None) -> int:
+        """Record a processed attachment's content hash and return how often it has been seen.
+
+        Call this only once the attachment was processed successfully; a
+        recorded hash makes later copies of the content count as duplicates.
+        """
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                self.conn.execute(
+                    'INSERT INTO attachment_hashes (sha256, message_id, filename, size, first_seen)'
+                    ' VALUES (?, ?, ?, ?, ?)'
+                    ' ON CONFLICT(sha256) DO UPDATE SET seen_count = seen_count + 1',
+                    (sha256, message_id, filename, size, time.time())
+                )
+                row = self.conn.execute(
+                    'SELECT seen_count FROM attachment_hashes WHERE sha256 = ?', (sha256,)
+                ).fetchone()
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return row[0]
+
+    def block_attachment(self, sha256: str, size: Optional[int] = None, reason: Optional[str] = None):
+        """Reject this content on sight from now on, e.g. a recurring signature logo"""
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO attachment_blocklist (sha256, size, reason, blocked_at)'
+                ' VALUES (?, ?, ?, ?)',
+                (sha256, size, reason, time.time())
+            )
+
+    def is_blocked(self, sha256: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM attachment_blocklist WHERE sha256 = ?', (sha256,)
+            ).fetchone()
+        return row is not None
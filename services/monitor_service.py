@@ -1,10 +1,19 @@
 import time
+import uuid
 from datetime import datetime
 from .email_monitor import EmailMonitor
+from .pipeline import Pipeline, Stage
+from .graph_client import BATCH_LIMIT
+from processors.attachment_classifier import classify, classify_file
 from processors.ocr import OCRProcessor
 from processors.text_analyzer import TextAnalyzer
 from integration.xero.xero_client import XeroClient
+from models.database.repository import DocumentRepository
+from utils.config import config
 from utils.logger import app_logger
+from utils.metrics import documents_total, span
+from utils.scheduler import AdaptivePollScheduler
+from utils.storage import Storage
 import os
 
 class MonitorService:
@@ -13,6 +22,79 @@ class MonitorService:
         self.ocr_processor = OCRProcessor()
         self.text_analyzer = TextAnalyzer()
         self.xero_client = None  # Will initialize during processing
+        self.storage = Storage()
+        self.documents = DocumentRepository()
+        self.pipeline = self._build_pipeline()
+        self.scheduler = AdaptivePollScheduler()
+        self.last_processed = 0  # messages completed by the last process_emails
+
+    def _build_pipeline(self):
+        """Build the fetch -> OCR -> analyze -> Xero pipeline.
+
+        Tesseract runs as a subprocess and OpenCV releases the GIL, so OCR
+        threads use real cores; spaCy does not, so analysis stays narrow.
+        """
+        queue_size = config.PIPELINE_QUEUE_SIZE
+        return Pipeline([
+            Stage('fetch', self._fetch_stage, config.PIPELINE_FETCH_WORKERS, queue_size, fan_out=True),
+            Stage('ocr', self._ocr_stage, config.PIPELINE_OCR_WORKERS, queue_size),
+            Stage('analyze', self._analyze_stage, config.PIPELINE_ANALYZE_WORKERS, queue_size),
+            Stage('xero', self._xero_stage, config.PIPELINE_XERO_WORKERS, queue_size)
+        ])
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _discard(self, item):
+        """Remove an item's temporary attachment file"""
+        self._remove(item['attachment'])
+
+    def _fetch_stage(self, item):
+        """Download a batch of messages' attachments; yields one item per attachment"""
+        items = []
+        for email_data in item['monitor'].fetch_emails(item['messages']):
+            app_logger.info(f"Processing email: {email_data['subject']}")
+            items.extend({'email': email_data, 'attachment': path} for path in email_data['attachments'])
+        return items
+
+    def _ocr_stage(self, item):
+        try:
+            with open(item['attachment'], 'rb') as f:
+                content = f.read()
+
+            item['ocr_results'] = self._run_ocr(os.path.basename(item['attachment']), content)
+            return item
+        except Exception:
+            self._discard(item)
+            raise
+
+    def _analyze_stage(self, item):
+        try:
+            item['analysis_results'] = self.text_analyzer.process_text(item['ocr_results']['text'])
+            return item
+        except Exception:
+            self._discard(item)
+            raise
+
+    def _xero_stage(self, item):
+        try:
+            invoice = self.create_xero_invoice(item['analysis_results'], item['email'])
+            documents_total.inc(source='email', outcome='invoiced' if invoice else 'no_invoice')
+            if not invoice:
+                # Counted as a stage failure, so the message is retried next poll
+                raise RuntimeError(f"Failed to create Xero invoice for {os.path.basename(item['attachment'])}")
+            app_logger.info(f"Created invoice: {invoice.get('InvoiceID')}")
+            self.email_monitor.record_processed(item['email'], item['attachment'])
+        finally:
+            self._discard(item)
+
+    def get_pipeline_metrics(self):
+        """Per-stage throughput and utilization"""
+        return self.pipeline.get_metrics()
 
     def initialize_xero(self):
         """Initialize Xero client if not already initialized"""
@@ -20,42 +102,66 @@ class MonitorService:
             self.xero_client = XeroClient()
             self.xero_client.authenticate()
 
+    def _run_ocr(self, filename, content):
+        """OCR content according to its sniffed type rather than its extension"""
+        classification = classify(content)
+        if not classification.admitted:
+            raise ValueError(f"Not an invoice document ({filename}): {classification.reason}")
+
+        if classification.kind == 'pdf':
+            return self.ocr_processor.process_pdf(content)
+        return self.ocr_processor.process_image(content)
+
+    def process_content(self, filename, content):
+        """OCR and analyze a single attachment's content"""
+        ocr_results = self._run_ocr(filename, content)
+
+        # Analyze extracted text
+        analysis_results = self.text_analyzer.process_text(ocr_results['text'])
+
+        return {
+            'filename': filename,
+            'ocr_results': ocr_results,
+            'analysis_results': analysis_results
+        }
+
     def process_attachments(self, attachments):
         """Process email attachments"""
         results = []
         for attachment in attachments:
             try:
+                classification = classify_file(attachment)
+                if not classification.admitted:
+                    app_logger.info(f"Skipping attachment {attachment}: {classification.reason}")
+                    continue
+
                 # Read attachment
                 with open(attachment, 'rb') as f:
                     content = f.read()
 
-                # Process based on file type
-                file_ext = os.path.splitext(attachment)[1].lower()
-                if file_ext == '.pdf':
-                    ocr_results = self.ocr_processor.process_pdf(content)
-                else:
-                    ocr_results = self.ocr_processor.process_image(content)
-
-                # Analyze extracted text
-                analysis_results = self.text_analyzer.process_text(ocr_results['text'])
-                
-                results.append({
-                    'filename': os.path.basename(attachment),
-                    'ocr_results': ocr_results,
-                    'analysis_results': analysis_results
-                })
+                results.append(self.process_content(os.path.basename(attachment), content))
 
             except Exception as e:
                 app_logger.error(f"Error processing attachment {attachment}: {str(e)}")
 
         return results
 
-    def create_xero_invoice(self, analysis_results, email_data):
-        """Create invoice in Xero based on analysis results"""
+    def create_xero_invoice(self, analysis_results, email_data, document_id=None):
+        """Create invoice in Xero based on analysis results.
+
+        With a ``document_id`` the invoice's Reference is that id, and an
+        existing invoice with it is returned instead of creating another.
+        """
         try:
             # Ensure Xero is initialized
             self.initialize_xero()
 
+            if document_id:
+                existing = self.xero_client.find_invoice(document_id)
+                if existing:
+                    app_logger.info(f"Invoice for document {document_id} already exists: {existing.get('InvoiceID')}")
+                    return existing
+
             # Extract invoice data
             patterns = analysis_results.get('patterns', {})
             entities = analysis_results.get('entities', {})
@@ -88,8 +194,12 @@ class MonitorService:
                 "Reference": patterns.get('invoice_number', [''])[0],
                 "Status": "DRAFT"
             }
+            if document_id:
+                invoice_data["InvoiceNumber"] = invoice_data["Reference"]
+                invoice_data["Reference"] = document_id
 
-            response = self.xero_client.create_invoice(invoice_data)
+            with span('xero'):
+                response = self.xero_client.create_invoice(invoice_data)
             return response
 
         except Exception as e:
@@ -97,53 +207,218 @@ class MonitorService:
             return None
 
     def process_emails(self):
-        """Process new emails"""
+        """Process new emails. Returns the number of emails found."""
+        new_messages = []
+        self.last_processed = 0
         try:
-            # Use context manager for email connection
-            with EmailMonitor() as email_monitor:
-                app_logger.info("Checking for new emails...")
-                new_emails = email_monitor.check_new_emails()
+            # Reuse the long-lived connection; it only re-authenticates when needed
+            email_monitor = self.email_monitor
+            email_monitor.ensure_connected()
+
+            app_logger.info("Checking for new emails...")
+            new_messages = email_monitor.get_new_messages()
+            
+            if new_messages:
+                app_logger.info(f"Found {len(new_messages)} new emails")
+                
+                # Stages overlap: downloads and Xero calls run while other attachments are OCR'd
+                self.pipeline.start()
+                # Feed messages in Graph $batch-sized groups
+                for start in range(0, len(new_messages), BATCH_LIMIT):
+                    self.pipeline.put({
+                        'monitor': email_monitor,
+                        'messages': new_messages[start:start + BATCH_LIMIT]
+                    })
+                self.pipeline.join()
                 
-                if new_emails:
-                    app_logger.info(f"Found {len(new_emails)} new emails")
-                    
-                    for email_data in new_emails:
-                        app_logger.info(f"Processing email: {email_data['subject']}")
-                        
-                        # Process attachments
-                        if email_data['attachments']:
-                            attachment_results = self.process_attachments(email_data['attachments'])
-                            
-                            # Create invoices based on results
-                            for result in attachment_results:
-                                invoice = self.create_xero_invoice(
-                                    result['analysis_results'],
-                                    email_data
-                                )
-                                
-                                if invoice:
-                                    app_logger.info(f"Created invoice: {invoice.get('InvoiceID')}")
-                                    
-                            # Clean up temporary files
-                            for attachment in email_data['attachments']:
-                                try:
-                                    os.remove(attachment)
-                                except:
-                                    pass
-                else:
-                    app_logger.info("No new emails found")
+                app_logger.info(f"Pipeline metrics: {self.get_pipeline_metrics()}")
+            else:
+                app_logger.info("No new emails found")
+            
+            # A message with a failed item is not completed, so the old sync state delivers it again
+            unfinished = email_monitor.ledger.filter_new(message['id'] for message in new_messages)
+            self.last_processed = len(new_messages) - len(unfinished)
+            email_monitor.finish_sync()
 
         except Exception as e:
             app_logger.error(f"Error in process_emails: {str(e)}")
+            # Reconnect on the next cycle in case the session went bad
+            self.email_monitor.reset()
+
+        return len(new_messages)
+
+    def enqueue_emails(self, job_queue):
+        """Fetch new emails and queue each attachment for the worker processes.
+
+        Attachments are copied into storage so worker processes on this host
+        can pick them up; the storage index and ledger are local SQLite
+        files, so workers cannot run on other machines. A message with an
+        attachment that could not be stored or queued is left unfinished:
+        it stays unread and the sync cursor is held, so the next poll
+        downloads it again. Returns the number of jobs queued.
+        """
+        jobs = []
+        local_files = {}
+        incomplete = set()  # emails to fetch again on the next poll
+        try:
+            self.email_monitor.ensure_connected()
+            app_logger.info("Checking for new emails...")
+            new_emails = self.email_monitor.check_new_emails(finish=False)
+
+            jobs, local_files = self._store_attachments(new_emails, incomplete)
+
+        except Exception as e:
+            app_logger.error(f"Error in enqueue_emails: {str(e)}")
+            self.email_monitor.reset()
+
+        queued_ids = self._enqueue_jobs(job_queue, jobs) if jobs else set()
+        for document_id, payload in jobs:
+            if document_id not in queued_ids:
+                app_logger.error(f"Could not queue document {document_id}; its message is fetched again next poll")
+                incomplete.add(payload['email']['id'])
+                try:
+                    self.storage.delete_document(document_id)
+                except Exception as e:
+                    app_logger.error(f"Error removing unqueued document {document_id}: {str(e)}")
+            self._remove(local_files[document_id])
+
+        # Queued jobs are retried by the workers, so their messages are handled
+        handled = {payload['email']['id'] for _, payload in jobs} - incomplete
+        self.email_monitor.complete_messages(handled)
+        self.email_monitor.finish_sync()
+        if queued_ids:
+            app_logger.info(f"Queued {len(queued_ids)} attachments for processing")
+        return len(queued_ids)
+
+    def _store_attachments(self, new_emails, incomplete):
+        """Copy the emails' attachments into storage as one batch.
+
+        Returns the jobs to queue and, by document id, the downloaded files
+        to remove once queued. Emails with an attachment that could not be
+        stored are added to ``incomplete``.
+        """
+        jobs = []
+        local_files = {}
+        try:
+            # One round of directory syncs for the whole poll cycle, not one per document
+            with self.storage.batch():
+                for email_data in new_emails:
+                    email_info = {
+                        'id': email_data['id'],
+                        'subject': email_data['subject'],
+                        'sender': email_data['sender']
+                    }
+                    if email_data.get('incomplete'):
+                        incomplete.add(email_data['id'])
+                    for attachment in email_data['attachments']:
+                        try:
+                            with open(attachment, 'rb') as f:
+                                content = f.read()
+
+                            document_id = str(uuid.uuid4())
+                            filename = os.path.basename(attachment)
+                            self.storage.save_document(document_id, content, {
+                                'filename': filename,
+                                'source': 'email',
+                                'email': email_info
+                            })
+                            sha256, size, name = email_data['hashes'][attachment]
+                            jobs.append((document_id, {
+                                'document_id': document_id,
+                                'filename': filename,
+                                'email': email_info,
+                                'attachment': {'sha256': sha256, 'size': size, 'name': name}
+                            }))
+                            local_files[document_id] = attachment
+
+                        except Exception as e:
+                            # The message stays unread and is downloaded again next poll
+                            app_logger.error(f"Error storing attachment {attachment}: {str(e)}")
+                            incomplete.add(email_data['id'])
+                            self._remove(attachment)
+
+        except Exception as e:
+            # The batch commit failed, so none of its documents were stored
+            app_logger.error(f"Error storing attachments: {str(e)}")
+            for document_id, payload in jobs:
+                incomplete.add(payload['email']['id'])
+                self._remove(local_files[document_id])
+            return [], {}
+
+        return jobs, local_files
+
+    def _enqueue_jobs(self, job_queue, jobs):
+        """Queue jobs with one bulk insert, falling back to one insert per job.
+
+        Returns the ids that are in the queue.
+        """
+        try:
+            job_queue.enqueue_many('email', jobs)
+            return {document_id for document_id, _ in jobs}
+        except Exception as e:
+            app_logger.error(f"Bulk queueing of {len(jobs)} attachments failed, queueing one by one: {str(e)}")
+
+        queued = set()
+        for document_id, payload in jobs:
+            try:
+                job_queue.enqueue('email', payload, job_id=document_id)
+                queued.add(document_id)
+            except Exception as e:
+                app_logger.error(f"Error queueing document {document_id}: {str(e)}")
+        return queued
+
+    def process_job(self, job):
+        """Process one queued attachment; raising marks the job for retry.
+
+        The result is recorded in processed_documents, whose typed columns
+        are filled from it. Only queued documents get a row: the in-process
+        pipeline (``process_emails``) keeps no stored document to point at.
+        """
+        # Decoders read the mapped blob directly instead of a copy of it
+        with self.storage.open_document(job.payload['document_id']) as content:
+            if job.payload.get('content_type') == 'email':
+                # A message body handed over by the API when its OCR pool was full
+                result = {'analysis_results': self.text_analyzer.process_text(bytes(content).decode())}
+            else:
+                result = self.process_content(job.payload['filename'], content)
+
+        # Keyed on the document, so a retry finds an invoice an earlier attempt created
+        invoice = self.create_xero_invoice(result['analysis_results'], job.payload['email'],
+                                           document_id=job.payload['document_id'])
+        documents_total.inc(source='email', outcome='invoiced' if invoice else 'no_invoice')
+        if not invoice:
+            raise RuntimeError(f"Failed to create Xero invoice for {job.payload['filename']}")
+
+        app_logger.info(f"Created invoice: {invoice.get('InvoiceID')}")
+        # Keyed on the document, so a retried job overwrites rather than duplicates
+        self.documents.upsert_many([{
+            'id': job.payload['document_id'],
+            'job_id': job.id,
+            'document_type': 'invoice',
+            'storage_path': job.payload['document_id'],
+            'processed_content': result,
+            'xero_reference': invoice.get('InvoiceID')
+        }])
+        return invoice
+
+    def finish_job(self, job, invoice):
+        """Record a completed job's attachment; only called while the worker held its lease"""
+        attachment = job.payload.get('attachment')
+        if attachment:
+            self.email_monitor.ledger.record_attachment(
+                attachment['sha256'], job.payload['email']['id'], attachment['name'], attachment['size']
+            )
 
     def run(self, interval=300):  # 5 minutes default interval
         """Run the monitoring service"""
         app_logger.info("Starting email monitoring service...")
+        self.scheduler = AdaptivePollScheduler(base_interval=interval)
         
         while True:
             try:
-                self.process_emails()
-                time.sleep(interval)
+                found = self.process_emails()
+                self.scheduler.record(found)
+                time.sleep(self.scheduler.next_delay())
                 
             except KeyboardInterrupt:
                 app_logger.info("Stopping email monitoring service...")
@@ -2,9 +2,15 @@ import msal
 import requests
 from utils.config import config
 import base64
+import json
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import tempfile
+import threading
+import time
+from .graph_client import GraphClient, GRAPH_URL, attachment_path
+
+MESSAGE_FIELDS = 'id,subject,from,receivedDateTime,hasAttachments,isRead,bodyPreview'
 
 class MS365Auth:
     def __init__(self):
@@ -14,17 +20,63 @@ class MS365Auth:
         self.authority = f"https://login.microsoftonline.com/{self.tenant_id}"
         self.scope = ["https://graph.microsoft.com/.default"]
         
+        self.delta_state_file = os.path.join(config.STATE_PATH, 'ms365_delta.json')
+        self._pending_delta_link = None
+        self._graph = None
+        
+        # Serializable token cache persisted to disk, so restarts reuse a valid token
+        self.token_cache_file = config.MS365_TOKEN_CACHE_PATH
+        self.token_cache = msal.SerializableTokenCache()
+        self._load_token_cache()
+        self.token_expires_at = 0
+        self._token_lock = threading.Lock()
+        
         # Initialize MSAL application
         self.app = msal.ConfidentialClientApplication(
             client_id=self.client_id,
             client_credential=self.client_secret,
-            authority=self.authority
+            authority=self.authority,
+            token_cache=self.token_cache
         )
 
-    def authenticate(self):
+    def _load_token_cache(self):
+        try:
+            with open(self.token_cache_file, 'r') as f:
+                self.token_cache.deserialize(f.read())
+        except (OSError, ValueError):
+            pass
+
+    def _save_token_cache(self):
+        if not self.token_cache.has_state_changed:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.token_cache_file)), exist_ok=True)
+        temp_file = f"{self.token_cache_file}.tmp"
+        # The cache holds bearer tokens; keep it private to the service user
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.token_cache.serialize())
+        os.replace(temp_file, self.token_cache_file)
+        self.token_cache.has_state_changed = False
+
+    @property
+    def graph(self):
+        """Pooled Graph client for batched calls and streamed downloads"""
+        if self._graph is None:
+            self._graph = GraphClient(self)
+        return self._graph
+
+    def authenticate(self, force_refresh=False):
+        """Acquire a token, from the cache unless ``force_refresh`` (e.g. after a 401)"""
         try:
             print("\nAttempting to acquire token...")
-            result = self.app.acquire_token_silent(self.scope, account=None)
+            result = None
+            if force_refresh:
+                # Graph rejected the cached token; make MSAL request a new one
+                for token in list(self.token_cache.find(msal.TokenCache.CredentialType.ACCESS_TOKEN)):
+                    self.token_cache.remove_at(token)
+                self.token_expires_at = 0
+            else:
+                result = self.app.acquire_token_silent(self.scope, account=None)
             
             if not result:
                 print("No token in cache, acquiring new token...")
@@ -33,6 +85,8 @@ class MS365Auth:
             if "access_token" in result:
                 print("✓ Token acquired successfully!")
                 self.access_token = result['access_token']
+                self.token_expires_at = time.time() + int(result.get('expires_in', 3600))
+                self._save_token_cache()
                 return True
             else:
                 print(f"Error acquiring token: {result.get('error')}")
@@ -43,12 +97,24 @@ class MS365Auth:
             print(f"Authentication error: {str(e)}")
             return False
 
+    def ensure_token(self, margin=300):
+        """Return True once a token valid for at least ``margin`` seconds is held.
+
+        Only talks to MSAL when the current token is missing or about to
+        expire, so regular polls skip token acquisition entirely.
+        """
+        if hasattr(self, 'access_token') and time.time() < self.token_expires_at - margin:
+            return True
+        with self._token_lock:
+            if hasattr(self, 'access_token') and time.time() < self.token_expires_at - margin:
+                return True
+            return self.authenticate()
+
     def get_messages_with_attachments(self, limit=10):
         """Get messages that have attachments"""
         try:
-            if not hasattr(self, 'access_token'):
-                if not self.authenticate():
-                    raise Exception("Failed to authenticate")
+            if not self.ensure_token():
+                raise Exception("Failed to authenticate")
             
             headers = {
                 'Authorization': f'Bearer {self.access_token}',
@@ -59,9 +125,11 @@ class MS365Auth:
             user_id = config.MS365_USER
             url = f"https://graph.microsoft.com/v1.0/users/{user_id}/messages"
             
+            # Filter server-side; Graph requires the $orderby property to lead the $filter
             params = {
-                '$top': 50,  # Get more messages to filter from
+                '$top': limit,
                 '$orderby': 'receivedDateTime desc',
+                '$filter': 'receivedDateTime ge 1900-01-01T00:00:00Z and hasAttachments eq true and isRead eq false',
                 '$select': 'id,subject,from,receivedDateTime,hasAttachments,isRead'
             }
             
@@ -69,14 +137,7 @@ class MS365Auth:
             response = requests.get(url, headers=headers, params=params)
             
             if response.status_code == 200:
-                all_messages = response.json().get('value', [])
-                # Filter messages with attachments
-                messages_with_attachments = [
-                    msg for msg in all_messages 
-                    if msg.get('hasAttachments', False) and not msg.get('isRead', True)
-                ]
-                # Limit the results
-                return messages_with_attachments[:limit]
+                return response.json().get('value', [])
             else:
                 print(f"Error getting messages: {response.status_code}")
                 print(f"Response: {response.text}")
@@ -86,6 +147,92 @@ class MS365Auth:
             print(f"Error getting messages: {str(e)}")
             return []
 
+    def _load_delta_link(self):
+        """Read the persisted deltaLink, if any"""
+        try:
+            with open(self.delta_state_file, 'r') as f:
+                return json.load(f).get('deltaLink')
+        except (OSError, ValueError):
+            return None
+
+    def commit_delta(self):
+        """Persist the deltaLink from the last delta query.
+
+        Call this once the returned messages have been handled, so a crash
+        mid-cycle replays them instead of skipping them.
+        """
+        if not self._pending_delta_link:
+            return
+        
+        os.makedirs(os.path.dirname(self.delta_state_file), exist_ok=True)
+        temp_file = f"{self.delta_state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump({'deltaLink': self._pending_delta_link, 'saved_at': datetime.now().isoformat()}, f)
+        os.replace(temp_file, self.delta_state_file)
+        self._pending_delta_link = None
+
+    def reset_delta(self):
+        """Forget the sync state so the next poll does a fresh initial sync"""
+        self._pending_delta_link = None
+        try:
+            os.remove(self.delta_state_file)
+        except OSError:
+            pass
+
+    def get_new_messages(self, page_size=50, resync=True):
+        """Get unread inbox messages with attachments that changed since the last poll.
+
+        Uses a Graph delta query, so each poll only transfers new or changed
+        messages. The first sync is bounded to MS365_DELTA_LOOKBACK_DAYS. An
+        expired sync state triggers at most one fresh sync (``resync``).
+        """
+        if not self.ensure_token():
+            raise Exception("Failed to authenticate")
+        
+        # A cursor from an earlier, unfinished cycle must not be committed for this one
+        self._pending_delta_link = None
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+            'Prefer': f'odata.maxpagesize={page_size}'
+        }
+        
+        url = self._load_delta_link()
+        params = None
+        if not url:
+            # Delta queries on messages only support $filter on receivedDateTime
+            since = datetime.utcnow() - timedelta(days=config.MS365_DELTA_LOOKBACK_DAYS)
+            url = f"{GRAPH_URL}/users/{config.MS365_USER}/mailFolders/inbox/messages/delta"
+            params = {
+                '$select': MESSAGE_FIELDS,
+                '$filter': f"receivedDateTime ge {since.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+            }
+        
+        messages = []
+        while url:
+            response = requests.get(url, headers=headers, params=params)
+            params = None  # nextLink/deltaLink already carry the query
+            
+            if response.status_code == 410 and resync:
+                # Sync state expired on the server; start over, once
+                print("Delta token expired, resyncing...")
+                self.reset_delta()
+                return self.get_new_messages(page_size, resync=False)
+            if response.status_code != 200:
+                raise Exception(f"Delta query failed: {response.status_code} {response.text}")
+            
+            data = response.json()
+            for msg in data.get('value', []):
+                if '@removed' in msg:
+                    continue
+                if msg.get('hasAttachments') and not msg.get('isRead', True):
+                    messages.append(msg)
+            
+            url = data.get('@odata.nextLink')
+            if not url:
+                self._pending_delta_link = data.get('@odata.deltaLink')
+        
+        return messages
+
     def get_message_attachments(self, message_id):
         """Get attachments for a specific message"""
         try:
@@ -115,6 +262,10 @@ class MS365Auth:
     def download_attachment(self, message_id, attachment):
         """Download and save an attachment"""
         try:
+            if 'contentBytes' not in attachment:
+                # Listed without content: stream it from the /$value endpoint
+                return self.graph.download_attachment(message_id, attachment)
+            
             # Create temp directory if it doesn't exist
             temp_dir = os.path.join(tempfile.gettempdir(), 'xero_automation')
             os.makedirs(temp_dir, exist_ok=True)
@@ -123,8 +274,7 @@ class MS365Auth:
             content_bytes = base64.b64decode(attachment['contentBytes'])
             
             # Save to file
-            filename = attachment['name']
-            filepath = os.path.join(temp_dir, f"{message_id}_{filename}")
+            filepath = attachment_path(temp_dir, attachment)
             
             with open(filepath, 'wb') as f:
                 f.write(content_bytes)
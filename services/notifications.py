@@ -0,0 +1,121 @@
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional
+import requests
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import PlainTextResponse
+from utils.config import config
+from utils.logger import app_logger
+
+class ChangeNotifier:
+    """Wakes the polling loop as soon as new mail is reported.
+
+    Service loops call ``wait(interval)`` instead of sleeping, so a push
+    notification starts processing immediately while the interval still
+    acts as a slow reconciliation poll.
+    """
+
+    def __init__(self, debounce: Optional[float] = None):
+        self.debounce = config.GRAPH_NOTIFICATION_DEBOUNCE if debounce is None else debounce
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.message_ids = []
+        self.received = 0
+        self.last_notification = None
+
+    def notify(self, message_ids: Optional[List[str]] = None):
+        with self._lock:
+            self.message_ids.extend(message_ids or [])
+            self.received += 1
+            self.last_notification = time.time()
+        self._event.set()
+
+    def wait(self, timeout: float) -> bool:
+        """Block until notified or ``timeout`` passes. Returns True if notified."""
+        notified = self._event.wait(timeout)
+        if notified:
+            if self.debounce:
+                # Let a burst of notifications coalesce into one poll
+                time.sleep(self.debounce)
+            # Only now: a notification racing a timeout must survive to the next wait
+            self._event.clear()
+        return notified
+
+    def drain(self) -> List[str]:
+        """Return and forget the message ids reported since the last drain"""
+        with self._lock:
+            message_ids, self.message_ids = self.message_ids, []
+        return message_ids
+
+def create_notification_router(subscriptions, notifier: ChangeNotifier) -> APIRouter:
+    """FastAPI routes receiving Microsoft Graph change notifications"""
+    router = APIRouter()
+
+    @router.post("/notifications/graph")
+    async def graph_notifications(request: Request):
+        # Graph validates new subscriptions by echoing a token back as text/plain
+        validation_token = request.query_params.get('validationToken')
+        if validation_token:
+            return PlainTextResponse(validation_token)
+
+        payload = await request.json()
+        message_ids = []
+        for notification in payload.get('value', []):
+            if not subscriptions.verify(notification):
+                app_logger.warning("Ignoring notification with invalid clientState")
+                continue
+
+            lifecycle_event = notification.get('lifecycleEvent')
+            if lifecycle_event:
+                app_logger.info(f"Graph lifecycle event: {lifecycle_event}")
+                # Missed notifications or an expiring subscription: reconcile by polling
+                notifier.notify()
+                continue
+
+            resource_data = notification.get('resourceData') or {}
+            if resource_data.get('id'):
+                message_ids.append(resource_data['id'])
+
+        if message_ids:
+            notifier.notify(message_ids)
+
+        # Graph expects a quick 2xx; processing happens in the service loop
+        return Response(status_code=202)
+
+    return router
+
+class LocalNotifier:
+    """Stand-in for Graph that posts change notifications to our endpoint.
+
+    Useful for local development and tests where Graph cannot reach the
+    service.
+    """
+
+    def __init__(self, notification_url: str, client_state: str, session=None):
+        self.notification_url = notification_url
+        self.client_state = client_state
+        self.session = session or requests
+
+    def build_payload(self, message_ids: List[str]) -> Dict[str, Any]:
+        return {
+            'value': [
+                {
+                    'subscriptionId': 'local',
+                    'clientState': self.client_state,
+                    'changeType': 'created',
+                    'resource': f"users/{config.MS365_USER}/messages/{message_id}",
+                    'resourceData': {
+                        '@odata.type': '#Microsoft.Graph.Message',
+                        'id': message_id
+                    },
+                    'tenantId': config.MS365_TENANT_ID
+                }
+                for message_id in message_ids
+            ]
+        }
+
+    def send(self, message_ids: Optional[List[str]] = None):
+        """Post a notification for the given (or a random) message id"""
+        message_ids = message_ids or [str(uuid.uuid4())]
+        return self.session.post(self.notification_url, json=self.build_payload(message_ids))
@@ -118,35 +118,49 @@ class EnhancedPipeline:
                 
             print(f"\nFound {len(messages)} new emails with attachments")
             
+            # One $batch round trip lists attachments for every message
+            graph = self.email_client.graph
+            attachments_by_message = graph.get_attachments([msg['id'] for msg in messages])
+            
+            # Download all document attachments concurrently
+            downloads = []
             for msg in messages:
-                print(f"\nProcessing email: {msg['subject']}")
-                attachments = self.email_client.get_message_attachments(msg['id'])
-                
-                for attachment in attachments:
+                for attachment in attachments_by_message[msg['id']]:
                     name = attachment['name']
                     if name.lower().endswith(('.pdf', '.png', '.jpg', '.jpeg')):
-                        # Download attachment
-                        filepath = self.email_client.download_attachment(msg['id'], attachment)
-                        
-                        if filepath:
-                            # Process the attachment
-                            processed = self.process_attachment(filepath)
-                            
-                            if processed:
-                                mark_read = input("\nMark email as read? (y/n): ").lower()
-                                if mark_read == 'y':
-                                    self.email_client.mark_as_read(msg['id'])
-                                    print("✓ Email marked as read")
-                            
-                            # Clean up temporary file
-                            try:
-                                os.remove(filepath)
-                                print(f"✓ Cleaned up temporary file: {filepath}")
-                            except:
-                                pass
+                        downloads.append((msg, attachment))
                     else:
                         print(f"Skipping non-document attachment: {name}")
             
+            filepaths = graph.download_attachments(
+                [(msg['id'], attachment) for msg, attachment in downloads]
+            )
+            
+            to_mark_read = []
+            for (msg, attachment), filepath in zip(downloads, filepaths):
+                if filepath:
+                    print(f"\nProcessing email: {msg['subject']}")
+                    
+                    # Process the attachment
+                    processed = self.process_attachment(filepath)
+                    
+                    if processed and msg['id'] not in to_mark_read:
+                        mark_read = input("\nMark email as read? (y/n): ").lower()
+                        if mark_read == 'y':
+                            to_mark_read.append(msg['id'])
+                    
+                    # Clean up temporary file
+                    try:
+                        os.remove(filepath)
+                        print(f"✓ Cleaned up temporary file: {filepath}")
+                    except:
+                        pass
+            
+            # Mark confirmed emails as read in a single batch
+            if to_mark_read:
+                marked = graph.mark_as_read(to_mark_read)
+                print(f"✓ {sum(marked.values())} email(s) marked as read")
+            
             print("\n✓ Processing completed!")
             
         except Exception as e:
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+import pytest
+from utils import atomic_writer
+from utils.atomic_writer import AtomicWriter
+
+def _count_syncs():
+    """Patch file and directory syncs with counters that still sync"""
+    counts = {'file': 0, 'directory': 0}
+    datasync, fsync = atomic_writer._datasync, os.fsync
+
+    def count_file(fd):
+        counts['file'] += 1
+        time.sleep(0.005)  # a real disk flush, so writers overlap
+        datasync(fd)
+
+    def count_directory(fd):
+        counts['directory'] += 1
+        fsync(fd)
+
+    return (counts, patch('utils.atomic_writer._datasync', side_effect=count_file),
+            patch('utils.atomic_writer.os.fsync', side_effect=count_directory))
+
+def test_concurrent_writes_share_directory_syncs(tmp_path):
+    writer = AtomicWriter(fsync=True, window=0.5, max_batch=16)
+    barrier = threading.Barrier(8)
+
+    def save(n):
+        barrier.wait()
+        writer.write_many([(str(tmp_path / f'{n}.bin'), b'blob'), (str(tmp_path / 'meta' / f'{n}.json'), b'{}')])
+
+    counts, file_patch, dir_patch = _count_syncs()
+    with file_patch, dir_patch:
+        threads = [threading.Thread(target=save, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert sorted(os.listdir(tmp_path / 'meta')) == [f'{n}.json' for n in range(8)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+    # Every file is synced once; the two directories once per commit
+    assert counts['file'] == 16
+    assert counts['directory'] == 2 * writer.commits
+    assert writer.commits < 8
+
+def test_lone_writer_does_not_wait_for_window(tmp_path):
+    writer = AtomicWriter(fsync=True, window=5)
+
+    started = time.monotonic()
+    writer.write(str(tmp_path / 'doc.json'), b'{}')
+
+    assert time.monotonic() - started < 1
+    assert writer.commits == 1
+
+def test_failed_sync_leaves_no_partial_files(tmp_path):
+    writer = AtomicWriter(fsync=True, window=0)
+    target = tmp_path / 'doc.json'
+
+    with patch('utils.atomic_writer._datasync', side_effect=OSError('disk full')):
+        with pytest.raises(OSError):
+            writer.write(str(target), b'{"total": 42}')
+
+    assert os.listdir(tmp_path) == []
+
+def test_failed_file_only_fails_its_writer(tmp_path):
+    writer = AtomicWriter(fsync=True, window=0.5, max_batch=3)
+    sync = AtomicWriter._sync
+
+    def failing_sync(path):
+        if 'bad' in path:
+            raise OSError('I/O error')
+        sync(path)
+
+    barrier = threading.Barrier(3)
+    errors = {}
+
+    def save(name):
+        barrier.wait()
+        try:
+            writer.write(str(tmp_path / name), b'data')
+        except OSError as e:
+            errors[name] = e
+
+    with patch.object(AtomicWriter, '_sync', staticmethod(failing_sync)):
+        threads = [threading.Thread(target=save, args=(name,)) for name in ('a', 'bad', 'c')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert list(errors) == ['bad']
+    assert sorted(os.listdir(tmp_path)) == ['a', 'c']
+
+def test_deferred_writes_share_one_commit(tmp_path):
+    writer = AtomicWriter(fsync=True, window=0)
+    counts, file_patch, dir_patch = _count_syncs()
+    with file_patch, dir_patch:
+        with writer.deferred():
+            for n in range(3):
+                writer.write_many([(str(tmp_path / f'{n}.bin'), b'blob'), (str(tmp_path / 'meta' / f'{n}.json'), b'{}')])
+            assert not (tmp_path / 'meta' / '0.json').exists()
+
+    assert sorted(os.listdir(tmp_path / 'meta')) == ['0.json', '1.json', '2.json']
+    assert writer.commits == 1
+    assert counts == {'file': 6, 'directory': 2}
+
+def test_referring_file_is_renamed_after_its_target_is_durable(tmp_path):
+    writer = AtomicWriter(fsync=True, window=0)
+    events = []
+    replace, sync_directory = os.replace, AtomicWriter._sync_directory
+
+    def record_replace(src, dst):
+        events.append(('rename', os.path.basename(os.path.dirname(dst))))
+        replace(src, dst)
+
+    def record_sync(directory):
+        events.append(('sync', os.path.basename(directory)))
+        sync_directory(directory)
+
+    (tmp_path / 'blobs').mkdir()
+    with patch('utils.atomic_writer.os.replace', side_effect=record_replace), \
+            patch.object(AtomicWriter, '_sync_directory', staticmethod(record_sync)):
+        writer.write_many([(str(tmp_path / 'blobs' / 'b'), b'blob'), (str(tmp_path / 'meta' / 'm'), b'{}')])
+
+    assert events == [('rename', 'blobs'), ('sync', 'blobs'), ('rename', 'meta'), ('sync', 'meta')]
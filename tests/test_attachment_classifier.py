@@ -0,0 +1,55 @@
+import struct
+import zlib
+import pytest
+from processors.attachment_classifier import classify, classify_file, prefilter, sniff_type
+from services.ledger import ProcessedLedger, hash_file
+
+def png(width, height, padding=8192):
+    """Minimal PNG header with the given dimensions, padded past the size floor"""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    chunk = struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+    return b'\x89PNG\r\n\x1a\n' + chunk + b'\x00' * padding
+
+def pdf(pages):
+    objects = b''.join(b'%d 0 obj << /Type /Page /Parent 1 0 R >> endobj\n' % n for n in range(pages))
+    return b'%PDF-1.4\n1 0 obj << /Type /Pages >> endobj\n' + objects + b'\x00' * 8192
+
+def test_sniff_type_uses_magic_bytes():
+    assert sniff_type(pdf(1)) == 'pdf'
+    assert sniff_type(png(10, 10)) == 'png'
+    assert sniff_type(b'PK\x03\x04' + b'\x00' * 20) == 'zip'
+    assert sniff_type(b'BEGIN:VCALENDAR\r\nVERSION:2.0') == 'calendar'
+
+def test_admits_documents():
+    scan = classify(png(1240, 1754))
+    assert scan.admitted and scan.kind == 'image'
+    assert (scan.width, scan.height) == (1240, 1754)
+
+    invoice = classify(pdf(2))
+    assert invoice.admitted and invoice.kind == 'pdf'
+    assert invoice.pages == 2
+
+def test_rejects_logos_and_non_documents():
+    logo = classify(png(120, 40))
+    assert not logo.admitted and logo.blocklist
+
+    assert not classify(pdf(200)).admitted
+    assert not classify(b'PK\x03\x04' + b'\x00' * 8192).admitted
+    assert prefilter('meeting.ics', 'text/calendar', 900) is not None
+    assert prefilter('invoice.pdf', 'application/pdf', 80_000) is None
+
+def test_blocklisted_logo_is_remembered(tmp_path):
+    path = tmp_path / 'logo.png'
+    path.write_bytes(png(120, 40))
+    ledger = ProcessedLedger(str(tmp_path / 'ledger.db'))
+
+    classification = classify_file(str(path))
+    assert classification.blocklist
+    ledger.block_attachment(hash_file(str(path)), path.stat().st_size, classification.reason)
+
+    assert ledger.is_blocked(hash_file(str(path)))
+
+def test_small_pdf_is_not_blocklisted():
+    small = classify(b'%PDF-1.4\n1 0 obj << /Type /Page >> endobj\n')
+    assert not small.admitted and not small.blocklist
+    assert classify(png(10, 10, padding=0)).blocklist
@@ -0,0 +1,8 @@
+from sqlalchemy import text
+from models.database.base import create_db_engine
+
+def test_sqlite_engine_uses_wal(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    with engine.connect() as connection:
+        assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert connection.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
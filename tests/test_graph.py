@@ -0,0 +1,262 @@
+import os
+import time
+import pytest
+from unittest.mock import Mock, patch
+from services.ms365_auth import MS365Auth
+
+def _response(status_code, payload):
+    response = Mock()
+    response.status_code = status_code
+    response.json.return_value = payload
+    response.text = ''
+    return response
+
+@pytest.fixture
+def auth(tmp_path):
+    # Avoid the MSAL authority discovery request
+    with patch('services.ms365_auth.msal.ConfidentialClientApplication'):
+        auth = MS365Auth()
+    auth.access_token = 'token'
+    auth.token_expires_at = time.time() + 3600
+    auth.delta_state_file = str(tmp_path / 'state' / 'ms365_delta.json')
+    return auth
+
+def test_delta_follows_pages_and_filters(auth):
+    pages = [
+        _response(200, {
+            'value': [
+                {'id': '1', 'hasAttachments': True, 'isRead': False},
+                {'id': '2', 'hasAttachments': False, 'isRead': False},
+            ],
+            '@odata.nextLink': 'https://graph/next'
+        }),
+        _response(200, {
+            'value': [
+                {'id': '3', 'hasAttachments': True, 'isRead': True},
+                {'id': '4', '@removed': {'reason': 'deleted'}},
+            ],
+            '@odata.deltaLink': 'https://graph/delta?token=abc'
+        })
+    ]
+
+    with patch('services.ms365_auth.requests.get', side_effect=pages) as get:
+        messages = auth.get_new_messages()
+
+    assert [m['id'] for m in messages] == ['1']
+    assert get.call_args_list[1].args[0] == 'https://graph/next'
+
+    # The cursor is only persisted once the caller commits
+    assert auth._load_delta_link() is None
+    auth.commit_delta()
+    assert auth._load_delta_link() == 'https://graph/delta?token=abc'
+
+def test_delta_resumes_from_saved_link(auth):
+    auth._pending_delta_link = 'https://graph/delta?token=saved'
+    auth.commit_delta()
+
+    empty = _response(200, {'value': [], '@odata.deltaLink': 'https://graph/delta?token=next'})
+    with patch('services.ms365_auth.requests.get', return_value=empty) as get:
+        assert auth.get_new_messages() == []
+
+    assert get.call_args.args[0] == 'https://graph/delta?token=saved'
+
+def test_expired_delta_link_resyncs(auth):
+    auth._pending_delta_link = 'https://graph/delta?token=old'
+    auth.commit_delta()
+
+    responses = [
+        _response(410, {}),
+        _response(200, {'value': [], '@odata.deltaLink': 'https://graph/delta?token=fresh'})
+    ]
+    with patch('services.ms365_auth.requests.get', side_effect=responses) as get:
+        auth.get_new_messages()
+
+    assert get.call_args.args[0].endswith('/mailFolders/inbox/messages/delta')
+    assert auth._load_delta_link() is None
+
+def test_repeated_expiry_does_not_loop(auth):
+    auth._pending_delta_link = 'https://graph/delta?token=old'
+    auth.commit_delta()
+
+    with patch('services.ms365_auth.requests.get', return_value=_response(410, {})) as get:
+        with pytest.raises(Exception, match='410'):
+            auth.get_new_messages()
+
+    assert get.call_count == 2
+
+def test_failed_batch_keeps_sync_state(tmp_path):
+    from services.email_monitor import EmailMonitor
+    from services.ledger import ProcessedLedger
+    with patch('services.ms365_auth.msal.ConfidentialClientApplication'):
+        monitor = EmailMonitor(ledger=ProcessedLedger(str(tmp_path / 'ledger.db')))
+    monitor.ms365.get_new_messages = Mock(return_value=[{'id': '1'}])
+    monitor.ensure_connected = Mock()
+    monitor.commit_sync_state = Mock()
+
+    monitor.fetch_emails = Mock(side_effect=RuntimeError('batch failed'))
+    assert monitor.check_new_emails() == []
+    monitor.commit_sync_state.assert_not_called()
+
+    # Once the message is completed the cursor moves on
+    monitor.fetch_emails = Mock(side_effect=lambda messages: monitor.ledger.add_messages(['1']) or [])
+    monitor.check_new_emails()
+    monitor.commit_sync_state.assert_called_once()
+
+def test_failing_message_stops_pinning_sync_state(tmp_path):
+    from services.email_monitor import EmailMonitor
+    from services.ledger import ProcessedLedger
+    with patch('services.ms365_auth.msal.ConfidentialClientApplication'):
+        monitor = EmailMonitor(ledger=ProcessedLedger(str(tmp_path / 'ledger.db')))
+    monitor.ms365.get_new_messages = Mock(return_value=[{'id': 'bad'}])
+    monitor.ensure_connected = Mock()
+    monitor.commit_sync_state = Mock()
+    monitor.fetch_emails = Mock(side_effect=RuntimeError('batch failed'))
+
+    with patch('services.email_monitor.config.MESSAGE_MAX_ATTEMPTS', 3):
+        for _ in range(2):
+            monitor.check_new_emails()
+        monitor.commit_sync_state.assert_not_called()
+
+        monitor.check_new_emails()
+    monitor.commit_sync_state.assert_called_once()
+
+def test_attachments_are_recorded_only_once_processed(tmp_path):
+    from services.email_monitor import EmailMonitor
+    from services.ledger import ProcessedLedger
+    with patch('services.ms365_auth.msal.ConfidentialClientApplication'):
+        monitor = EmailMonitor(ledger=ProcessedLedger(str(tmp_path / 'ledger.db')))
+
+    def download(downloads):
+        paths = []
+        for message_id, attachment in downloads:
+            path = tmp_path / f"{message_id}.pdf"
+            path.write_bytes(b'%PDF-1.7 same invoice')
+            paths.append(str(path))
+        return paths
+
+    graph = monitor.ms365._graph = Mock()
+    graph.get_attachments.side_effect = lambda ids: {i: [{'name': 'invoice.pdf', 'size': 5000}] for i in ids}
+    graph.download_attachments.side_effect = download
+    graph.mark_as_read.return_value = {}
+    messages = [{'id': i, 'receivedDateTime': '2026-01-01T00:00:00Z'} for i in ('m1', 'm2')]
+
+    with patch('services.email_monitor.classify_file', return_value=Mock(admitted=True)):
+        emails = monitor.fetch_emails(messages)
+
+    # The second copy in the same batch is a duplicate, but nothing is recorded yet
+    assert [len(e['attachments']) for e in emails] == [1, 0]
+    assert monitor.ledger.filter_new(['m1', 'm2']) == ['m1']
+    # m1 stays unread, so a replayed delta still lists it if processing fails
+    graph.mark_as_read.assert_called_once_with(['m2'])
+    sha256 = emails[0]['hashes'][emails[0]['attachments'][0]][0]
+    assert not monitor.ledger.has_attachment(sha256)
+
+    monitor.record_processed(emails[0], emails[0]['attachments'][0])
+    assert monitor.ledger.has_attachment(sha256)
+    assert monitor.ledger.filter_new(['m1', 'm2']) == []
+    graph.mark_as_read.assert_called_with(['m1'])
+
+def test_failed_download_leaves_message_unfinished(tmp_path):
+    from services.email_monitor import EmailMonitor
+    from services.ledger import ProcessedLedger
+    with patch('services.ms365_auth.msal.ConfidentialClientApplication'):
+        monitor = EmailMonitor(ledger=ProcessedLedger(str(tmp_path / 'ledger.db')))
+
+    saved = tmp_path / 'a.pdf'
+    saved.write_bytes(b'%PDF-1.7 first invoice')
+    graph = monitor.ms365._graph = Mock()
+    graph.get_attachments.return_value = {'m1': [{'name': 'a.pdf', 'size': 5000}, {'name': 'b.pdf', 'size': 5000}]}
+    graph.download_attachments.return_value = [str(saved), None]
+    graph.mark_as_read.return_value = {}
+
+    with patch('services.email_monitor.classify_file', return_value=Mock(admitted=True)):
+        email, = monitor.fetch_emails([{'id': 'm1', 'receivedDateTime': '2026-01-01T00:00:00Z'}])
+    monitor.record_processed(email, str(saved))
+
+    # b.pdf is fetched again on the next poll, so m1 is neither recorded nor read
+    assert monitor.ledger.filter_new(['m1']) == ['m1']
+    graph.mark_as_read.assert_not_called()
+
+def test_unauthorized_response_forces_a_new_token(auth):
+    from services.graph_client import GraphClient
+    auth.token_cache.find = Mock(return_value=['cached'])
+    auth.token_cache.remove_at = Mock()
+    auth.app.acquire_token_for_client.return_value = {'access_token': 'fresh', 'expires_in': 3600}
+    client = GraphClient(auth)
+    client.session.request = Mock(side_effect=[_response(401, {}), _response(200, {})])
+
+    assert client.request('GET', 'https://graph.example/me').status_code == 200
+    auth.token_cache.remove_at.assert_called_once_with('cached')
+    auth.app.acquire_token_silent.assert_not_called()
+    assert client.session.request.call_args.kwargs['headers']['Authorization'] == 'Bearer fresh'
+
+def _batch_response(requests_payload):
+    return _response(200, {
+        'responses': [
+            {'id': request['id'], 'status': 200, 'body': {'value': [{'id': f"att-{request['id']}"}]}}
+            for request in requests_payload
+        ]
+    })
+
+def test_batch_chunks_requests(auth):
+    sent = []
+
+    def fake_request(method, url, headers=None, json=None, **kwargs):
+        sent.append(json['requests'])
+        return _batch_response(json['requests'])
+
+    with patch.object(auth.graph.session, 'request', side_effect=fake_request):
+        attachments = auth.graph.get_attachments([f"msg-{n}" for n in range(45)])
+
+    # 45 messages need three round trips of at most 20 requests
+    assert [len(chunk) for chunk in sent] == [20, 20, 5]
+    assert attachments['msg-44'] == [{'id': 'att-44'}]
+
+def test_download_streams_to_disk(auth, tmp_path):
+    response = _response(200, {})
+    response.iter_content.return_value = [b'%PDF-', b'1.7 data']
+    response.__enter__ = Mock(return_value=response)
+    response.__exit__ = Mock(return_value=False)
+
+    with patch.object(auth.graph.session, 'request', return_value=response) as request:
+        path = auth.graph.download_attachment('msg', {'id': 'att', 'name': 'invoice.pdf'}, str(tmp_path))
+
+    assert request.call_args.args[1].endswith('/messages/msg/attachments/att/$value')
+    assert request.call_args.kwargs['stream'] is True
+    with open(path, 'rb') as f:
+        assert f.read() == b'%PDF-1.7 data'
+
+def test_attachment_names_cannot_escape_or_collide(tmp_path):
+    from services.graph_client import attachment_path
+    first = attachment_path(str(tmp_path), {'name': '../../etc/passwd'})
+    second = attachment_path(str(tmp_path), {'name': '../../etc/passwd'})
+
+    assert os.path.dirname(first) == str(tmp_path)
+    assert first.endswith('_passwd') and first != second
+    assert os.path.dirname(attachment_path(str(tmp_path), {'name': '..'})) == str(tmp_path)
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    from email.utils import format_datetime
+    from datetime import datetime, timedelta, timezone
+    from services.graph_client import retry_after
+
+    assert retry_after('7') == 7
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < retry_after(later) <= 30
+    assert retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert retry_after('soon') == 5
+
+def test_valid_token_skips_acquisition(auth):
+    auth.app.acquire_token_silent.reset_mock()
+    assert auth.ensure_token()
+    auth.app.acquire_token_silent.assert_not_called()
+
+def test_token_cache_is_persisted(auth, tmp_path):
+    auth.token_cache_file = str(tmp_path / 'cache.json')
+    auth.token_expires_at = 0
+    auth.app.acquire_token_silent.return_value = {'access_token': 'fresh', 'expires_in': 3599}
+    auth.token_cache.has_state_changed = True
+
+    assert auth.ensure_token()
+    assert auth.access_token == 'fresh'
+    assert (tmp_path / 'cache.json').exists()
@@ -0,0 +1,182 @@
+import base64
+import json
+import re
+import pytest
+from unittest.mock import Mock
+from input_handlers.email_handler import EmailHandler
+from input_handlers.imap_engine import IMAPEngine, parse_bodystructure, parse_response
+from utils.config import config
+
+BODYSTRUCTURE = (
+    b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 12 1 NIL NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "invoice.pdf") NIL NIL "BASE64" 40 NIL'
+    b' ("ATTACHMENT" ("FILENAME" "invoice.pdf")) NIL NIL)'
+    b'("IMAGE" "PNG" NIL "<logo>" NIL "BASE64" 20 NIL ("INLINE" NIL) NIL NIL)'
+    b' "MIXED" ("BOUNDARY" "b1") NIL NIL NIL)'
+)
+
+PDF = b'%PDF-1.4 test'
+HEADERS = b'Subject: Invoice 42\r\nFrom: billing@example.com\r\nMessage-ID: <42@example.com>\r\n\r\n'
+
+class FakeIMAP:
+    """Sequential stand-in for imaplib.IMAP4"""
+
+    capabilities = ('IMAP4REV1',)
+
+    def __init__(self, uids, structure=BODYSTRUCTURE):
+        self.uids = uids
+        self.structure = structure
+        self.commands = []
+
+    def select(self, mailbox):
+        return 'OK', [b'1']
+
+    def response(self, code):
+        return code, [b'7']
+
+    def uid(self, command, *args):
+        self.commands.append((command,) + args)
+        if command == 'SEARCH':
+            return 'OK', [' '.join(map(str, self.uids)).encode()]
+        if command == 'STORE':
+            return 'OK', []
+
+        data = []
+        partial = re.search(r'\[2\]<(\d+)\.(\d+)>', args[1])
+        if partial:
+            offset, length = map(int, partial.groups())
+            chunk = base64.b64encode(PDF)[offset:offset + length]
+            prefix = f'1 (UID {args[0]} BODY[2]<{offset}> {{{len(chunk)}}}'.encode()
+            return 'OK', [(prefix, chunk), b')']
+        for n, uid in enumerate(args[0].split(','), 1):
+            if 'BODYSTRUCTURE' in args[1]:
+                prefix = f'{n} (UID {uid} BODYSTRUCTURE '.encode() + self.structure
+                prefix += b' BODY[HEADER.FIELDS (SUBJECT FROM TO CC DATE MESSAGE-ID)] {%d}' % len(HEADERS)
+                data.extend([(prefix, HEADERS), b')'])
+                continue
+            encoded = base64.b64encode(PDF)
+            data.extend([
+                (f'{n} (UID {uid} BODY[1] {{5}}'.encode(), b'hello'),
+                (b' BODY[2] {%d}' % len(encoded), encoded),
+                b')'
+            ])
+        return 'OK', data
+
+@pytest.fixture
+def state_file(tmp_path):
+    return str(tmp_path / 'imap.json')
+
+def test_parse_bodystructure_finds_sections():
+    parts = parse_bodystructure(parse_response(BODYSTRUCTURE)[0])
+
+    assert [part.section for part in parts] == ['1', '2', '3']
+    assert parts[0].content_type == 'text/plain'
+    assert parts[1].filename == 'invoice.pdf'
+    assert parts[1].encoding == 'base64'
+    assert parts[2].is_attachment is False
+
+def test_parse_response_uses_literals():
+    parsed = parse_response(b'1 (UID 9 BODY[1] {3} FLAGS (\\Seen NIL))', [b'abc'])
+
+    assert parsed == ['1', ['UID', '9', 'BODY[1]', b'abc', 'FLAGS', ['\\Seen', None]]]
+
+def test_fetch_new_downloads_only_wanted_parts(state_file):
+    conn = FakeIMAP([5])
+    engine = IMAPEngine(conn, state_file=state_file)
+    engine.select()
+
+    messages = engine.fetch_new()
+
+    assert len(messages) == 1
+    message = messages[0]
+    assert message['subject'] == 'Invoice 42'
+    assert message['text'] == 'hello'
+    attachment = message['attachments'][0]
+    assert (attachment.filename, attachment.content_type) == ('invoice.pdf', 'application/pdf')
+    assert attachment.read() == PDF
+    fetch = [command for command in conn.commands if command[0] == 'FETCH'][-1]
+    assert fetch[2] == '(UID BODY.PEEK[1] BODY.PEEK[2])'
+
+def test_commit_persists_cursor(state_file):
+    conn = FakeIMAP([5])
+    engine = IMAPEngine(conn, state_file=state_file)
+    engine.select()
+    engine.commit(engine.fetch_new())
+
+    with open(state_file) as f:
+        assert json.load(f) == {'uidvalidity': 7, 'last_uid': 5}
+
+    # "6:*" still returns the highest UID when nothing is new
+    restarted = IMAPEngine(conn, state_file=state_file)
+    restarted.select()
+    assert restarted.fetch_new() == []
+    assert ('SEARCH', None, 'UID 6:*') in conn.commands
+
+def test_part_fetches_are_split_by_buffer_size(state_file):
+    conn = FakeIMAP([5, 6, 7])
+    # Each message's wanted parts are 52 bytes (text + PDF), so two fit per FETCH
+    engine = IMAPEngine(conn, state_file=state_file, fetch_buffer=110)
+    engine.select()
+
+    messages = engine.fetch_new()
+
+    assert [m['attachments'][0].read() for m in messages] == [PDF] * 3
+    part_fetches = [c[1] for c in conn.commands if c[0] == 'FETCH' and 'BODYSTRUCTURE' not in c[2]]
+    assert part_fetches == ['5,6', '7']
+
+def test_unknown_charset_falls_back_to_utf8(state_file):
+    conn = FakeIMAP([5], structure=BODYSTRUCTURE.replace(b'"utf-8"', b'"x-no-such-charset"'))
+    engine = IMAPEngine(conn, state_file=state_file)
+    engine.select()
+
+    assert engine.fetch_new()[0]['text'] == 'hello'
+
+def test_large_part_is_fetched_in_pieces(state_file):
+    conn = FakeIMAP([5])
+    # The 40-byte PDF part is above the buffer; the 12-byte text part is not
+    engine = IMAPEngine(conn, state_file=state_file, fetch_buffer=16)
+    engine.select()
+
+    message = engine.fetch_new()[0]
+
+    assert message['text'] == 'hello'
+    assert message['attachments'][0].read() == PDF
+    part_fetches = [c[2] for c in conn.commands if c[0] == 'FETCH' and 'BODYSTRUCTURE' not in c[2]]
+    assert part_fetches == ['(UID BODY.PEEK[1])', '(BODY.PEEK[2]<0.16>)', '(BODY.PEEK[2]<16.16>)']
+
+def test_process_email_fetches_message_in_pieces(monkeypatch):
+    monkeypatch.setattr(config, 'IMAP_FETCH_BUFFER_SIZE', 64)
+    raw = (HEADERS[:-2] + b'Content-Type: multipart/mixed; boundary="b1"\r\n\r\n'
+           b'--b1\r\nContent-Type: text/plain\r\n\r\nhello\r\n'
+           b'--b1\r\nContent-Type: application/pdf\r\nContent-Disposition: attachment; filename="invoice.pdf"\r\n'
+           b'Content-Transfer-Encoding: base64\r\n\r\n' + base64.b64encode(PDF) + b'\r\n--b1--\r\n')
+    commands = []
+
+    def fetch(email_id, items):
+        commands.append(items)
+        offset, length = map(int, re.search(r'<(\d+)\.(\d+)>', items).groups())
+        chunk = raw[offset:offset + length]
+        return 'OK', [(b'1 (BODY[]<%d> {%d}' % (offset, len(chunk)), chunk), b')']
+
+    handler = EmailHandler()
+    handler.conn = Mock(fetch=fetch)
+    message = handler.process_email(b'1')
+
+    assert message['subject'] == 'Invoice 42'
+    assert message['text'].strip() == 'hello'
+    assert message['attachments'][0].read() == PDF
+    assert len(commands) == len(raw) // 64 + 1
+    assert commands[0] == '(BODY[]<0.64>)'
+
+def test_idle_uses_its_own_tag(state_file, monkeypatch):
+    conn = FakeIMAP([5])
+    conn.capabilities = ('IMAP4REV1', 'IDLE')
+    conn.sent = []
+    conn.send = conn.sent.append
+    replies = iter([b'+ idling\r\n', b'* 6 EXISTS\r\n', b'Z1 OK IDLE terminated\r\n'])
+    conn.readline = lambda: next(replies)
+    conn.socket = lambda: Mock(pending=lambda: 1)
+    engine = IMAPEngine(conn, state_file=state_file)
+
+    assert engine.idle(timeout=5) is True
+    assert conn.sent == [b'Z1 IDLE\r\n', b'DONE\r\n']
@@ -0,0 +1,98 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from models.database.base import Base
+from models.database.models import ProcessingJob
+from services.job_queue import JobQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return JobQueue(session_factory=session_factory, visibility_timeout=60,
+                    max_attempts=2, backoff=0)
+
+def test_claim_and_complete(queue):
+    job_id = queue.enqueue('email', {'message_id': 'abc'})
+
+    job = queue.claim('worker-1')
+    assert job.id == job_id
+    assert job.payload == {'message_id': 'abc'}
+    assert job.attempts == 1
+
+    # Leased jobs are not handed to other workers
+    assert queue.claim('worker-2') is None
+
+    assert queue.complete(job)
+    assert queue.get_stats()['completed'] == 1
+
+def test_expired_lease_is_reclaimed(queue):
+    queue.enqueue('email', {})
+    job = queue.claim('worker-1')
+
+    with queue.session_factory() as session:
+        session.execute(
+            update(ProcessingJob)
+            .values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+        )
+        session.commit()
+
+    reclaimed = queue.claim('worker-2')
+    assert reclaimed.id == job.id
+    assert reclaimed.attempts == 2
+
+    # The original worker lost its lease and cannot complete the job
+    assert not queue.complete(job)
+    assert queue.complete(reclaimed)
+
+def test_fail_retries_then_gives_up(queue):
+    queue.enqueue('email', {})
+
+    job = queue.claim('worker-1')
+    queue.fail(job, 'boom')
+    assert queue.get_stats()['pending'] == 1
+
+    job = queue.claim('worker-1')
+    queue.fail(job, 'boom again')
+    stats = queue.get_stats()
+    assert stats['failed'] == 1
+    assert queue.claim('worker-1') is None
+
+def test_enqueue_many_skips_queued_ids(queue):
+    assert queue.enqueue_many('email', [('a', {'n': 1}), ('b', {'n': 2})]) == 2
+    assert queue.enqueue_many('email', [('b', {'n': 2}), ('c', {'n': 3})]) == 1
+
+    job = queue.claim('worker-1')
+    assert job.payload == {'n': 1}
+    assert queue.get_stats()['pending'] == 2
+
+def test_abandoned_jobs_are_swept_once_per_timeout(queue):
+    queue.enqueue('email', {})
+    job = queue.claim('worker-1')
+    queue.fail(job, 'boom')
+    job = queue.claim('worker-1')  # final attempt, then the worker dies
+
+    with queue.session_factory() as session:
+        session.execute(
+            update(ProcessingJob)
+            .values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+        )
+        session.commit()
+
+    # The sweep ran on the first claim; the next one is a visibility timeout away
+    assert queue.claim('worker-2') is None
+    assert queue.get_stats()['processing'] == 1
+
+    queue._next_sweep = 0
+    assert queue.claim('worker-2') is None
+    assert queue.get_stats()['failed'] == 1
+
+def test_job_without_available_at_is_claimable(queue):
+    job_id = queue.enqueue('email', {})
+    with queue.session_factory() as session:
+        session.execute(update(ProcessingJob).values(available_at=None))
+        session.commit()
+
+    assert queue.claim('worker-1').id == job_id
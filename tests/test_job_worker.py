@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database.base import Base
+from services.job_queue import JobQueue
+from services.job_worker import JobWorker
+
+@pytest.fixture
+def queue(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return JobQueue(session_factory=session_factory, visibility_timeout=60,
+                    max_attempts=2, backoff=0)
+
+def test_worker_completes_jobs(queue):
+    queue.enqueue_many('email', [('job-1', {'n': 1}), ('job-2', {'n': 2})])
+    handled = []
+    worker = JobWorker(queue, lambda job: handled.append(job.payload['n']), worker_id='w1')
+
+    assert worker.run_once()
+    assert worker.run_once()
+    assert not worker.run_once()
+    assert sorted(handled) == [1, 2]
+    assert queue.get_stats()['completed'] == 2
+
+def test_worker_failure_is_retried(queue):
+    queue.enqueue('email', {})
+
+    def handler(job):
+        raise RuntimeError('OCR failed')
+
+    worker = JobWorker(queue, handler, worker_id='w1')
+    assert worker.run_once()
+    assert queue.get_stats()['pending'] == 1
+    assert worker.run_once()
+    assert queue.get_stats()['failed'] == 1
+
+def test_lost_lease_skips_completion_side_effects(queue):
+    queue.enqueue('email', {})
+    recorded = []
+
+    def handler(job):
+        if job.attempts == 1:
+            # The lease is taken away while this worker is still running the job
+            queue.fail(job, 'lease expired')
+        return 'invoice'
+
+    worker = JobWorker(queue, handler, worker_id='w1',
+                       on_complete=lambda job, result: recorded.append(result))
+    assert worker.run_once()
+    assert recorded == []
+
+    assert worker.run_once()
+    assert recorded == ['invoice']
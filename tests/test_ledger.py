@@ -0,0 +1,42 @@
+import pytest
+from services.ledger import ProcessedLedger, hash_file
+
+@pytest.fixture
+def ledger_path(tmp_path):
+    return str(tmp_path / 'ledger.db')
+
+def test_processed_messages_survive_restart(ledger_path):
+    ledger = ProcessedLedger(ledger_path)
+    ledger.add_messages(['a', 'b'])
+    ledger.close()
+
+    reopened = ProcessedLedger(ledger_path)
+    assert reopened.has_message('a')
+    assert reopened.filter_new(['c', 'a', 'd', 'b']) == ['c', 'd']
+
+def test_filter_new_handles_large_batches(ledger_path):
+    ledger = ProcessedLedger(ledger_path)
+    ids = [f"msg-{n}" for n in range(2000)]
+    ledger.add_messages(ids[:1500])
+
+    assert ledger.filter_new(ids) == ids[1500:]
+
+def test_attachment_hashes_count_repeats(ledger_path, tmp_path):
+    attachment = tmp_path / 'logo.png'
+    attachment.write_bytes(b'\x89PNG' + b'\x00' * 100)
+    sha256 = hash_file(str(attachment))
+
+    ledger = ProcessedLedger(ledger_path)
+    assert not ledger.has_attachment(sha256)
+    assert ledger.record_attachment(sha256, 'msg-1', 'logo.png', 104) == 1
+    assert ledger.record_attachment(sha256, 'msg-2', 'logo.png', 104) == 2
+    assert ledger.has_attachment(sha256)
+
+def test_failed_write_rolls_back(ledger_path):
+    ledger = ProcessedLedger(ledger_path)
+    with pytest.raises(Exception):
+        ledger.add_messages(['a', ['not', 'bindable']])
+
+    # The aborted transaction is not left open
+    ledger.add_messages(['b'])
+    assert ledger.filter_new(['a', 'b']) == ['a']
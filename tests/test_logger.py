@@ -0,0 +1,75 @@
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from unittest.mock import patch
+import pytest
+from utils.config import config
+from utils.logger import JsonFormatter, Logger, _state, configure_logging, forward_logging, log_queue, shutdown_logging
+
+def test_loggers_share_one_queue_handler():
+    first = Logger('xero_automation')
+    second = Logger('xero_automation')
+
+    handlers = [h for h in first.logger.handlers if h is configure_logging()]
+    assert len(handlers) == 1
+    assert second.logger.handlers == first.logger.handlers
+
+def test_json_formatter_includes_exception():
+    try:
+        raise ValueError('bad amount')
+    except ValueError:
+        record = logging.LogRecord('xero_automation', logging.ERROR, __file__, 1,
+                                   'Failed %s', ('INV-1',), exc_info=sys.exc_info())
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'Failed INV-1'
+    assert entry['level'] == 'ERROR'
+    assert 'ValueError: bad amount' in entry['exception']
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_logs_through_parent(tmp_path):
+    shutdown_logging()
+    try:
+        with patch.object(config, 'LOG_DIR', str(tmp_path)):
+            configure_logging()
+            Logger('test_worker')
+
+            pid = os.fork()
+            if pid == 0:
+                # The child must not open or rotate the log files itself
+                Logger('test_worker').info('from child')
+                os._exit(0 if not _state.listeners else 1)
+            _, status = os.waitpid(pid, 0)
+            Logger('test_worker').info('from parent')
+            shutdown_logging()
+    finally:
+        configure_logging()
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    lines = (tmp_path / 'test_worker.log').read_text().splitlines()
+    assert sorted(line.rsplit(' - ', 1)[1] for line in lines) == ['from child', 'from parent']
+    assert not (tmp_path / 'xero_automation.log').exists()
+
+def _spawned_worker(parent_log_queue):
+    forward_logging(parent_log_queue)
+    Logger('test_worker').error('from spawned child', exc_info=False)
+
+def test_spawned_child_logs_through_parent(tmp_path):
+    shutdown_logging()
+    spawn = multiprocessing.get_context('spawn')
+    try:
+        # The queue must come from the same context as the process
+        with patch.object(config, 'LOG_DIR', str(tmp_path)), patch('utils.logger.multiprocessing', spawn):
+            configure_logging()
+            process = spawn.Process(target=_spawned_worker, args=(log_queue(),))
+            process.start()
+            process.join(30)
+            shutdown_logging()
+    finally:
+        configure_logging()
+
+    assert process.exitcode == 0
+    lines = (tmp_path / 'test_worker.log').read_text().splitlines()
+    assert [line.rsplit(' - ', 1)[1] for line in lines] == ['from spawned child']
@@ -0,0 +1,33 @@
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import main
+from processors.ocr_pool import QueueFullError
+
+def test_message_is_rejected_with_429_when_pool_is_full():
+    client = TestClient(main.app)
+    with patch.object(main.ocr_pool, 'submit', side_effect=QueueFullError('full')):
+        response = client.post('/process/message', json={'source': 'whatsapp', 'text': 'Invoice 42'})
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+
+def test_email_poll_is_rejected_with_429_when_pool_is_full():
+    client = TestClient(main.app)
+    with patch.object(type(main.ocr_pool), 'is_full', True), \
+            patch.object(main, '_fetch_unread_messages') as fetch:
+        response = client.post('/process/email')
+
+    assert response.status_code == 429
+    fetch.assert_not_called()  # nothing is marked read when the request is rejected
+
+def test_document_is_queued_for_workers_when_pool_stays_full():
+    import asyncio
+    from models.document import Document
+    document = Document(id='doc-1', source='email', content_type='pdf', raw_content=b'%PDF-1.7',
+                        processed_content={}, metadata={'subject': 'Invoice', 'sender': 'a@example.com'})
+    with patch.object(main.ocr_pool, 'submit_async', side_effect=QueueFullError('full')), \
+            patch.object(main, '_defer_document') as defer:
+        asyncio.run(main.process_document(document))
+
+    # Already fetched and marked seen, so it is handed over instead of dropped
+    defer.assert_called_once_with(document)
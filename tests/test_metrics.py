@@ -0,0 +1,59 @@
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from utils.metrics import MetricsRegistry, create_metrics_router
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+def test_histogram_renders_cumulative_buckets(registry):
+    latency = registry.histogram('span_seconds', 'Span durations', buckets=(0.1, 1))
+    latency.observe(0.05, span='ocr')
+    latency.observe(0.5, span='ocr')
+    latency.observe(3, span='ocr')
+
+    text = registry.render()
+    assert 'xero_automation_span_seconds_bucket{span="ocr",le="0.1"} 1' in text
+    assert 'xero_automation_span_seconds_bucket{span="ocr",le="1.0"} 2' in text
+    assert 'xero_automation_span_seconds_bucket{span="ocr",le="+Inf"} 3' in text
+    assert 'xero_automation_span_seconds_count{span="ocr"} 3' in text
+
+def test_drain_and_merge_across_processes(registry):
+    pages = registry.counter('pages_total', 'Pages')
+    pages.inc(3)
+    snapshot = registry.drain()  # what a worker process returns
+    assert pages.value() == 0
+
+    registry.merge(snapshot)
+    registry.merge(snapshot)
+    assert pages.value() == 6
+
+def test_metrics_endpoint(registry):
+    registry.counter('documents_total', 'Documents').inc(source='email', outcome='processed')
+    app = FastAPI()
+    app.include_router(create_metrics_router(registry))
+
+    response = TestClient(app).get('/metrics')
+
+    assert response.status_code == 200
+    assert 'xero_automation_documents_total{outcome="processed",source="email"} 1' in response.text
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_starts_with_empty_metrics():
+    from utils.metrics import metrics, pages_total
+    pages_total.inc(5)
+    read_fd, write_fd = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        os.write(write_fd, repr(metrics.drain()).encode())
+        os._exit(0)
+
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as f:
+        assert f.read() == '{}'
+    assert pages_total.value() >= 5  # the parent keeps its counts
@@ -0,0 +1,51 @@
+import io
+import os
+import pytest
+from email.message import EmailMessage
+from input_handlers.mime_stream import parse_message
+
+PDF = os.urandom(300_000)
+
+@pytest.fixture
+def raw_email():
+    msg = EmailMessage()
+    msg['Subject'] = 'Invoice 42'
+    msg['From'] = 'billing@example.com'
+    msg.set_content('Please find the invoice attached.\nThanks')
+    msg.add_alternative('<p>Please find the invoice attached.</p>', subtype='html')
+    msg.make_mixed()
+    msg.add_attachment(PDF, maintype='application', subtype='pdf', filename='invoice.pdf')
+    msg.add_attachment('total;42=ok\n' * 10, subtype='csv', filename='lines.csv', cte='quoted-printable')
+    return msg.as_bytes()
+
+def test_streams_attachments_to_handles(raw_email):
+    parsed = parse_message(io.BytesIO(raw_email), spool_size=64 * 1024)
+
+    assert parsed.headers['subject'] == 'Invoice 42'
+    assert parsed.text == 'Please find the invoice attached.\nThanks\n'
+    assert [(a.filename, a.content_type) for a in parsed.attachments] == [
+        ('invoice.pdf', 'application/pdf'), ('lines.csv', 'text/csv')
+    ]
+
+    pdf, csv = parsed.attachments
+    assert pdf.size == len(PDF)
+    assert pdf.file._rolled  # spilled to disk rather than held in memory
+    assert pdf.read() == PDF
+    assert csv.read() == b'total;42=ok\n' * 10
+    assert 'bytes>' in repr(parsed.attachments)
+
+def test_base64_with_stray_characters_keeps_the_data():
+    from base64 import b64encode
+    from input_handlers.mime_stream import spool_part
+    encoded = b64encode(PDF[:3000])
+    corrupted = encoded[:100] + b'!*' + encoded[100:2000] + b'\r\n' + encoded[2000:]
+
+    assert spool_part(corrupted, 'base64', 'a.pdf', 'application/pdf').read() == PDF[:3000]
+
+def test_quoted_printable_escape_split_across_reads():
+    from input_handlers.mime_stream import spool_part
+    # Short reads cut '=3D' and the soft line break at every possible offset
+    encoded = b'total=3D42 =C3=A9t=\r\nend\r\n'
+    for chunk_size in range(1, 8):
+        handle = spool_part(encoded, 'quoted-printable', 'a.txt', 'text/plain', chunk_size=chunk_size)
+        assert handle.read() == 'total=42 étend\r\n'.encode()
@@ -0,0 +1,84 @@
+import os
+import pytest
+from decimal import Decimal
+from unittest.mock import Mock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models.database.base import Base
+from models.database.repository import DocumentRepository
+from services.job_queue import Job
+from services.monitor_service import MonitorService
+from utils.storage import Storage
+
+@pytest.fixture
+def service(tmp_path):
+    service = MonitorService.__new__(MonitorService)
+    service.storage = Storage(base_path=str(tmp_path / 'storage'))
+    service.email_monitor = Mock()
+    return service
+
+def _email(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b'%PDF-1.7 ' + name.encode())
+    return {
+        'id': f'msg-{name}', 'subject': name, 'sender': 'billing@example.com',
+        'attachments': [str(path)],
+        'hashes': {str(path): ('sha-' + name, 20, name)}
+    }
+
+def test_enqueue_emails_stores_and_queues(service, tmp_path):
+    email = _email(tmp_path, 'invoice.pdf')
+    service.email_monitor.check_new_emails.return_value = [email]
+    job_queue = Mock()
+    job_queue.enqueue_many.side_effect = lambda source, jobs: len(jobs)
+
+    assert service.enqueue_emails(job_queue) == 1
+
+    (_, payload), = job_queue.enqueue_many.call_args.args[1]
+    assert payload['email']['id'] == 'msg-invoice.pdf'
+    with service.storage.open_document(payload['document_id']) as content:
+        assert bytes(content) == b'%PDF-1.7 invoice.pdf'
+    assert not os.path.exists(email['attachments'][0])
+
+def test_message_is_left_unfinished_when_storage_fails(service, tmp_path):
+    email = _email(tmp_path, 'invoice.pdf')
+    service.email_monitor.check_new_emails.return_value = [email]
+    service.storage.save_document = Mock(side_effect=OSError('disk full'))
+    job_queue = Mock()
+
+    assert service.enqueue_emails(job_queue) == 0
+    job_queue.enqueue_many.assert_not_called()
+    # Not completed, so it stays unread and finish_sync holds the cursor for a retry
+    service.email_monitor.complete_messages.assert_called_once_with(set())
+    service.email_monitor.finish_sync.assert_called_once()
+
+def test_failed_bulk_insert_falls_back_to_single_jobs(service, tmp_path):
+    emails = [_email(tmp_path, 'a.pdf'), _email(tmp_path, 'b.pdf')]
+    service.email_monitor.check_new_emails.return_value = emails
+    job_queue = Mock()
+    job_queue.enqueue_many.side_effect = RuntimeError('database is locked')
+    job_queue.enqueue.side_effect = [None, RuntimeError('database is locked')]
+
+    assert service.enqueue_emails(job_queue) == 1
+
+    # Only the queued attachment's message is recorded; the other is fetched again
+    service.email_monitor.complete_messages.assert_called_once_with({'msg-a.pdf'})
+
+def test_processed_job_is_recorded_with_extracted_fields(service, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine)
+    service.documents = DocumentRepository(sessionmaker(bind=engine))
+    service.storage.save_document('doc-1', b'%PDF-1.7 invoice', {'filename': 'invoice.pdf'})
+    service.process_content = Mock(return_value={'analysis_results': {'invoice_data': {
+        'vendor_name': 'Acme', 'invoice_number': 'INV-7', 'total_amount': '1,250.00'
+    }}})
+    service.create_xero_invoice = Mock(return_value={'InvoiceID': 'xero-1'})
+    job = Job(id='doc-1', source='email', attempts=1, max_attempts=5, worker_id='w1', payload={
+        'document_id': 'doc-1', 'filename': 'invoice.pdf', 'email': {'id': 'msg-1', 'subject': 'Invoice'}
+    })
+
+    service.process_job(job)
+
+    document = service.documents.by_xero_references(['xero-1'])['xero-1']
+    assert (document.id, document.vendor, document.invoice_number) == ('doc-1', 'Acme', 'INV-7')
+    assert document.total_amount == Decimal('1250.00')
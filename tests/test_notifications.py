@@ -0,0 +1,76 @@
+import threading
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from services.notifications import ChangeNotifier, LocalNotifier, create_notification_router
+
+class StubSubscriptions:
+    client_state = 'secret'
+
+    def verify(self, notification):
+        return notification.get('clientState') == self.client_state
+
+@pytest.fixture
+def notifier():
+    return ChangeNotifier(debounce=0)
+
+@pytest.fixture
+def client(notifier):
+    app = FastAPI()
+    app.include_router(create_notification_router(StubSubscriptions(), notifier))
+    return TestClient(app)
+
+def test_subscription_validation_echoes_token(client):
+    response = client.post('/notifications/graph?validationToken=abc123')
+    assert response.status_code == 200
+    assert response.text == 'abc123'
+
+def test_notification_wakes_waiting_loop(client, notifier):
+    woke = []
+    waiter = threading.Thread(target=lambda: woke.append(notifier.wait(5)))
+    waiter.start()
+
+    response = LocalNotifier('/notifications/graph', 'secret', session=client).send(['msg-1'])
+    waiter.join()
+
+    assert response.status_code == 202
+    assert woke == [True]
+    assert notifier.drain() == ['msg-1']
+
+def test_notification_with_wrong_client_state_is_ignored(client, notifier):
+    LocalNotifier('/notifications/graph', 'wrong', session=client).send(['msg-1'])
+
+    assert notifier.wait(0.1) is False
+    assert notifier.drain() == []
+
+def test_generated_client_state_survives_restart(tmp_path, monkeypatch):
+    from unittest.mock import Mock
+    from services.graph_subscriptions import SubscriptionManager
+    from utils.config import config
+    monkeypatch.setattr(config, 'STATE_PATH', str(tmp_path))
+    monkeypatch.setattr(config, 'GRAPH_CLIENT_STATE', None)
+
+    auth = Mock()
+    auth.graph.request.return_value = Mock(status_code=201, json=lambda: {
+        'id': 'sub-1', 'expirationDateTime': '2999-01-01T00:00:00.0000000Z'
+    })
+    first = SubscriptionManager(auth, notification_url='https://example.com/notifications/graph')
+    first.ensure()
+
+    restarted = SubscriptionManager(auth, notification_url='https://example.com/notifications/graph')
+    assert restarted.client_state == first.client_state
+    assert restarted.ensure()['id'] == 'sub-1'
+    assert auth.graph.request.call_count == 1  # no second subscription
+
+def test_notification_during_timeout_is_kept_for_next_wait(notifier, monkeypatch):
+    # The notification lands after the wait timed out but before it returned
+    original_wait = notifier._event.wait
+    def wait(timeout):
+        result = original_wait(timeout)
+        notifier.notify(['msg-1'])
+        return result
+    monkeypatch.setattr(notifier._event, 'wait', wait)
+
+    assert notifier.wait(0) is False
+    monkeypatch.setattr(notifier._event, 'wait', original_wait)
+    assert notifier.wait(0) is True
@@ -0,0 +1,32 @@
+import asyncio
+from concurrent.futures import Future
+from unittest.mock import Mock
+import pytest
+from processors.ocr_pool import OCRPool, QueueFullError
+
+@pytest.fixture
+def pool():
+    pool = OCRPool(max_workers=1, max_pending=2)
+    # Futures stay pending until the test resolves them
+    pool._executor = Mock()
+    pool._executor.submit.side_effect = lambda *args: Future()
+    return pool
+
+def test_full_pool_rejects_new_work(pool):
+    first = pool.submit('text', b'a')
+    pool.submit('text', b'b')
+
+    assert pool.is_full
+    with pytest.raises(QueueFullError):
+        pool.submit('text', b'c')
+
+    first.set_result({'analysis_results': {}})
+    assert pool.pending == 1
+    pool.submit('text', b'c')
+
+def test_submit_async_gives_up_after_timeout(pool):
+    pool.submit('text', b'a')
+    pool.submit('text', b'b')
+
+    with pytest.raises(QueueFullError):
+        asyncio.run(pool.submit_async('text', b'c', timeout=0.1))
@@ -0,0 +1,159 @@
+import pytest
+from unittest.mock import patch
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+from models.database.base import Base
+from models.database.models import ProcessingJob, ProcessedDocument
+from models.database.repository import DocumentRepository, JobRepository
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    start = datetime(2026, 1, 1)
+    with session_factory() as session:
+        for n in range(6):
+            session.add(ProcessingJob(
+                id=f'job-{n}', source='email', status='failed' if n % 2 else 'completed',
+                created_at=start + timedelta(minutes=n)
+            ))
+            session.add(ProcessedDocument(
+                id=f'doc-{n}', job_id=f'job-{n}', document_type='invoice', storage_path=f'doc-{n}',
+                xero_reference=f'INV-{n}', created_at=start + timedelta(minutes=n)
+            ))
+        session.commit()
+    return session_factory
+
+def test_job_queries(session_factory):
+    jobs = JobRepository(session_factory)
+
+    assert jobs.count_by_status() == {'completed': 3, 'failed': 3}
+    page = jobs.list_by_status(['failed', 'completed'], limit=4)
+    assert [job.id for job in page] == ['job-5', 'job-4', 'job-3', 'job-2']
+    next_page = jobs.list_by_status(['failed', 'completed'], limit=4, before=(page[-1].created_at, page[-1].id))
+    assert [job.id for job in next_page] == ['job-1', 'job-0']
+
+    assert jobs.requeue(['job-1', 'job-2']) == 1  # job-2 had not failed
+    assert jobs.get_many(['job-1'])['job-1'].status == 'pending'
+
+def test_paging_does_not_skip_jobs_with_equal_timestamps(session_factory):
+    jobs = JobRepository(session_factory)
+    # One bulk insert gives the whole batch the same created_at
+    created = datetime(2026, 2, 1)
+    jobs.insert_many([{'id': f'same-{n}', 'source': 'email', 'status': 'pending', 'created_at': created}
+                      for n in range(5)])
+
+    seen, before = [], None
+    while True:
+        page = jobs.list_by_status(['pending'], limit=2, before=before)
+        if not page:
+            break
+        seen.extend(job.id for job in page)
+        before = (page[-1].created_at, page[-1].id)
+    assert seen == [f'same-{n}' for n in reversed(range(5))]
+
+def test_document_queries(session_factory):
+    documents = DocumentRepository(session_factory)
+
+    assert [d.id for d in documents.for_jobs(['job-1', 'job-2'])['job-2']] == ['doc-2']
+    assert set(documents.by_xero_references(['INV-3', 'INV-9'])) == {'INV-3'}
+    assert [d.id for d in documents.recent('invoice', limit=2)] == ['doc-5', 'doc-4']
+
+def test_status_listing_uses_composite_index(session_factory):
+    query = (
+        select(ProcessingJob).where(ProcessingJob.status == 'failed')
+        .order_by(ProcessingJob.created_at.desc()).limit(10)
+    )
+    with session_factory() as session:
+        sql = str(query.compile(session.bind, compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(row[-1] for row in session.execute(text(f'EXPLAIN QUERY PLAN {sql}')))
+    assert 'ix_processing_jobs_status_created_at' in plan
+
+def test_bulk_insert_and_status_transitions(session_factory):
+    jobs = JobRepository(session_factory)
+    rows = [{'id': f'bulk-{n}', 'source': 'email', 'status': 'pending', 'job_metadata': {'n': n}}
+            for n in range(1200)]
+
+    assert jobs.insert_many(rows) == 1200
+    assert jobs.insert_many(rows[:10]) == 0  # replayed rows are skipped
+
+    jobs.update_status_many([{'id': 'bulk-1', 'status': 'failed', 'error_message': 'timeout'}])
+    jobs.upsert_many([
+        {'id': 'bulk-2', 'source': 'email', 'status': 'completed', 'error_message': None},
+        {'id': 'new-job', 'source': 'email', 'status': 'pending', 'error_message': None}
+    ])
+
+    found = jobs.get_many(['bulk-1', 'bulk-2', 'new-job', 'bulk-999'])
+    assert (found['bulk-1'].status, found['bulk-1'].error_message) == ('failed', 'timeout')
+    assert found['bulk-2'].status == 'completed'
+    assert found['new-job'].status == 'pending'
+    assert found['bulk-999'].job_metadata == {'n': 999}
+
+def test_upsert_fallback_without_dialect_support(session_factory):
+    jobs = JobRepository(session_factory)
+    rows = [
+        {'id': 'job-1', 'source': 'email', 'status': 'pending', 'error_message': None},
+        {'id': 'fallback', 'source': 'email', 'status': 'pending', 'error_message': None}
+    ]
+    with patch('models.database.repository._upsert', return_value=None):
+        assert jobs.insert_many(rows) == 1  # job-1 exists and is left alone
+        assert jobs.get_many(['job-1'])['job-1'].status == 'failed'
+        assert jobs.upsert_many(rows) == 2
+    assert jobs.get_many(['job-1'])['job-1'].status == 'pending'
+
+def test_document_upsert_refreshes_results(session_factory):
+    documents = DocumentRepository(session_factory)
+    documents.upsert_many([{
+        'id': 'doc-1', 'job_id': 'job-1', 'document_type': 'invoice', 'storage_path': 'doc-1',
+        'processed_content': {'total': 10}, 'xero_reference': 'INV-NEW'
+    }])
+
+    assert documents.by_xero_references(['INV-NEW'])['INV-NEW'].processed_content == {'total': 10}
+
+def _invoice(vendor, number, total, day):
+    return {
+        'analysis_results': {'invoice_data': {
+            'vendor_name': vendor, 'invoice_number': number, 'total_amount': total, 'date': day
+        }},
+        'ocr_results': {'confidence': 91.5}
+    }
+
+def test_extracted_columns_support_sql_reporting(session_factory):
+    with session_factory() as session:
+        session.add(ProcessedDocument(
+            id='orm-doc', document_type='invoice', storage_path='orm-doc',
+            processed_content=_invoice('Acme Supplies', 'A-100', '€1,250.00', 'Mar 3, 2026')
+        ))
+        session.commit()
+
+    documents = DocumentRepository(session_factory)
+    documents.insert_many([{
+        'id': 'bulk-doc', 'document_type': 'invoice', 'storage_path': 'bulk-doc',
+        'processed_content': _invoice('Acme Supplies', 'A-100', 99.5, '2026-03-20')
+    }])
+
+    stored = documents.search(vendor='Acme Supplies', date_from=date(2026, 3, 1))
+    assert [d.id for d in stored] == ['bulk-doc', 'orm-doc']
+    orm_doc = stored[1]
+    assert (orm_doc.total_amount, orm_doc.currency, orm_doc.confidence) == (Decimal('1250.00'), 'EUR', 91.5)
+
+    assert [d.id for d in documents.search(min_total=Decimal('1000'))] == ['orm-doc']
+    assert [d.id for d in documents.find_duplicates('Acme Supplies', 'A-100', exclude_id='orm-doc')] == ['bulk-doc']
+    assert documents.totals_by_vendor()['Acme Supplies'] == {'count': 2, 'total': Decimal('1349.50')}
+
+@pytest.mark.parametrize('text, expected', [
+    ('€1.250,00', Decimal('1250.00')),
+    ('1 250,00 EUR', Decimal('1250.00')),
+    ('$1,250.00', Decimal('1250.00')),
+    ('1,250', Decimal('1250.00')),
+    (float('inf'), None),
+    (1e20, None),
+    ('n/a', None),
+])
+def test_amount_parsing(text, expected):
+    from models.database.extracted_fields import _parse_amount
+    assert _parse_amount(text) == expected
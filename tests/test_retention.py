@@ -0,0 +1,61 @@
+import os
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import pytest
+from utils.retention import RetentionManager
+from utils.storage import Storage
+
+@pytest.fixture(autouse=True)
+def temp_dir(tmp_path):
+    path = tmp_path / 'scratch'
+    path.mkdir()
+    with patch('utils.retention.TEMP_DIR', str(path)):
+        yield path
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = Storage(base_path=str(tmp_path / 'storage'))
+    storage.save_document('old-scan', b'%PDF-1.4 old invoice', {'filename': 'old.pdf'})
+    storage.save_processed_results('old-scan', {'total': 42})
+    return storage
+
+def test_old_partitions_are_archived_and_still_readable(storage):
+    manager = RetentionManager(storage, archive_after_days=90, delete_after_days=0)
+    stats = manager.run(now=datetime.now() + timedelta(days=120))
+
+    assert stats['archived'] == 2
+    assert storage.index.count() == 0
+    assert os.listdir(os.path.join(storage.base_path, 'metadata')) == []
+    assert os.listdir(os.path.join(storage.base_path, 'blobs')) == []
+
+    assert storage.get_document('old-scan') == {
+        'content': b'%PDF-1.4 old invoice', 'metadata': {'filename': 'old.pdf'}
+    }
+    assert storage.get_processed_results('old-scan') == {'total': 42}
+    with storage.open_document('old-scan') as content:
+        assert content == b'%PDF-1.4 old invoice'
+
+    # The bundles alone are enough to rebuild the index
+    storage.index.close()
+    os.remove(os.path.join(storage.base_path, 'index.db'))
+    reopened = Storage(base_path=storage.base_path)
+    assert reopened.get_processed_results('old-scan') == {'total': 42}
+
+def test_expired_bundles_and_stale_temp_files_are_deleted(storage, temp_dir):
+    manager = RetentionManager(storage, archive_after_days=90, delete_after_days=365, temp_max_age_hours=1)
+    manager.run(now=datetime.now() + timedelta(days=120))
+
+    stale, fresh = temp_dir / 'msg_invoice.pdf', temp_dir / 'msg_new.pdf'
+    stale.write_bytes(b'x')
+    fresh.write_bytes(b'x')
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+
+    assert manager.purge_temp_files() == 1
+    assert fresh.exists() and not stale.exists()
+
+    stats = manager.run(now=datetime.now() + timedelta(days=500))
+    assert stats['bundles_deleted'] == 1
+    assert os.listdir(os.path.join(storage.base_path, 'archive')) == []
+    with pytest.raises(FileNotFoundError):
+        storage.get_document('old-scan')
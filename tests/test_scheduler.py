@@ -0,0 +1,31 @@
+from utils.scheduler import AdaptivePollScheduler
+
+def make_scheduler(**kwargs):
+    options = dict(base_interval=300, min_interval=15, max_interval=1800,
+                   backoff=2.0, jitter=0, adaptive=True)
+    options.update(kwargs)
+    return AdaptivePollScheduler(**options)
+
+def test_backlog_shortens_interval():
+    scheduler = make_scheduler()
+    assert scheduler.record(10) == 15
+    assert scheduler.next_delay() == 15
+
+def test_idle_backs_off_exponentially_to_max():
+    scheduler = make_scheduler()
+    scheduler.record(3)
+    intervals = [scheduler.record(0) for _ in range(10)]
+
+    assert intervals[:4] == [30, 60, 120, 240]
+    assert intervals[-1] == 1800
+    assert scheduler.get_status()['idle_polls'] == 10
+
+def test_jitter_stays_within_bounds():
+    scheduler = make_scheduler(jitter=0.1)
+    delays = [scheduler.next_delay() for _ in range(100)]
+    assert all(270 <= delay <= 330 for delay in delays)
+
+def test_fixed_mode_ignores_activity():
+    scheduler = make_scheduler(adaptive=False)
+    assert scheduler.record(50) == 300
+    assert scheduler.record(0) == 300
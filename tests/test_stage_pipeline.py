@@ -0,0 +1,58 @@
+import threading
+import time
+from services.pipeline import Pipeline, Stage
+
+def test_items_flow_through_all_stages():
+    results = []
+    lock = threading.Lock()
+
+    def collect(item):
+        with lock:
+            results.append(item)
+
+    pipeline = Pipeline([
+        Stage('split', lambda n: [n, n + 100], fan_out=True),
+        Stage('double', lambda n: n * 2, concurrency=3),
+        Stage('collect', collect)
+    ])
+    pipeline.start()
+    for n in range(5):
+        pipeline.put(n)
+    pipeline.join()
+
+    assert sorted(results) == sorted([n * 2 for n in range(5)] + [(n + 100) * 2 for n in range(5)])
+    metrics = pipeline.get_metrics()
+    assert metrics['split']['processed'] == 5
+    assert metrics['double']['processed'] == 10
+    pipeline.stop()
+
+def test_stages_overlap():
+    def slow(item):
+        time.sleep(0.1)
+        return item
+
+    pipeline = Pipeline([Stage('io', slow, concurrency=4), Stage('cpu', slow, concurrency=4)])
+    pipeline.start()
+
+    started = time.monotonic()
+    for n in range(8):
+        pipeline.put(n)
+    pipeline.join()
+
+    # 16 sequential steps of 0.1s would take 1.6s
+    assert time.monotonic() - started < 1.0
+    pipeline.stop()
+
+def test_failures_are_counted_and_dropped():
+    def explode(item):
+        raise ValueError("bad item")
+
+    pipeline = Pipeline([Stage('explode', explode), Stage('never', lambda item: item)])
+    pipeline.start()
+    pipeline.put(1)
+    pipeline.join()
+
+    metrics = pipeline.get_metrics()
+    assert metrics['explode']['failed'] == 1
+    assert metrics['never']['processed'] == 0
+    pipeline.stop()
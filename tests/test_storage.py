@@ -0,0 +1,94 @@
+import os
+import mmap
+import numpy as np
+import pytest
+from utils.storage import Storage
+
+@pytest.fixture
+def storage(tmp_path):
+    return Storage(base_path=str(tmp_path / 'storage'))
+
+def test_lookup_by_id_uses_index(storage):
+    storage.save_document('doc-1', b'%PDF-1.4 invoice', {'filename': 'invoice.pdf'})
+    storage.save_processed_results('doc-1', {'total': 42})
+
+    entry = storage.index.get('doc-1')
+    assert entry.size == len(b'%PDF-1.4 invoice')
+    assert entry.sha256
+
+    document = storage.get_document('doc-1')
+    assert document == {'content': b'%PDF-1.4 invoice', 'metadata': {'filename': 'invoice.pdf'}}
+    assert storage.get_processed_results('doc-1') == {'total': 42}
+
+    with pytest.raises(FileNotFoundError):
+        storage.get_document('missing')
+
+def test_existing_store_is_indexed_on_first_open(tmp_path):
+    base = tmp_path / 'storage'
+    storage = Storage(base_path=str(base))
+    storage.save_document('doc-1', b'content', {})
+    storage.index.close()
+    os.remove(base / 'index.db')
+
+    reopened = Storage(base_path=str(base))
+
+    assert reopened.get_document('doc-1')['content'] == b'content'
+
+def test_identical_content_is_stored_once(storage):
+    first = storage.save_document('doc-1', b'same invoice', {'n': 1})
+    second = storage.save_document('doc-2', b'same invoice', {'n': 2})
+
+    assert first == second
+    assert storage.index.blob_stats()['blobs'] == 1
+    assert storage.get_document('doc-2')['metadata'] == {'n': 2}
+
+    storage.delete_document('doc-1')
+    assert os.path.exists(second)
+    storage.delete_document('doc-2')
+    assert not os.path.exists(second)
+
+def test_processed_results_are_compressed_transparently(storage):
+    results = {'ocr_results': {'text': 'Invoice total $42.00 ' * 200}}
+    for n in range(5):
+        storage.save_processed_results(f'doc-{n}', results)
+    assert storage.train_json_dictionary()
+
+    storage.save_processed_results('doc-new', results)
+    entry = storage.index.get('doc-new', 'processed')
+    stored_size = os.path.getsize(os.path.join(storage.base_path, entry.path))
+
+    assert stored_size < entry.size / 10
+    assert storage.get_processed_results('doc-new') == results
+    assert storage.get_processed_results('doc-0') == results
+
+def test_open_document_maps_raw_blobs(storage):
+    pdf = b'%PDF-1.4 ' + b'x' * 10000
+    storage.save_document('scan', pdf, {})
+    storage.save_document('note', b'plain text body ' * 100, {})
+
+    with storage.open_document('scan') as content:
+        assert isinstance(content.obj, mmap.mmap)
+        assert content == pdf
+        array = np.frombuffer(content, np.uint8)
+        assert not array.flags.owndata  # decoded straight from the map
+        del array
+
+    with storage.open_document('note') as content:
+        assert bytes(content) == b'plain text body ' * 100
+
+def test_batch_indexes_documents_once_committed(storage):
+    with storage.batch():
+        storage.save_document('doc-1', b'same invoice', {'n': 1})
+        storage.save_document('doc-2', b'same invoice', {'n': 2})
+        assert storage.index.get('doc-1') is None
+
+    assert storage.writer.commits == 1
+    assert storage.index.blob_stats()['blobs'] == 1
+    assert storage.get_document('doc-2') == {'content': b'same invoice', 'metadata': {'n': 2}}
+
+    with pytest.raises(RuntimeError):
+        with storage.batch():
+            storage.save_document('doc-3', b'other invoice', {})
+            raise RuntimeError('poll failed')
+    assert storage.index.get('doc-3') is None
+    assert not [name for root, _, names in os.walk(storage.base_path) for name in names if name.endswith('.tmp')]
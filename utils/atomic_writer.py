@@ -0,0 +1,229 @@
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from utils.config import config
+
+_datasync = getattr(os, 'fdatasync', os.fsync)
+
+class _Batch:
+    """Files waiting for the same round of fsyncs"""
+
+    def __init__(self):
+        self.files: List[Tuple[str, str, int, int]] = []  # (temp path, final path, writer, stage)
+        self.writers = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.errors: Dict[int, BaseException] = {}
+
+class AtomicWriter:
+    """Writes files via temp file + rename, with group-committed fsyncs.
+
+    Each file is written to a temp name next to its destination and only
+    renamed into place once its contents are on disk, so a reader never
+    sees a partial file. Concurrent writers share a batch: the first one
+    waits up to ``window`` seconds while other writers are still writing
+    their temp files, then commits the whole batch while the rest wait on
+    the result. A single thread can also gather many ``write_many`` calls
+    into one commit with ``deferred()``.
+
+    Each file still needs its own fdatasync for its data; what a batch
+    shares is the fsync of each directory. Renames happen in stages (the
+    n-th file of every ``write_many`` call together), and a stage's
+    directories are synced before the next stage is renamed, so a file
+    that refers to an earlier one never survives a crash without it. A
+    failure only fails the writer whose file it was.
+    """
+
+    def __init__(self, fsync: Optional[bool] = None, window: Optional[float] = None,
+                 max_batch: Optional[int] = None):
+        self.fsync = config.STORAGE_FSYNC if fsync is None else fsync
+        self.window = config.STORAGE_FSYNC_WINDOW_MS / 1000 if window is None else window
+        self.max_batch = max_batch or config.STORAGE_FSYNC_BATCH
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._pending: Optional[_Batch] = None
+        self._writing = 0  # writers still writing temp files, i.e. batch partners on the way
+        self._local = threading.local()  # this thread's deferred() batch
+        self.commits = 0
+
+    def write(self, path: str, data: bytes):
+        self.write_many([(path, data)])
+
+    @contextmanager
+    def deferred(self):
+        """Commit every ``write_many`` this thread makes inside the block with one round of syncs.
+
+        Inside the block files are only written to temp names; they are
+        renamed into place and durable once the block exits, which raises
+        if any of them failed.
+        """
+        if not self.fsync or getattr(self._local, 'batch', None) is not None:
+            yield
+            return
+
+        batch = self._local.batch = _Batch()
+        batch.writers = 1
+        try:
+            yield
+        except BaseException:
+            self._discard([(temp_file, path) for temp_file, path, _, _ in batch.files])
+            raise
+        finally:
+            self._local.batch = None
+
+        if batch.files:
+            with self._commit_lock:
+                self._commit(batch)
+            error = batch.errors.get(0)
+            if error is not None:
+                raise error
+
+    def write_many(self, files: List[Tuple[str, bytes]], first_stage: int = 0):
+        """Atomically write each (path, data) pair; returns once they are durable.
+
+        Files are renamed into place in the order given, and each is durable
+        before the next is renamed, so a file that refers to another should
+        come after it. ``first_stage`` places the first file in a later
+        rename stage of the batch. Inside ``deferred()`` this returns before
+        the commit.
+        """
+        deferred = getattr(self._local, 'batch', None) if self.fsync else None
+        if self.fsync and deferred is None:
+            with self._lock:
+                self._writing += 1
+
+        temps = []
+        try:
+            for path, data in files:
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                temp_file = f"{path}.{uuid.uuid4().hex}.tmp"
+                temps.append((temp_file, path))
+                with open(temp_file, 'wb') as f:
+                    f.write(data)
+        except Exception:
+            self._discard(temps)
+            if self.fsync and deferred is None:
+                with self._lock:
+                    self._writer_ready()
+            raise
+
+        if not self.fsync:
+            for temp_file, path in temps:
+                os.replace(temp_file, path)
+            return
+
+        if deferred is not None:
+            deferred.files.extend((temp_file, path, 0, stage) for stage, (temp_file, path) in enumerate(temps, first_stage))
+            return
+
+        with self._lock:
+            leader = self._pending is None
+            if leader:
+                self._pending = _Batch()
+            batch = self._pending
+            writer = batch.writers
+            batch.writers += 1
+            batch.files.extend((temp_file, path, writer, stage) for stage, (temp_file, path) in enumerate(temps, first_stage))
+            self._writer_ready()
+
+        if leader:
+            # Set straight away when no other writer is on the way, so a lone writer never waits
+            batch.full.wait(self.window)
+            # Batches commit one at a time so renames land in submission order;
+            # writers arriving during the previous commit still join this batch
+            with self._commit_lock:
+                with self._lock:
+                    self._pending = None
+                self._commit(batch)
+        else:
+            batch.done.wait()
+
+        error = batch.errors.get(writer)
+        if error is not None:
+            raise error
+
+    def _writer_ready(self):
+        """Called under the lock once a writer's temp files are written (or abandoned)"""
+        self._writing -= 1
+        batch = self._pending
+        if batch is not None and (not self._writing or len(batch.files) >= self.max_batch):
+            batch.full.set()
+
+    def replace(self, temp_file: str, path: str):
+        """Durably move a file written by other means (e.g. tarfile) into place"""
+        if self.fsync:
+            self._sync(temp_file)
+        os.replace(temp_file, path)
+        if self.fsync:
+            self._sync_directory(os.path.dirname(path) or '.')
+
+    def _commit(self, batch: _Batch):
+        errors = batch.errors
+        try:
+            for temp_file, _, writer, _ in batch.files:
+                if writer not in errors:
+                    try:
+                        self._sync(temp_file)
+                    except OSError as e:
+                        errors[writer] = e
+
+            for stage in sorted({stage for _, _, _, stage in batch.files}):
+                directories = {}
+                for temp_file, path, writer, file_stage in batch.files:
+                    if file_stage != stage:
+                        continue
+                    if writer in errors:
+                        self._discard([(temp_file, path)])
+                        continue
+                    try:
+                        os.replace(temp_file, path)
+                    except OSError as e:
+                        errors[writer] = e
+                        self._discard([(temp_file, path)])
+                        continue
+                    directories.setdefault(os.path.dirname(path) or '.', set()).add(writer)
+
+                # Durable before the next stage, which may refer to these files, is renamed
+                for directory, writers in directories.items():
+                    try:
+                        self._sync_directory(directory)
+                    except OSError as e:
+                        for writer in writers:
+                            errors.setdefault(writer, e)
+            self.commits += 1
+        except BaseException as e:
+            for _, _, writer, _ in batch.files:
+                errors.setdefault(writer, e)
+            self._discard([(temp_file, path) for temp_file, path, _, _ in batch.files])
+        finally:
+            batch.done.set()
+
+    @staticmethod
+    def _sync(path: str):
+        """Flush a file's data; fdatasync skips the metadata-only journal write where available"""
+        fd = os.open(path, os.O_RDWR)
+        try:
+            _datasync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _sync_directory(directory: str):
+        """Persist the renames in ``directory`` (not supported on Windows)"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _discard(temps: List[Tuple[str, str]]):
+        for temp_file, _ in temps:
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+from utils.config import config
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is used instead
+    zstandard = None
+
+# Framed data: magic, codec id, dictionary id (0 = none), then the payload.
+# Unframed data is stored as-is, which keeps raw blobs readable in place.
+MAGIC = b'XAC\x01'
+HEADER = struct.Struct('>4sBI')
+
+# Formats that are already compressed; recompressing them wastes CPU
+_COMPRESSED_MAGIC = (b'%PDF-', b'\x89PNG', b'\xff\xd8\xff', b'GIF8', b'PK\x03\x04', b'RIFF')
+
+ZLIB_MAX_DICTIONARY = 32 * 1024  # zlib only uses the last 32 KiB of a preset dictionary
+
+class RawCodec:
+    id = 0
+    name = 'raw'
+
+    def compress(self, data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+        return data
+
+    def decompress(self, data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+        return bytes(data)
+
+class ZlibCodec:
+    id = 1
+    name = 'zlib'
+
+    def __init__(self, level: Optional[int] = None):
+        self.level = 6 if level is None else level
+
+    def compress(self, data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+        compressor = zlib.compressobj(self.level, zdict=dictionary) if dictionary else zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+class ZstdCodec:
+    id = 2
+    name = 'zstd'
+
+    def __init__(self, level: Optional[int] = None):
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        self.level = 3 if level is None else level
+        self._local = threading.local()  # zstd contexts are not thread-safe
+
+    def _contexts(self, dictionary: Optional[bytes]):
+        cache = self._local.__dict__.setdefault('contexts', {})
+        key = hashlib.sha256(dictionary).digest() if dictionary else None
+        if key not in cache:
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            cache[key] = (
+                zstandard.ZstdCompressor(level=self.level, dict_data=dict_data),
+                zstandard.ZstdDecompressor(dict_data=dict_data)
+            )
+        return cache[key]
+
+    def compress(self, data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+        return self._contexts(dictionary)[0].compress(data)
+
+    def decompress(self, data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+        return self._contexts(dictionary)[1].decompress(data)
+
+def available_codecs() -> List[str]:
+    return ['raw', 'zlib'] + (['zstd'] if zstandard is not None else [])
+
+def make_codec(name: str, level: Optional[int] = None):
+    if name == 'raw':
+        return RawCodec()
+    if name == 'zlib':
+        return ZlibCodec(level)
+    if name == 'zstd':
+        return ZstdCodec(level)
+    raise ValueError(f"Unknown codec: {name}")
+
+def train_dictionary(codec_name: str, samples: List[bytes], size: int) -> bytes:
+    """Build a shared dictionary from sample payloads"""
+    if codec_name == 'zstd':
+        return zstandard.train_dictionary(size, samples).as_bytes()
+
+    # zlib has no trainer; a preset dictionary of recent samples captures the
+    # repeated keys and structure, with the most useful bytes at the end
+    size = min(size, ZLIB_MAX_DICTIONARY)
+    dictionary = b''
+    for sample in samples:
+        dictionary = (dictionary + sample)[-size:]
+    return dictionary
+
+class Compressor:
+    """Chooses a codec per content type and frames/unframes stored data.
+
+    ``STORAGE_COMPRESSION`` picks the codec: ``auto`` (zstd when installed,
+    else zlib), ``zstd``, ``zlib`` or ``none``. JSON uses a trained
+    dictionary when one exists, which is where most of the gain on small
+    result documents comes from. Already-compressed formats (PDF, JPEG,
+    PNG, ...) are stored raw.
+    """
+
+    def __init__(self, dictionary_dir: str, codec: Optional[str] = None, level: Optional[int] = None):
+        self.dictionary_dir = dictionary_dir
+        name = (codec or config.STORAGE_COMPRESSION).lower()
+        if name == 'auto':
+            name = 'zstd' if zstandard is not None else 'zlib'
+        self.codec = make_codec('raw' if name == 'none' else name, level or config.STORAGE_COMPRESSION_LEVEL)
+
+        self._decoders: Dict[int, object] = {RawCodec.id: RawCodec(), ZlibCodec.id: ZlibCodec()}
+        if zstandard is not None:
+            self._decoders[ZstdCodec.id] = ZstdCodec()
+        self._decoders[self.codec.id] = self.codec
+
+        self._dictionaries: Dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        self.json_dictionary_id = self._load_current()
+
+    # -- dictionaries -------------------------------------------------------
+
+    def _dictionary_file(self, dictionary_id: int) -> str:
+        return os.path.join(self.dictionary_dir, f"{dictionary_id:08x}.dict")
+
+    def _current_file(self) -> str:
+        return os.path.join(self.dictionary_dir, f"current_{self.codec.name}")
+
+    def _load_current(self) -> int:
+        try:
+            with open(self._current_file(), 'r') as f:
+                return int(f.read().strip(), 16)
+        except (OSError, ValueError):
+            return 0
+
+    def dictionary(self, dictionary_id: int) -> Optional[bytes]:
+        if not dictionary_id:
+            return None
+        with self._lock:
+            if dictionary_id not in self._dictionaries:
+                with open(self._dictionary_file(dictionary_id), 'rb') as f:
+                    self._dictionaries[dictionary_id] = f.read()
+            return self._dictionaries[dictionary_id]
+
+    def train(self, samples: List[bytes], size: Optional[int] = None) -> int:
+        """Train a JSON dictionary for the active codec and make it current"""
+        if isinstance(self.codec, RawCodec) or not samples:
+            return 0
+        data = train_dictionary(self.codec.name, samples, size or config.STORAGE_DICTIONARY_SIZE)
+        # Dictionary ids are never 0, which means "no dictionary"
+        dictionary_id = int.from_bytes(hashlib.sha256(data).digest()[:4], 'big') or 1
+
+        os.makedirs(self.dictionary_dir, exist_ok=True)
+        with open(self._dictionary_file(dictionary_id), 'wb') as f:
+            f.write(data)
+        temp_file = f"{self._current_file()}.tmp"
+        with open(temp_file, 'w') as f:
+            f.write(f"{dictionary_id:08x}")
+        os.replace(temp_file, self._current_file())
+
+        with self._lock:
+            self._dictionaries[dictionary_id] = data
+        self.json_dictionary_id = dictionary_id
+        return dictionary_id
+
+    # -- framing ------------------------------------------------------------
+
+    def codec_for(self, data: bytes, kind: str) -> Tuple[object, int]:
+        if kind == 'json':
+            return self.codec, self.json_dictionary_id
+        if bytes(data[:8]).startswith(_COMPRESSED_MAGIC):
+            return RawCodec(), 0
+        return self.codec, 0
+
+    def encode(self, data: bytes, kind: str = 'document') -> bytes:
+        """Compress ``data`` with the codec for its kind"""
+        codec, dictionary_id = self.codec_for(data, kind)
+        if isinstance(codec, RawCodec) and not self.is_framed(data):
+            return data  # stored unframed so it can be read (and mapped) in place
+        payload = codec.compress(data, self.dictionary(dictionary_id))
+        return HEADER.pack(MAGIC, codec.id, dictionary_id) + payload
+
+    def is_framed(self, data) -> bool:
+        return bytes(data[:len(MAGIC)]) == MAGIC
+
+    def decode(self, data) -> bytes:
+        """Reverse ``encode``; unframed data is returned unchanged"""
+        if not self.is_framed(data):
+            return data if isinstance(data, bytes) else bytes(data)
+        _, codec_id, dictionary_id = HEADER.unpack(bytes(data[:HEADER.size]))
+        codec = self._decoders.get(codec_id)
+        if codec is None:
+            raise RuntimeError(f"Stored data uses codec {codec_id}, which is not available")
+        return codec.decompress(data[HEADER.size:], self.dictionary(dictionary_id))
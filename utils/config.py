@@ -21,6 +21,18 @@ class Config:
     MS365_CLIENT_SECRET = os.getenv('MS365_CLIENT_SECRET')
     MS365_TENANT_ID = os.getenv('MS365_TENANT_ID')
     MS365_USER = os.getenv('MS365_USER')
+    GRAPH_MAX_CONNECTIONS = int(os.getenv('GRAPH_MAX_CONNECTIONS', 8))  # pooled connections / parallel downloads
+    GRAPH_DOWNLOAD_CHUNK_SIZE = int(os.getenv('GRAPH_DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+    MS365_DELTA_LOOKBACK_DAYS = int(os.getenv('MS365_DELTA_LOOKBACK_DAYS', 7))  # initial delta sync window
+    MESSAGE_MAX_ATTEMPTS = int(os.getenv('MESSAGE_MAX_ATTEMPTS', 5))  # failed polls before the sync cursor moves past a message
+    
+    # Graph change notifications (push ingestion); leave the URL unset to poll only
+    GRAPH_NOTIFICATION_URL = os.getenv('GRAPH_NOTIFICATION_URL')  # public https URL of /notifications/graph
+    GRAPH_CLIENT_STATE = os.getenv('GRAPH_CLIENT_STATE')  # shared secret echoed in notifications
+    GRAPH_SUBSCRIPTION_MINUTES = int(os.getenv('GRAPH_SUBSCRIPTION_MINUTES', 4200))  # Graph max for mail is 4230
+    GRAPH_SUBSCRIPTION_RENEW_MARGIN = int(os.getenv('GRAPH_SUBSCRIPTION_RENEW_MARGIN', 120))  # minutes before expiry to renew
+    GRAPH_RECONCILE_INTERVAL = int(os.getenv('GRAPH_RECONCILE_INTERVAL', 1800))  # fallback poll while subscribed
+    GRAPH_NOTIFICATION_DEBOUNCE = float(os.getenv('GRAPH_NOTIFICATION_DEBOUNCE', 2))
     
     # Active Email Configuration (based on provider)
     @property
@@ -39,12 +51,72 @@ class Config:
     XERO_CLIENT_ID = os.getenv('XERO_CLIENT_ID')
     XERO_CLIENT_SECRET = os.getenv('XERO_CLIENT_SECRET')
     XERO_TENANT_ID = os.getenv('XERO_TENANT_ID')
+    DEFAULT_CURRENCY = os.getenv('DEFAULT_CURRENCY')  # ISO code recorded for amounts with a bare '$'
     
     # Storage Configuration
     STORAGE_PATH = os.getenv('STORAGE_PATH', 'storage')
+    STATE_PATH = os.getenv('STATE_PATH', os.path.join(STORAGE_PATH, 'state'))  # sync cursors, ledgers
+    STORAGE_INDEX_PATH = os.getenv('STORAGE_INDEX_PATH', os.path.join(STORAGE_PATH, 'index.db'))  # document id -> path
+    STORAGE_COMPRESSION = os.getenv('STORAGE_COMPRESSION', 'auto')  # auto (zstd if installed, else zlib), zstd, zlib, none
+    STORAGE_COMPRESSION_LEVEL = int(os.getenv('STORAGE_COMPRESSION_LEVEL', 0)) or None  # 0 = codec default
+    STORAGE_DICTIONARY_SIZE = int(os.getenv('STORAGE_DICTIONARY_SIZE', 32 * 1024))  # trained JSON dictionary
+    STORAGE_FSYNC = os.getenv('STORAGE_FSYNC', 'true').lower() == 'true'  # fsync before renaming into place
+    STORAGE_FSYNC_WINDOW_MS = float(os.getenv('STORAGE_FSYNC_WINDOW_MS', 2))  # wait for writes to share a batch
+    STORAGE_FSYNC_BATCH = int(os.getenv('STORAGE_FSYNC_BATCH', 64))  # files per fsync batch
+    RETENTION_ARCHIVE_AFTER_DAYS = int(os.getenv('RETENTION_ARCHIVE_AFTER_DAYS', 90))  # move to monthly bundles; 0 = never
+    RETENTION_DELETE_AFTER_DAYS = int(os.getenv('RETENTION_DELETE_AFTER_DAYS', 0))  # delete bundles; 0 = keep forever
+    RETENTION_TEMP_MAX_AGE_HOURS = float(os.getenv('RETENTION_TEMP_MAX_AGE_HOURS', 24))  # stale downloads, interrupted writes
+    RETENTION_INTERVAL_HOURS = float(os.getenv('RETENTION_INTERVAL_HOURS', 24))
+    MS365_TOKEN_CACHE_PATH = os.getenv('MS365_TOKEN_CACHE_PATH', os.path.join(STATE_PATH, 'msal_token_cache.json'))
+    LEDGER_PATH = os.getenv('LEDGER_PATH', os.path.join(STATE_PATH, 'ledger.db'))  # processed messages/attachments
+    MIME_SPOOL_MAX_SIZE = int(os.getenv('MIME_SPOOL_MAX_SIZE', 1024 * 1024))  # attachment bytes kept in memory before spilling to disk
+    IMAP_FETCH_BUFFER_SIZE = int(os.getenv('IMAP_FETCH_BUFFER_SIZE', 8 * 1024 * 1024))  # part bytes requested per IMAP FETCH
+    
+    # Poll scheduling: shorten while draining a backlog, back off exponentially when idle
+    POLL_INTERVAL = int(os.getenv('POLL_INTERVAL', 300))
+    POLL_MIN_INTERVAL = int(os.getenv('POLL_MIN_INTERVAL', 15))
+    POLL_MAX_INTERVAL = int(os.getenv('POLL_MAX_INTERVAL', 1800))
+    POLL_BACKOFF = float(os.getenv('POLL_BACKOFF', 2.0))
+    POLL_JITTER = float(os.getenv('POLL_JITTER', 0.1))  # +/- fraction of the interval
+    POLL_ADAPTIVE = os.getenv('POLL_ADAPTIVE', 'true').lower() == 'true'
     
+    # Attachment admission: only plausible invoice documents reach OCR
+    ATTACHMENT_MIN_BYTES = int(os.getenv('ATTACHMENT_MIN_BYTES', 4096))
+    ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', 25 * 1024 * 1024))
+    ATTACHMENT_MIN_IMAGE_SIDE = int(os.getenv('ATTACHMENT_MIN_IMAGE_SIDE', 300))  # pixels; smaller images are logos/icons
+    ATTACHMENT_MAX_PDF_PAGES = int(os.getenv('ATTACHMENT_MAX_PDF_PAGES', 30))
+    
+    # OCR Worker Pool Configuration
+    OCR_WORKERS = int(os.getenv('OCR_WORKERS', os.cpu_count() or 2))
+    OCR_MAX_PENDING = int(os.getenv('OCR_MAX_PENDING', 16))
+    OCR_SUBMIT_TIMEOUT = float(os.getenv('OCR_SUBMIT_TIMEOUT', 300))  # seconds a fetched email document waits for a slot
+
+    # Pipeline stage concurrency (MonitorService)
+    PIPELINE_FETCH_WORKERS = int(os.getenv('PIPELINE_FETCH_WORKERS', 4))
+    PIPELINE_OCR_WORKERS = int(os.getenv('PIPELINE_OCR_WORKERS', os.cpu_count() or 2))
+    PIPELINE_ANALYZE_WORKERS = int(os.getenv('PIPELINE_ANALYZE_WORKERS', 1))
+    PIPELINE_XERO_WORKERS = int(os.getenv('PIPELINE_XERO_WORKERS', 2))
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 8))
+
+    # Database Configuration
+    DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///./xero_automation.db')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))  # persistent connections per process
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))  # extra connections under burst load
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds; stay under server idle timeouts
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'  # drop dead connections on checkout
+    DB_SQLITE_BUSY_TIMEOUT = int(os.getenv('DB_SQLITE_BUSY_TIMEOUT', 30))  # seconds to wait for the write lock
+
+    # Job Queue Configuration
+    JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', 600))  # seconds a claimed job stays leased
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_BACKOFF = int(os.getenv('JOB_RETRY_BACKOFF', 30))  # base delay, doubled per attempt
+    JOB_RETRY_BACKOFF_MAX = int(os.getenv('JOB_RETRY_BACKOFF_MAX', 3600))
+
     # Logging Configuration
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text, or json for one JSON object per line
+    LOG_DIR = os.getenv('LOG_DIR', 'logs')
     
     @staticmethod
     def validate():
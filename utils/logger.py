@@ -1,54 +1,238 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import multiprocessing
 import os
-from datetime import datetime
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from utils.config import config
 
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted in the worker process that logged it
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class _DeferredQueueHandler(QueueHandler):
+    """Enqueue records without formatting them.
+
+    The stock QueueHandler formats the message (and any traceback) in the
+    calling thread; here only the message arguments are merged, and the
+    listener thread does the formatting. In a child process the record
+    crosses a pipe to the parent, so a traceback is rendered to text first.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.remote = False
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if self.remote and record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # multiprocessing.SimpleQueue has no put_nowait; its put writes straight to the pipe
+        self.queue.put(record)
+
+class _ProcessQueueListener(QueueListener):
+    """Listener for records sent by child processes over a multiprocessing.SimpleQueue"""
+
+    def dequeue(self, block):
+        return self.queue.get()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+class _PerNameFileHandler(logging.Handler):
+    """Write each logger's records to its own rotating ``<name>.log``"""
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.handlers = {}
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        for handler in self.handlers.values():
+            handler.setFormatter(fmt)
+
+    def emit(self, record: logging.LogRecord):
+        handler = self.handlers.get(record.name)
+        if handler is None:
+            handler = RotatingFileHandler(
+                os.path.join(self.directory, f'{record.name}.log'),
+                maxBytes=10485760,  # 10MB
+                backupCount=5
+            )
+            handler.setFormatter(self.formatter)
+            self.handlers[record.name] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+class _LogState:
+    """The log queues, listeners and output handlers.
+
+    Only the process that first configured logging runs listeners and owns
+    the log files. Child processes (job workers, OCR pool processes) send
+    their records to it over ``process_queue``, so a single process ever
+    writes and rotates each file. Forked children switch over on their
+    own; spawned ones must be handed the queue (see ``forward_logging``).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = None
+        self.process_queue = None
+        self.listeners = []
+        self.queue_handler = None
+        self.pid = None
+
+_state = _LogState()
+
+def _build_handlers():
+    if config.LOG_FORMAT.lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    os.makedirs(config.LOG_DIR, exist_ok=True)
+    file_handler = _PerNameFileHandler(config.LOG_DIR)
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    return file_handler, console_handler
+
+def configure_logging() -> QueueHandler:
+    """Start the log listeners once and return the shared queue handler.
+
+    File and console output happen on the listener threads, so logging
+    calls only enqueue a record.
+    """
+    with _state.lock:
+        if _state.pid == os.getpid() or (_state.queue_handler is not None and _state.queue_handler.remote):
+            return _state.queue_handler
+
+        _state.queue = queue.SimpleQueue()
+        _state.process_queue = multiprocessing.SimpleQueue()
+        if _state.queue_handler is None:
+            _state.queue_handler = _DeferredQueueHandler(_state.queue)
+        else:
+            _state.queue_handler.queue = _state.queue
+
+        handlers = _build_handlers()
+        _state.listeners = [
+            QueueListener(_state.queue, *handlers, respect_handler_level=True),
+            _ProcessQueueListener(_state.process_queue, *handlers, respect_handler_level=True)
+        ]
+        for listener in _state.listeners:
+            listener.start()
+        _state.pid = os.getpid()
+        return _state.queue_handler
+
+def shutdown_logging():
+    """Flush queued records and stop the listeners"""
+    with _state.lock:
+        if _state.pid != os.getpid():
+            return
+        for listener in _state.listeners:
+            listener.stop()
+        # Both listeners share the same output handlers
+        for handler in _state.listeners[0].handlers:
+            handler.close()
+        _state.listeners = []
+        _state.pid = None
+
+atexit.register(shutdown_logging)
+
+def log_queue():
+    """Queue that child processes send their records to, for ``forward_logging``"""
+    configure_logging()
+    return _state.process_queue
+
+def _forward(process_queue):
+    _state.listeners = []
+    _state.pid = None
+    _state.process_queue = process_queue
+    if _state.queue_handler is None:
+        _state.queue_handler = _DeferredQueueHandler(process_queue)
+    _state.queue_handler.queue = process_queue
+    _state.queue_handler.remote = True
+
+def forward_logging(process_queue):
+    """Send this process's records to the parent's listener instead of writing files.
+
+    Call from a child process's entry point or pool initializer with the
+    parent's ``log_queue()``. Forked children are switched over at fork;
+    spawned ones have already configured their own listeners on import.
+    """
+    with _state.lock:
+        if _state.pid == os.getpid():
+            for listener in _state.listeners:
+                listener.stop()
+            for handler in _state.listeners[0].handlers:
+                handler.close()
+        _forward(process_queue)
+
+def _forward_after_fork():
+    # The parent's listener threads do not exist in the child; send records
+    # to the parent instead of opening the log files a second time
+    _state.lock = threading.Lock()
+    if _state.process_queue is not None:
+        _forward(_state.process_queue)
+    else:
+        _state.listeners = []
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forward_after_fork)
+
 class Logger:
     def __init__(self, name: str):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(getattr(logging, config.LOG_LEVEL.upper()))
-        
-        # Create logs directory if it doesn't exist
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
-            
-        # Create formatters and handlers
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        
-        # File handler
-        file_handler = RotatingFileHandler(
-            f'logs/{name}.log',
-            maxBytes=10485760,  # 10MB
-            backupCount=5
-        )
-        file_handler.setFormatter(formatter)
-        
-        # Console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        
-        # Add handlers to logger
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
-    
+
+        # Every Logger shares the process's single queue handler
+        queue_handler = configure_logging()
+        if queue_handler not in self.logger.handlers:
+            self.logger.addHandler(queue_handler)
+
     def info(self, message: str):
         """Log info message"""
         self.logger.info(message)
-    
+
     def error(self, message: str, exc_info=True):
         """Log error message"""
         self.logger.error(message, exc_info=exc_info)
-    
+
     def warning(self, message: str):
         """Log warning message"""
         self.logger.warning(message)
-    
+
     def debug(self, message: str):
         """Log debug message"""
         self.logger.debug(message)
 
 # Create main application logger
-app_logger = Logger('xero_automation')
\ No newline at end of file
+app_logger = Logger('xero_automation')
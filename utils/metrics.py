@@ -0,0 +1,219 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from utils.logger import app_logger
+
+PREFIX = 'xero_automation'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def _drain(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def _merge(self, values: Dict[LabelKey, float]):
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+class Histogram:
+    """Bucketed distribution of observed values (e.g. durations in seconds)"""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(_label_key(labels))
+        return entry[2] if entry else 0
+
+    def _drain(self) -> Dict[LabelKey, list]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def _merge(self, values: Dict[LabelKey, list]):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                entry = self._values.get(key)
+                if entry is None:
+                    entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                yield f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(key)} {total}"
+            yield f"{self.name}_count{_format_labels(key)} {count}"
+
+class MetricsRegistry:
+    """Process-wide collection of counters and histograms.
+
+    Worker processes cannot share memory with the web process, so they
+    ``drain()`` what they recorded and hand it back with their result for
+    the parent to ``merge()``.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(f"{PREFIX}_{name}", documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{PREFIX}_{name}", documentation, buckets))
+
+    def drain(self) -> Dict[str, Dict[LabelKey, Any]]:
+        """Take (and reset) everything recorded so far, in a picklable form"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: values for metric in metrics if (values := metric._drain())}
+
+    def merge(self, snapshot: Optional[Dict[str, Dict[LabelKey, Any]]]):
+        """Add a snapshot drained from another process"""
+        for name, values in (snapshot or {}).items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric._merge(values)
+
+    def reset_after_fork(self):
+        """Start a forked child with empty metrics.
+
+        A child inherits the parent's counts; without this, an OCR worker's
+        first drain() would hand them back to be merged a second time. Locks
+        are replaced rather than taken, as a parent thread may have held one
+        at the fork.
+        """
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+            metric._values = {}
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = [line for metric in metrics for line in metric.render()]
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+if hasattr(os, 'register_at_fork'):
+    # Covers OCR pool workers (including a pool rebuilt after BrokenProcessPool)
+    os.register_at_fork(after_in_child=metrics.reset_after_fork)
+
+span_seconds = metrics.histogram('span_seconds', 'Duration of instrumented pipeline spans')
+span_errors = metrics.counter('span_errors_total', 'Spans that ended with an exception')
+documents_total = metrics.counter('documents_total', 'Documents processed, by source and outcome')
+pages_total = metrics.counter('pages_total', 'PDF pages rasterized for OCR')
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block and record it under ``span_seconds{span=name}``"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        span_errors.inc(span=name, **labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        span_seconds.observe(elapsed, span=name, **labels)
+        app_logger.debug(f"span {name} {labels or ''} took {elapsed:.3f}s")
+
+def timed(name: str, **labels):
+    """Decorator form of ``span``"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def create_metrics_router(registry: MetricsRegistry = metrics) -> APIRouter:
+    """FastAPI route exposing the registry for Prometheus to scrape"""
+    router = APIRouter()
+
+    @router.get("/metrics")
+    async def prometheus_metrics():
+        return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+    return router
@@ -0,0 +1,224 @@
+import json
+import os
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from utils.config import config
+from utils.logger import app_logger
+from utils.storage_index import ArchivedEntry
+
+ARCHIVE_DIR = 'archive'
+
+# Scratch directory shared by the mail clients for downloaded attachments
+TEMP_DIR = os.path.join(tempfile.gettempdir(), 'xero_automation')
+
+def _member_name(relative_path: str) -> str:
+    return relative_path.replace(os.sep, '/')
+
+def scan_bundle(base_path: str, bundle: str) -> List[ArchivedEntry]:
+    """Index entries for every document and result stored in an archive bundle.
+
+    Members keep their hot-tree paths (metadata/YYYY/MM/DD/<id>.json, blobs/...),
+    so a bundle describes itself and the index can be rebuilt from it.
+    """
+    archived = []
+    with tarfile.open(os.path.join(base_path, bundle), 'r:') as tar:
+        members = {member.name: member for member in tar.getmembers()}
+        for name, member in members.items():
+            kind, _, rest = name.partition('/')
+            date, _, filename = rest.rpartition('/')
+            if kind not in ('metadata', 'processed') or not filename.endswith('.json'):
+                continue
+            document_id = filename[:-len('.json')]
+
+            if kind == 'processed':
+                archived.append(ArchivedEntry(
+                    document_id, 'processed', bundle, date, member.offset_data, member.size, None, None
+                ))
+                continue
+
+            sha256 = json.load(tar.extractfile(member)).get('_blob')
+            if sha256:
+                data_name = f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+            else:
+                data_name = f'documents/{date}/{document_id}.bin'
+            data = members.get(data_name)
+            if data is None:
+                continue
+            archived.append(ArchivedEntry(
+                document_id, 'document', bundle, date,
+                data.offset_data, data.size, member.offset_data, member.size
+            ))
+    return archived
+
+class RetentionManager:
+    """Keeps the hot storage tree small.
+
+    Entries older than ``RETENTION_ARCHIVE_AFTER_DAYS`` are packed into one
+    tar bundle per month under ``archive/``. The index records each
+    member's byte range, so a single archived document is still read with
+    one seek. Bundles older than ``RETENTION_DELETE_AFTER_DAYS`` are
+    deleted, and stale temp files are purged.
+    """
+
+    def __init__(self, storage, archive_after_days: Optional[int] = None,
+                 delete_after_days: Optional[int] = None, temp_max_age_hours: Optional[float] = None):
+        self.storage = storage
+        self.archive_after_days = (
+            config.RETENTION_ARCHIVE_AFTER_DAYS if archive_after_days is None else archive_after_days
+        )
+        self.delete_after_days = (
+            config.RETENTION_DELETE_AFTER_DAYS if delete_after_days is None else delete_after_days
+        )
+        self.temp_max_age = 3600 * (
+            config.RETENTION_TEMP_MAX_AGE_HOURS if temp_max_age_hours is None else temp_max_age_hours
+        )
+        self.last_run = 0.0
+
+    def _abspath(self, relative_path: str) -> str:
+        return os.path.join(self.storage.base_path, relative_path)
+
+    def run_if_due(self) -> Optional[Dict[str, int]]:
+        """Run a retention pass if RETENTION_INTERVAL_HOURS have passed since the last one"""
+        if time.time() - self.last_run < config.RETENTION_INTERVAL_HOURS * 3600:
+            return None
+        try:
+            return self.run()
+        except Exception as e:
+            app_logger.error(f"Retention pass failed: {str(e)}")
+            return None
+        finally:
+            self.last_run = time.time()
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Archive old partitions, delete expired bundles and purge temp files"""
+        now = now or datetime.now()
+        stats = {'archived': 0, 'bundles_deleted': 0, 'temp_files_purged': 0}
+
+        if self.archive_after_days:
+            cutoff = (now - timedelta(days=self.archive_after_days)).strftime('%Y/%m/%d')
+            for month in self.storage.index.months_before(cutoff):
+                stats['archived'] += self.archive_month(month, cutoff)
+
+        if self.delete_after_days:
+            cutoff = (now - timedelta(days=self.delete_after_days)).strftime('%Y/%m/%d')
+            stats['bundles_deleted'] = self.expire_bundles(cutoff)
+
+        stats['temp_files_purged'] = self.purge_temp_files(now.timestamp())
+
+        app_logger.info(
+            f"Retention: archived {stats['archived']} entries, deleted {stats['bundles_deleted']} bundles, "
+            f"purged {stats['temp_files_purged']} temp files"
+        )
+        return stats
+
+    def _bundle_name(self, month: str) -> str:
+        # A month archived again (late arrivals) gets a numbered sibling bundle
+        base = os.path.join(ARCHIVE_DIR, month.replace('/', '-'))
+        bundle, n = f'{base}.tar', 0
+        while os.path.exists(self._abspath(bundle)):
+            n += 1
+            bundle = f'{base}.{n}.tar'
+        return bundle
+
+    def archive_month(self, month: str, before: str) -> int:
+        """Move one YYYY/MM partition's entries dated before ``before`` into a bundle"""
+        entries = self.storage.index.month_entries(month, before)
+        if not entries:
+            return 0
+
+        bundle = self._bundle_name(month)
+        path = self._abspath(bundle)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = f'{path}.tmp'
+
+        archived_files = []
+        with tarfile.open(temp_file, 'w:') as tar:
+            added = set()
+            for entry in entries:
+                files = [entry.path] if entry.kind == 'processed' else [entry.path, entry.meta_path]
+                if not all(files) or not all(os.path.exists(self._abspath(f)) for f in files):
+                    app_logger.warning(f"Not archiving {entry.kind} {entry.document_id}: files missing")
+                    continue
+                for relative_path in files:
+                    name = _member_name(relative_path)
+                    if name not in added:
+                        tar.add(self._abspath(relative_path), arcname=name, recursive=False)
+                        added.add(name)
+                archived_files.append(entry)
+
+        if not archived_files:
+            os.remove(temp_file)
+            return 0
+
+        self.storage.writer.replace(temp_file, path)
+
+        # The bundle is durable before the index stops pointing at the hot files
+        orphans = self.storage.index.archive(scan_bundle(self.storage.base_path, bundle))
+        for entry in archived_files:
+            if entry.kind == 'processed':
+                self._remove(entry.path)
+            else:
+                self._remove(entry.meta_path)
+                if not entry.path.startswith('blobs'):
+                    self._remove(entry.path)  # written before content addressing
+        for orphan in orphans:
+            self._remove(orphan)
+
+        app_logger.info(f"Archived {len(archived_files)} entries from {month} into {bundle}")
+        return len(archived_files)
+
+    def expire_bundles(self, before: str) -> int:
+        """Delete bundles whose newest entry is dated before ``before``"""
+        deleted = 0
+        for bundle, newest in self.storage.index.bundles().items():
+            if newest >= before:
+                continue
+            self.storage.index.drop_bundle(bundle)
+            try:
+                os.remove(self._abspath(bundle))
+            except OSError:
+                pass
+            deleted += 1
+        return deleted
+
+    def purge_temp_files(self, now: Optional[float] = None) -> int:
+        """Remove downloads and interrupted writes older than the temp max age"""
+        cutoff = (now or time.time()) - self.temp_max_age
+        purged = 0
+
+        candidates = []
+        for root, dirs, files in os.walk(TEMP_DIR):
+            candidates.extend(os.path.join(root, f) for f in files)
+        # Interrupted atomic writes in the storage tree
+        for root, dirs, files in os.walk(self.storage.base_path):
+            candidates.extend(os.path.join(root, f) for f in files if f.endswith('.tmp'))
+
+        for path in candidates:
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    purged += 1
+            except OSError:
+                continue
+        return purged
+
+    def _remove(self, relative_path: str):
+        """Remove a hot-tree file and any directories it leaves empty"""
+        path = self._abspath(relative_path)
+        try:
+            os.remove(path)
+        except OSError:
+            return
+
+        # Stop below the top-level directory (metadata/, blobs/, ...)
+        top = self._abspath(relative_path.split(os.sep)[0])
+        directory = os.path.dirname(path)
+        while directory != top and directory.startswith(top):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
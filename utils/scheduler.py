@@ -0,0 +1,64 @@
+import random
+import threading
+from typing import Dict, Any, Optional
+from utils.config import config
+
+class AdaptivePollScheduler:
+    """Chooses the delay before the next mailbox poll.
+
+    While polls keep finding work the interval drops to ``min_interval`` so
+    a backlog drains quickly; each idle poll multiplies it by ``backoff``
+    up to ``max_interval``. A random jitter of +/- ``jitter`` (a fraction)
+    keeps several instances from polling in lockstep.
+    """
+
+    def __init__(self, base_interval: Optional[float] = None, min_interval: Optional[float] = None,
+                 max_interval: Optional[float] = None, backoff: Optional[float] = None,
+                 jitter: Optional[float] = None, adaptive: Optional[bool] = None):
+        self.base_interval = base_interval or config.POLL_INTERVAL
+        self.min_interval = min(min_interval or config.POLL_MIN_INTERVAL, self.base_interval)
+        self.max_interval = max(max_interval or config.POLL_MAX_INTERVAL, self.base_interval)
+        self.backoff = backoff or config.POLL_BACKOFF
+        self.jitter = config.POLL_JITTER if jitter is None else jitter
+        self.adaptive = config.POLL_ADAPTIVE if adaptive is None else adaptive
+
+        self._lock = threading.Lock()
+        self.current_interval = self.base_interval
+        self.idle_polls = 0
+        self.last_found = 0
+
+    def record(self, found: int) -> float:
+        """Update the interval from the number of items the last poll found"""
+        with self._lock:
+            self.last_found = found
+            if not self.adaptive:
+                self.current_interval = self.base_interval
+            elif found:
+                self.idle_polls = 0
+                self.current_interval = self.min_interval
+            else:
+                self.idle_polls += 1
+                self.current_interval = min(
+                    max(self.current_interval * self.backoff, self.min_interval),
+                    self.max_interval
+                )
+            return self.current_interval
+
+    def next_delay(self) -> float:
+        """Current interval with jitter applied"""
+        with self._lock:
+            interval = self.current_interval
+        if self.jitter:
+            interval *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(interval, 0)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'adaptive': self.adaptive,
+                'current_interval': round(self.current_interval, 1),
+                'min_interval': self.min_interval,
+                'max_interval': self.max_interval,
+                'idle_polls': self.idle_polls,
+                'last_found': self.last_found
+            }
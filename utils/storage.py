@@ -1,110 +1,368 @@
+import hashlib
+import mmap
 import os
+import threading
+import time
 from datetime import datetime
 import json
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+from utils.atomic_writer import AtomicWriter
+from utils.compression import Compressor
 from utils.config import config
+from utils.metrics import timed
+from utils.retention import ARCHIVE_DIR, scan_bundle
+from utils.storage_index import IndexEntry, StorageIndex
+
+# Reserved metadata key holding the sha256 of the document's blob
+_BLOB_KEY = '_blob'
 
 class Storage:
-    def __init__(self):
-        self.base_path = config.STORAGE_PATH
+    def __init__(self, base_path: Optional[str] = None, index_path: Optional[str] = None):
+        self.base_path = base_path or config.STORAGE_PATH
         self._ensure_storage_exists()
-    
+        self.compressor = Compressor(os.path.join(self.base_path, 'dicts'))
+        self.writer = AtomicWriter()
+        self._local = threading.local()  # this thread's batch() index entries
+
+        index_path = index_path or (
+            config.STORAGE_INDEX_PATH if base_path is None else os.path.join(self.base_path, 'index.db')
+        )
+        new_index = not os.path.exists(index_path)
+        self.index = StorageIndex(index_path)
+        if new_index:
+            # One-off scan so stores written before the index existed stay readable
+            self.rebuild_index()
+
     def _ensure_storage_exists(self):
         """Ensure storage directories exist"""
         directories = [
             self.base_path,
             os.path.join(self.base_path, 'documents'),
+            os.path.join(self.base_path, 'blobs'),
             os.path.join(self.base_path, 'metadata'),
-            os.path.join(self.base_path, 'processed')
+            os.path.join(self.base_path, 'processed'),
+            os.path.join(self.base_path, ARCHIVE_DIR)
         ]
-        
+
         for directory in directories:
             if not os.path.exists(directory):
                 os.makedirs(directory)
-    
+
+    def _abspath(self, relative_path: str) -> str:
+        return os.path.join(self.base_path, relative_path)
+
+    def rebuild_index(self) -> int:
+        """Index every document and processed result on disk; returns the entry count"""
+        count = 0
+        archive_dir = os.path.join(self.base_path, ARCHIVE_DIR)
+        for filename in sorted(os.listdir(archive_dir)):
+            if filename.endswith('.tar'):
+                archived = scan_bundle(self.base_path, os.path.join(ARCHIVE_DIR, filename))
+                self.index.archive(archived)
+                count += len(archived)
+
+        legacy = []
+        meta_dir = os.path.join(self.base_path, 'metadata')
+        for root, dirs, files in os.walk(meta_dir):
+            date_prefix = os.path.relpath(root, meta_dir).replace(os.sep, '/')
+            for filename in files:
+                if not filename.endswith('.json'):
+                    continue
+                document_id = filename[:-len('.json')]
+                meta_file = os.path.join(root, filename)
+                with open(meta_file, 'r') as f:
+                    sha256 = json.load(f).get(_BLOB_KEY)
+
+                if sha256:
+                    path = self._blob_path(sha256)
+                else:
+                    # Written before content addressing
+                    path = os.path.join('documents', date_prefix, f'{document_id}.bin')
+                if not os.path.exists(self._abspath(path)):
+                    continue
+
+                entry = IndexEntry(
+                    document_id=document_id,
+                    kind='document',
+                    path=path,
+                    meta_path=os.path.relpath(meta_file, self.base_path),
+                    date=date_prefix,
+                    size=os.path.getsize(self._abspath(path)),
+                    sha256=sha256,
+                    created_at=os.path.getmtime(meta_file)
+                )
+                if sha256:
+                    self.index.put_blob_entry(entry)
+                else:
+                    legacy.append(entry)
+                count += 1
+
+        proc_dir = os.path.join(self.base_path, 'processed')
+        for root, dirs, files in os.walk(proc_dir):
+            date_prefix = os.path.relpath(root, proc_dir).replace(os.sep, '/')
+            for filename in files:
+                if not filename.endswith('.json'):
+                    continue
+                path = os.path.join(root, filename)
+                legacy.append(IndexEntry(
+                    document_id=filename[:-len('.json')],
+                    kind='processed',
+                    path=os.path.relpath(path, self.base_path),
+                    meta_path=None,
+                    date=date_prefix,
+                    size=os.path.getsize(path),
+                    sha256=None,
+                    created_at=os.path.getmtime(path)
+                ))
+
+        self.index.put_many(legacy)
+        return count + sum(1 for entry in legacy if entry.kind == 'processed')
+
+    def _blob_path(self, sha256: str) -> str:
+        """Relative path of a blob: blobs/ab/cd/abcd..."""
+        return os.path.join('blobs', sha256[:2], sha256[2:4], sha256)
+
+    @contextmanager
+    def batch(self):
+        """Commit every ``save_document`` this thread makes inside the block together.
+
+        The files share one round of directory syncs, and the documents
+        become durable and indexed only when the block exits; if that
+        commit fails, none of them are stored.
+        """
+        if getattr(self._local, 'entries', None) is not None:
+            yield
+            return
+
+        entries = self._local.entries = []
+        self._local.blobs = set()
+        try:
+            with self.writer.deferred():
+                yield
+        finally:
+            self._local.entries = None
+
+        for entry in entries:
+            self._remove(self.index.put_blob_entry(entry))
+
+    @timed('save')
     def save_document(self, document_id: str, content: bytes, metadata: Dict[str, Any]) -> str:
-        """Save document content and metadata"""
-        # Generate paths
+        """Save document content and metadata.
+
+        Content is stored once per distinct sha256; saving bytes that are
+        already stored only writes the metadata and bumps a reference count.
+        Both files are written atomically and are durable when this returns
+        (inside ``batch()``, when the block exits).
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(sha256)
+        batch = getattr(self._local, 'entries', None)
+        files = []
+        if batch is not None and sha256 in self._local.blobs:
+            pass  # already written earlier in this batch
+        elif self.index.get_blob(sha256) is None or not os.path.exists(self._abspath(blob_path)):
+            files.append((self._abspath(blob_path), self.compressor.encode(content)))
+            if batch is not None:
+                self._local.blobs.add(sha256)
+
         date_prefix = datetime.now().strftime('%Y/%m/%d')
-        doc_path = os.path.join(self.base_path, 'documents', date_prefix)
-        meta_path = os.path.join(self.base_path, 'metadata', date_prefix)
-        
-        # Create directories if they don't exist
-        os.makedirs(doc_path, exist_ok=True)
-        os.makedirs(meta_path, exist_ok=True)
-        
-        # Save document content
-        doc_file = os.path.join(doc_path, f'{document_id}.bin')
-        with open(doc_file, 'wb') as f:
-            f.write(content)
-        
-        # Save metadata
-        meta_file = os.path.join(meta_path, f'{document_id}.json')
-        with open(meta_file, 'w') as f:
-            json.dump(metadata, f)
-        
-        return doc_file
-    
+        meta_file = os.path.join(self.base_path, 'metadata', date_prefix, f'{document_id}.json')
+        # The blob reference lets rebuild_index() recover the index from disk
+        files.append((meta_file, json.dumps({**metadata, _BLOB_KEY: sha256}).encode()))
+
+        # Blob before metadata, so metadata never points at a missing blob; metadata
+        # always renames in the second stage, after a blob written earlier in the batch
+        self.writer.write_many(files, first_stage=2 - len(files))
+
+        entry = IndexEntry(
+            document_id=document_id,
+            kind='document',
+            path=blob_path,
+            meta_path=os.path.relpath(meta_file, self.base_path),
+            date=date_prefix,
+            size=len(content),
+            sha256=sha256,
+            created_at=time.time()
+        )
+        if batch is not None:
+            batch.append(entry)
+        else:
+            self._remove(self.index.put_blob_entry(entry))
+
+        return self._abspath(blob_path)
+
+    def _read_member(self, bundle: str, offset: int, size: int) -> bytes:
+        """One file's bytes from an archive bundle"""
+        with open(self._abspath(bundle), 'rb') as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def _remove(self, relative_path: Optional[str]):
+        if not relative_path:
+            return
+        try:
+            os.remove(self._abspath(relative_path))
+        except OSError:
+            pass
+
+    def delete_document(self, document_id: str):
+        """Delete a document's metadata, and its content once no other document shares it"""
+        entry = self.index.get(document_id, 'document')
+        if entry is None:
+            # Archived content stays in its bundle until the bundle expires
+            if self.index.remove_archived(document_id, 'document'):
+                return
+            raise FileNotFoundError(f"Document {document_id} not found")
+
+        orphan = self.index.remove_blob_entry(document_id, 'document')
+        self._remove(entry.meta_path)
+        if orphan:
+            self._remove(orphan)
+        elif not entry.path.startswith('blobs'):
+            self._remove(entry.path)  # written before content addressing
+
     def get_document(self, document_id: str, date: Optional[datetime] = None) -> Dict[str, Any]:
         """Retrieve document content and metadata"""
         if date:
             date_prefix = date.strftime('%Y/%m/%d')
+            meta_file = os.path.join(self.base_path, 'metadata', date_prefix, f'{document_id}.json')
+            doc_file = None
         else:
-            # Search in recent directories
-            base_dir = os.path.join(self.base_path, 'documents')
-            for root, dirs, files in os.walk(base_dir):
-                if f'{document_id}.bin' in files:
-                    date_prefix = os.path.relpath(root, base_dir)
-                    break
-            else:
-                raise FileNotFoundError(f"Document {document_id} not found")
-        
-        # Get document content
-        doc_file = os.path.join(self.base_path, 'documents', date_prefix, f'{document_id}.bin')
-        meta_file = os.path.join(self.base_path, 'metadata', date_prefix, f'{document_id}.json')
-        
-        if not os.path.exists(doc_file) or not os.path.exists(meta_file):
+            entry = self.index.get(document_id, 'document')
+            if entry is None:
+                return self._get_archived_document(document_id)
+            doc_file = self._abspath(entry.path)
+            meta_file = self._abspath(entry.meta_path)
+
+        if not os.path.exists(meta_file):
             raise FileNotFoundError(f"Document {document_id} not found")
-        
-        with open(doc_file, 'rb') as f:
-            content = f.read()
-            
+
         with open(meta_file, 'r') as f:
             metadata = json.load(f)
-            
+        sha256 = metadata.pop(_BLOB_KEY, None)
+
+        if doc_file is None:
+            doc_file = self._abspath(
+                self._blob_path(sha256) if sha256
+                else os.path.join('documents', date_prefix, f'{document_id}.bin')
+            )
+        if not os.path.exists(doc_file):
+            raise FileNotFoundError(f"Document {document_id} not found")
+
+        with open(doc_file, 'rb') as f:
+            content = self.compressor.decode(f.read())
+
         return {
             'content': content,
             'metadata': metadata
         }
-    
+
+    def _get_archived_document(self, document_id: str) -> Dict[str, Any]:
+        archived = self.index.get_archived(document_id, 'document')
+        if archived is None:
+            raise FileNotFoundError(f"Document {document_id} not found")
+
+        metadata = json.loads(self._read_member(archived.bundle, archived.meta_offset, archived.meta_size))
+        metadata.pop(_BLOB_KEY, None)
+        content = self._read_member(archived.bundle, archived.data_offset, archived.data_size)
+        return {
+            'content': self.compressor.decode(content),
+            'metadata': metadata
+        }
+
+    @contextmanager
+    def open_document(self, document_id: str) -> Iterator[memoryview]:
+        """Read-only view of a document's content, without copying it.
+
+        Raw blobs (PDFs, images) are memory-mapped; compressed ones are
+        decoded into memory. The view is only valid inside the ``with`` block.
+        """
+        entry = self.index.get(document_id, 'document')
+        if entry is not None:
+            doc_file, offset, size = self._abspath(entry.path), 0, None
+        else:
+            # Archived documents are a byte range of their bundle
+            archived = self.index.get_archived(document_id, 'document')
+            if archived is None:
+                raise FileNotFoundError(f"Document {document_id} not found")
+            doc_file, offset, size = self._abspath(archived.bundle), archived.data_offset, archived.data_size
+        if not os.path.exists(doc_file):
+            raise FileNotFoundError(f"Document {document_id} not found")
+
+        with open(doc_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                mapped = None  # empty files cannot be mapped
+            else:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped is None:
+            yield memoryview(b'')
+            return
+
+        view = memoryview(mapped)[offset:None if size is None else offset + size]
+        try:
+            if self.compressor.is_framed(view):
+                yield memoryview(self.compressor.decode(view))
+            else:
+                yield view
+        finally:
+            try:
+                view.release()
+                mapped.close()
+            except BufferError:
+                pass  # the caller kept a reference; unmapped once that is collected
+
     def save_processed_results(self, document_id: str, results: Dict[str, Any]):
         """Save processing results"""
         date_prefix = datetime.now().strftime('%Y/%m/%d')
-        proc_path = os.path.join(self.base_path, 'processed', date_prefix)
-        os.makedirs(proc_path, exist_ok=True)
-        
-        proc_file = os.path.join(proc_path, f'{document_id}.json')
-        with open(proc_file, 'w') as f:
-            json.dump(results, f)
-            
+        proc_file = os.path.join(self.base_path, 'processed', date_prefix, f'{document_id}.json')
+        data = json.dumps(results).encode()
+        self.writer.write(proc_file, self.compressor.encode(data, 'json'))
+
+        self.index.put(IndexEntry(
+            document_id=document_id,
+            kind='processed',
+            path=os.path.relpath(proc_file, self.base_path),
+            meta_path=None,
+            date=date_prefix,
+            size=len(data),
+            sha256=hashlib.sha256(data).hexdigest(),
+            created_at=time.time()
+        ))
+
     def get_processed_results(self, document_id: str, date: Optional[datetime] = None) -> Dict[str, Any]:
         """Retrieve processing results"""
         if date:
             date_prefix = date.strftime('%Y/%m/%d')
             proc_file = os.path.join(self.base_path, 'processed', date_prefix, f'{document_id}.json')
-            
-            if not os.path.exists(proc_file):
-                raise FileNotFoundError(f"Processed results for document {document_id} not found")
-                
-            with open(proc_file, 'r') as f:
-                return json.load(f)
         else:
-            # Search in recent directories
-            base_dir = os.path.join(self.base_path, 'processed')
-            for root, dirs, files in os.walk(base_dir):
-                if f'{document_id}.json' in files:
-                    proc_file = os.path.join(root, f'{document_id}.json')
-                    with open(proc_file, 'r') as f:
-                        return json.load(f)
-                        
-            raise FileNotFoundError(f"Processed results for document {document_id} not found")
\ No newline at end of file
+            entry = self.index.get(document_id, 'processed')
+            if entry is None:
+                archived = self.index.get_archived(document_id, 'processed')
+                if archived is None:
+                    raise FileNotFoundError(f"Processed results for document {document_id} not found")
+                data = self._read_member(archived.bundle, archived.data_offset, archived.data_size)
+                return json.loads(self.compressor.decode(data))
+            proc_file = self._abspath(entry.path)
+
+        if not proc_file or not os.path.exists(proc_file):
+            raise FileNotFoundError(f"Processed results for document {document_id} not found")
+
+        with open(proc_file, 'rb') as f:
+            return json.loads(self.compressor.decode(f.read()))
+
+    def train_json_dictionary(self, sample_count: int = 200) -> int:
+        """Train the compression dictionary for processed results on the newest ones.
+
+        Results saved afterwards use it; older ones keep the dictionary they
+        were written with. Returns the new dictionary id (0 if none).
+        """
+        entries = list(self.index.entries('processed'))[-sample_count:]
+        samples = []
+        for entry in entries:
+            try:
+                with open(self._abspath(entry.path), 'rb') as f:
+                    samples.append(self.compressor.decode(f.read()))
+            except OSError:
+                continue
+        return self.compressor.train(samples)
@@ -0,0 +1,276 @@
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+@dataclass
+class IndexEntry:
+    """Where a stored document (or its processed results) lives"""
+    document_id: str
+    kind: str  # document or processed
+    path: str  # relative to the storage root
+    meta_path: Optional[str]
+    date: str  # YYYY/MM/DD partition
+    size: int
+    sha256: Optional[str]
+    created_at: float
+
+@dataclass
+class ArchivedEntry:
+    """Where an archived document (or its processed results) sits inside a bundle"""
+    document_id: str
+    kind: str
+    bundle: str  # relative to the storage root
+    date: str
+    data_offset: int
+    data_size: int
+    meta_offset: Optional[int]
+    meta_size: Optional[int]
+
+_COLUMNS = 'document_id, kind, path, meta_path, date, size, sha256, created_at'
+_ARCHIVED_COLUMNS = 'document_id, kind, bundle, date, data_offset, data_size, meta_offset, meta_size'
+
+class StorageIndex:
+    """SQLite index from document id to its location in the storage tree.
+
+    Lookups are a primary-key read, so they cost the same however many
+    date directories the store has accumulated.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' document_id TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' path TEXT NOT NULL,'
+            ' meta_path TEXT,'
+            ' date TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' sha256 TEXT,'
+            ' created_at REAL NOT NULL,'
+            ' PRIMARY KEY (document_id, kind)'
+            ') WITHOUT ROWID'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_date ON entries (kind, date)')
+        # Content-addressed blobs shared by every document with the same bytes
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            ' sha256 TEXT PRIMARY KEY,'
+            ' path TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' refcount INTEGER NOT NULL,'
+            ' created_at REAL NOT NULL'
+            ') WITHOUT ROWID'
+        )
+        # Documents moved into archive bundles, with byte ranges for random access
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS archived ('
+            ' document_id TEXT NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' bundle TEXT NOT NULL,'
+            ' date TEXT NOT NULL,'
+            ' data_offset INTEGER NOT NULL,'
+            ' data_size INTEGER NOT NULL,'
+            ' meta_offset INTEGER,'
+            ' meta_size INTEGER,'
+            ' PRIMARY KEY (document_id, kind)'
+            ') WITHOUT ROWID'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS archived_bundle ON archived (bundle)')
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def put(self, entry: IndexEntry):
+        self.put_many([entry])
+
+    def put_many(self, entries: Iterable[IndexEntry]):
+        rows = [
+            (e.document_id, e.kind, e.path, e.meta_path, e.date, e.size, e.sha256, e.created_at or time.time())
+            for e in entries
+        ]
+        with self._lock:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            self.conn.execute('COMMIT')
+
+    def get_blob(self, sha256: str) -> Optional[Tuple[str, int, int]]:
+        """(path, size, refcount) of a stored blob, or None"""
+        with self._lock:
+            return self.conn.execute(
+                'SELECT path, size, refcount FROM blobs WHERE sha256 = ?', (sha256,)
+            ).fetchone()
+
+    def _release_blob(self, sha256: Optional[str]) -> Optional[str]:
+        """Drop one reference; returns the blob path once nothing refers to it"""
+        if not sha256:
+            return None
+        self.conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+        row = self.conn.execute(
+            'SELECT path FROM blobs WHERE sha256 = ? AND refcount <= 0', (sha256,)
+        ).fetchone()
+        if row:
+            self.conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+            return row[0]
+        return None
+
+    def put_blob_entry(self, entry: IndexEntry) -> Optional[str]:
+        """Index a document stored as a blob and take a reference on it.
+
+        Re-saving a document id releases the blob it pointed to before.
+        Returns the path of a blob left unreferenced, for the caller to delete.
+        """
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                previous = self.conn.execute(
+                    'SELECT sha256 FROM entries WHERE document_id = ? AND kind = ?',
+                    (entry.document_id, entry.kind)
+                ).fetchone()
+                self.conn.execute(
+                    'INSERT INTO blobs (sha256, path, size, refcount, created_at) VALUES (?, ?, ?, 1, ?)'
+                    ' ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1',
+                    (entry.sha256, entry.path, entry.size, time.time())
+                )
+                self.conn.execute(
+                    f'INSERT OR REPLACE INTO entries ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (entry.document_id, entry.kind, entry.path, entry.meta_path, entry.date,
+                     entry.size, entry.sha256, entry.created_at or time.time())
+                )
+                orphan = self._release_blob(previous[0]) if previous else None
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return orphan
+
+    def remove_blob_entry(self, document_id: str, kind: str = 'document') -> Optional[str]:
+        """Remove a document's entry; returns its blob path if that was the last reference"""
+        with self._lock:
+            self.conn.execute('BEGIN')
+            row = self.conn.execute(
+                'SELECT sha256 FROM entries WHERE document_id = ? AND kind = ?', (document_id, kind)
+            ).fetchone()
+            self.conn.execute('DELETE FROM entries WHERE document_id = ? AND kind = ?', (document_id, kind))
+            orphan = self._release_blob(row[0]) if row else None
+            self.conn.execute('COMMIT')
+        return orphan
+
+    def blob_stats(self) -> Dict[str, int]:
+        """Blob count, stored bytes and the bytes saved by deduplication"""
+        with self._lock:
+            blobs, stored, logical = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(size * refcount), 0) FROM blobs'
+            ).fetchone()
+        return {'blobs': blobs, 'stored_bytes': stored, 'deduplicated_bytes': logical - stored}
+
+    def get(self, document_id: str, kind: str = 'document') -> Optional[IndexEntry]:
+        with self._lock:
+            row = self.conn.execute(
+                f'SELECT {_COLUMNS} FROM entries WHERE document_id = ? AND kind = ?', (document_id, kind)
+            ).fetchone()
+        return IndexEntry(*row) if row else None
+
+    def delete(self, document_id: str, kind: str = 'document'):
+        with self._lock:
+            self.conn.execute('DELETE FROM entries WHERE document_id = ? AND kind = ?', (document_id, kind))
+
+    def entries(self, kind: str = 'document') -> Iterator[IndexEntry]:
+        with self._lock:
+            rows = self.conn.execute(
+                f'SELECT {_COLUMNS} FROM entries WHERE kind = ? ORDER BY date', (kind,)
+            ).fetchall()
+        return (IndexEntry(*row) for row in rows)
+
+    def count(self, kind: Optional[str] = None) -> int:
+        with self._lock:
+            if kind:
+                return self.conn.execute('SELECT COUNT(*) FROM entries WHERE kind = ?', (kind,)).fetchone()[0]
+            return self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def months_before(self, before: str) -> List[str]:
+        """YYYY/MM partitions holding entries dated before ``before`` (YYYY/MM/DD)"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT DISTINCT substr(date, 1, 7) FROM entries WHERE date < ? ORDER BY 1', (before,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def month_entries(self, month: str, before: str) -> List[IndexEntry]:
+        """Entries of both kinds in one YYYY/MM partition, dated before ``before``"""
+        with self._lock:
+            rows = self.conn.execute(
+                f'SELECT {_COLUMNS} FROM entries WHERE date BETWEEN ? AND ? AND date < ?',
+                (f'{month}/00', f'{month}/99', before)
+            ).fetchall()
+        return [IndexEntry(*row) for row in rows]
+
+    def archive(self, archived: Iterable[ArchivedEntry]) -> List[str]:
+        """Point entries at their archive bundle instead of the hot tree.
+
+        Returns blob paths no longer referenced by any hot document.
+        """
+        orphans = []
+        with self._lock:
+            self.conn.execute('BEGIN')
+            try:
+                for entry in archived:
+                    row = self.conn.execute(
+                        'SELECT sha256 FROM entries WHERE document_id = ? AND kind = ?',
+                        (entry.document_id, entry.kind)
+                    ).fetchone()
+                    self.conn.execute(
+                        'DELETE FROM entries WHERE document_id = ? AND kind = ?', (entry.document_id, entry.kind)
+                    )
+                    if row and entry.kind == 'document':
+                        orphan = self._release_blob(row[0])
+                        if orphan:
+                            orphans.append(orphan)
+                    self.conn.execute(
+                        f'INSERT OR REPLACE INTO archived ({_ARCHIVED_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (entry.document_id, entry.kind, entry.bundle, entry.date, entry.data_offset,
+                         entry.data_size, entry.meta_offset, entry.meta_size)
+                    )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return orphans
+
+    def get_archived(self, document_id: str, kind: str = 'document') -> Optional[ArchivedEntry]:
+        with self._lock:
+            row = self.conn.execute(
+                f'SELECT {_ARCHIVED_COLUMNS} FROM archived WHERE document_id = ? AND kind = ?', (document_id, kind)
+            ).fetchone()
+        return ArchivedEntry(*row) if row else None
+
+    def remove_archived(self, document_id: str, kind: str = 'document') -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                'DELETE FROM archived WHERE document_id = ? AND kind = ?', (document_id, kind)
+            )
+        return cursor.rowcount > 0
+
+    def bundles(self) -> Dict[str, str]:
+        """Each archive bundle and the newest date it holds"""
+        with self._lock:
+            rows = self.conn.execute('SELECT bundle, MAX(date) FROM archived GROUP BY bundle').fetchall()
+        return dict(rows)
+
+    def drop_bundle(self, bundle: str) -> int:
+        """Forget every entry stored in ``bundle``; returns how many there were"""
+        with self._lock:
+            cursor = self.conn.execute('DELETE FROM archived WHERE bundle = ?', (bundle,))
+        return cursor.rowcount
@@ -1,8 +1,12 @@
-from fastapi import FastAPI, Request, BackgroundTasks
+from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from services.monitor_service import MonitorService
+from services.graph_subscriptions import SubscriptionManager
+from services.notifications import ChangeNotifier, create_notification_router
+from utils.config import config
 from utils.logger import app_logger
+from utils.metrics import create_metrics_router
 from datetime import datetime
 import threading
 import time
@@ -17,18 +21,44 @@ service_status = {
     "last_check": None,
     "processed_count": 0,
     "last_error": None,
+    "next_check_in": None,
     "service_thread": None
 }
 
 monitor_service = MonitorService()
 
+# Push ingestion: Graph notifications wake the service loop immediately
+change_notifier = ChangeNotifier()
+subscriptions = SubscriptionManager(monitor_service.email_monitor.ms365)
+app.include_router(create_notification_router(subscriptions, change_notifier))
+app.include_router(create_metrics_router())
+
 def run_service():
     """Background service runner"""
     while service_status["running"]:
         try:
-            monitor_service.process_emails()
+            if subscriptions.enabled:
+                try:
+                    subscriptions.ensure()
+                except Exception as e:
+                    app_logger.error(f"Subscription error, falling back to polling: {e}")
+
+            # The delta query picks the notified messages up; the ids are only logged
+            notified = change_notifier.drain()
+            if notified:
+                app_logger.info(f"Polling after notifications for {len(notified)} messages")
+            found = monitor_service.process_emails()
             service_status["last_check"] = datetime.now()
-            time.sleep(300)  # 5 minutes between checks
+            service_status["processed_count"] += monitor_service.last_processed
+
+            # Poll faster while draining a backlog; while subscribed and idle,
+            # polling is only a slow reconciliation pass
+            monitor_service.scheduler.record(found)
+            interval = monitor_service.scheduler.next_delay()
+            if subscriptions.active and not found:
+                interval = max(interval, config.GRAPH_RECONCILE_INTERVAL)
+            service_status["next_check_in"] = round(interval, 1)
+            change_notifier.wait(interval)
         except Exception as e:
             service_status["last_error"] = str(e)
             app_logger.error(f"Service error: {e}")
@@ -63,6 +93,7 @@ async def stop_service():
     """Stop the monitoring service"""
     if service_status["running"]:
         service_status["running"] = False
+        change_notifier.notify()  # wake the loop so it can exit
         if service_status["service_thread"]:
             service_status["service_thread"].join(timeout=1)
         return {"status": "Service stopped"}
@@ -75,7 +106,14 @@ async def get_status():
         "running": service_status["running"],
         "last_check": service_status["last_check"].isoformat() if service_status["last_check"] else None,
         "processed_count": service_status["processed_count"],
-        "last_error": service_status["last_error"]
+        "last_error": service_status["last_error"],
+        "poll_interval": monitor_service.scheduler.get_status(),
+        "next_check_in": service_status["next_check_in"],
+        "pipeline": monitor_service.get_pipeline_metrics(),
+        "push": {
+            "subscribed": subscriptions.active,
+            "notifications_received": change_notifier.received
+        }
     }
 
 if __name__ == "__main__":